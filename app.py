@@ -1,8 +1,27 @@
-from flask import Flask, request, jsonify
+import os
+import sys
+import math
+import queue
+import signal
+import threading
+import time
 
+from flask import Flask, request, jsonify, url_for, Response, stream_with_context
+
+from library import config_helper as config
+from library.cache_helper import ArticleCache, SummaryIndex, LLMResponseCache, EntityCache
+from library.http_helper import format_sse_event
+from library.metrics_helper import MetricsHelper, METRICS_CONTENT_TYPE
+from library.trace_helper import TraceHelper, TRACE_ID_HEADER, activate
+from library.llm_pool_helper import LLMBackendPool
+from library.job_helper import JobHelper, JOB_STATUS_DONE, JOB_STATUS_FAILED
+from library.ledger_helper import SQLiteWorkLedger
+from library.scheduler_helper import RateLimiter, PRIORITIES, PRIORITY_INTERACTIVE, PRIORITY_BULK, priority
 from library.other_helper import OtherHelper
 from library.wiki_helper import WikiHelper
-from library.llm_helper import LLMHelper
+from library.llm_helper import LLMHelper, SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_SINGLE_PASS
+from library.pipeline_helper import (SummaryPipeline, format_batch_result, get_batch_entry_qid, parse_batch_json,
+                                     parse_batch_line)
 from library.secrets_helper import load_secrets
 
 import logging
@@ -14,14 +33,121 @@ app = Flask(__name__)
 # Load secrets
 secrets = load_secrets()
 llm_api_key = secrets.get("llm_api_key")
+llm_backends = secrets.get("llm_backends")
 
 # Initialize helpers
-llm = LLMHelper( auth_bearer_token=llm_api_key)
-wiki = WikiHelper( wiki_api_url="https://portal.mardi4nfdi.de/api.php" )
-other = OtherHelper()
+metrics = MetricsHelper()
+tracer = TraceHelper(max_traces=config.TRACE_MAX_TRACES, profile_rate=config.TRACE_PROFILE_RATE)
+llm_cache = LLMResponseCache(db_path=config.LLM_CACHE_PATH, max_size_bytes=config.LLM_CACHE_MAX_BYTES,
+                             max_age_seconds=config.LLM_CACHE_MAX_AGE) if config.LLM_CACHE_PATH else None
+llm_pool = LLMBackendPool.from_config(llm_backends, cooldown_seconds=config.LLM_BACKEND_COOLDOWN,
+                                      health_check_interval=config.LLM_HEALTH_CHECK_INTERVAL) if llm_backends else None
+llm = LLMHelper( auth_bearer_token=llm_api_key,
+                 chunk_tokens=config.LLM_CHUNK_TOKENS, chunk_concurrency=config.LLM_CHUNK_CONCURRENCY,
+                 http_options={**config.HTTP_OPTIONS, "read_timeout": config.LLM_READ_TIMEOUT},
+                 response_cache=llm_cache, single_pass_options=config.LLM_SINGLE_PASS_OPTIONS,
+                 backend_pool=llm_pool, metrics=metrics, llm_api_url=config.LLM_API_URL)
+entity_cache = EntityCache(max_entries=config.ENTITY_CACHE_MAX_ENTRIES, ttl_seconds=config.ENTITY_CACHE_TTL,
+                           db_path=config.ENTITY_CACHE_PATH or None) if config.ENTITY_CACHE_MAX_ENTRIES else None
+wiki = WikiHelper( wiki_api_url=config.WIKI_API_URL, username=secrets.get("wiki_username"),
+                   password=secrets.get("wiki_password"), http_options=config.HTTP_OPTIONS,
+                   entity_cache=entity_cache )
+article_cache = ArticleCache(db_path=config.ARTICLE_CACHE_PATH, max_size_bytes=config.ARTICLE_CACHE_MAX_BYTES,
+                             ttl_seconds=config.ARTICLE_CACHE_TTL) if config.ARTICLE_CACHE_PATH else None
+summary_index = SummaryIndex(db_path=config.SUMMARY_INDEX_PATH) if config.SUMMARY_INDEX_PATH else None
+other = OtherHelper(cache=article_cache, extractor=config.TEXT_EXTRACTOR, http_options=config.HTTP_OPTIONS,
+                    metrics=metrics, ar5iv_url=config.AR5IV_URL, sources=config.ARTICLE_SOURCES,
+                    fetch_timeout=config.ARTICLE_FETCH_TIMEOUT, hedge_options=config.HEDGE_OPTIONS)
+ledger = SQLiteWorkLedger(db_path=config.JOB_LEDGER_PATH,
+                          max_attempts=config.JOB_MAX_ATTEMPTS) if config.JOB_LEDGER_PATH else None
+jobs = JobHelper(worker_count=config.JOB_WORKERS, max_queue_size=config.JOB_QUEUE_SIZE,
+                 stage_limits={"wiki": config.STAGE_LIMIT_WIKI, "fetch": config.STAGE_LIMIT_FETCH, "llm": config.STAGE_LIMIT_LLM,
+                               "write": config.STAGE_LIMIT_WRITE},
+                 ledger=ledger, lease_seconds=config.JOB_LEASE_SECONDS, poll_interval=config.JOB_POLL_INTERVAL,
+                 priority_weights=config.PRIORITY_WEIGHTS, max_queue_sizes=config.JOB_QUEUE_SIZES)
+rate_limiter = RateLimiter(config.CLIENT_RATE_LIMIT, burst=config.CLIENT_RATE_BURST) if config.CLIENT_RATE_LIMIT else None
+pipeline = SummaryPipeline(llm, wiki, other, jobs, metrics, summary_index=summary_index,
+                           article_char_budget=config.ARTICLE_CHAR_BUDGET,
+                           chunked_article_char_budget=config.CHUNKED_ARTICLE_CHAR_BUDGET)
+# Ledger jobs are run by name, by whichever replica claims them
+jobs.register_handler(pipeline.run_summary_job)
+metrics.collect_jobs(jobs)
+if llm_pool:
+    metrics.collect_llm_backends(llm_pool)
+
+# A preforking server creates the helpers in its main process, see init_process
+import_pid = os.getpid()
+initialized_pid = None
+init_lock = threading.Lock()
+drain_started = None
 
 logger.info('Loading finished.')
 
+
+def init_process():
+    """
+    Prepares the process for serving, once per process. In a process forked after the helpers were
+    created (by a preforking server that preloads the app) the HTTP sessions are re-created, so that
+    no connections are shared. Then the background threads are started: the health checks of the
+    LLM backends and, with a ledger, the job workers, which take over the jobs of stopped replicas.
+    Called by the post_worker_init hook of gunicorn.conf.py and before the development server starts,
+    otherwise before the first request.
+    """
+    global initialized_pid
+
+    with init_lock:
+        if initialized_pid == os.getpid():
+            return
+
+        if os.getpid() != import_pid:
+            logger.debug(f"Re-creating the HTTP sessions in process {os.getpid()}")
+            llm.reset_session()
+            wiki.reset_session()
+            other.reset_session()
+
+        if llm_pool:
+            llm_pool.start_health_checks()
+        if ledger:
+            jobs.start_workers()
+
+        initialized_pid = os.getpid()
+
+
+def start_draining():
+    """
+    Stops accepting summary jobs, e.g. when the process received SIGTERM. The process reports
+    that it is not ready, and jobs in flight continue.
+    """
+    global drain_started
+
+    if drain_started is None:
+        drain_started = time.monotonic()
+        logger.info("Draining: no new summary jobs are accepted")
+    jobs.start_draining()
+
+
+def drain():
+    """
+    Stops accepting summary jobs and waits for the jobs in flight, at most DRAIN_TIMEOUT seconds
+    after draining started.
+
+    Returns:
+        bool: Whether all jobs are finished.
+    """
+    start_draining()
+    finished = jobs.drain(timeout=max(0.0, drain_started + config.DRAIN_TIMEOUT - time.monotonic()))
+    logger.info("Drained all summary jobs" if finished else "Stopped draining with summary jobs in flight")
+    return finished
+
+
+@app.before_request
+def ensure_process_initialized():
+    """
+    Initializes the process on the first request, if the server did not call init_process.
+    """
+    init_process()
+
+
 @app.route("/")
 def hello():
     """
@@ -33,12 +159,113 @@ def hello():
     return "Hello World!"
 
 
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """
+    Handles GET requests to the "/health/live" endpoint (liveness probe).
+      - Returns 200 as long as the process answers requests.
+    """
+    return {"status": "ok"}, 200
+
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """
+    Handles GET requests to the "/health/ready" endpoint (readiness probe).
+      - Returns 200 if the process accepts summary requests, 503 while it is draining, if the job
+        ledger cannot be read or if none of the LLM backends is healthy.
+    """
+    checks = {"draining": jobs.is_draining()}
+    ready = not checks['draining']
+
+    if ledger:
+        try:
+            ledger.get_counts()
+            checks['ledger'] = True
+        except Exception as e:
+            logger.error(f"Job ledger not available: {str(e)}")
+            checks['ledger'] = False
+            ready = False
+
+    if llm_pool:
+        checks['llm_backends'] = sum(1 for stats in llm_pool.get_stats() if stats['healthy'])
+        ready = ready and checks['llm_backends'] > 0
+
+    return {"ready": ready, "checks": checks}, 200 if ready else 503
+
+
+def get_flag_arg(name):
+    """
+    Returns whether a boolean query parameter is set, e.g. "?write=true".
+
+    Args:
+        name (str): The name of the query parameter.
+
+    Returns:
+        bool: True for "true", "1" or "yes".
+    """
+    return request.args.get(name, "false").lower() in ("true", "1", "yes")
+
+
+def get_priority_arg(default):
+    """
+    Returns the priority class of the request, e.g. "?priority=bulk".
+
+    Args:
+        default (str): The class if the query parameter is missing.
+
+    Returns:
+        str: The priority class, or None if it is invalid.
+    """
+    priority_class = request.args.get('priority', default)
+    return priority_class if priority_class in PRIORITIES else None
+
+
+def too_many_requests(error, retry_after):
+    """
+    Returns a 429 (Too Many Requests) response telling the client when to retry.
+
+    Args:
+        error (str): The error message.
+        retry_after (float): Seconds until the client should retry.
+    """
+    return {"error": error}, 429, {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def limit_client_rate():
+    """
+    Takes a request from the rate limit of the client, identified by its address, or by the
+    CLIENT_ID_HEADER header if configured.
+
+    Returns:
+        tuple: A 429 response if the client exceeded its rate limit, otherwise None.
+    """
+    if rate_limiter is None:
+        return None
+
+    client = request.remote_addr
+    # The header can be set by any client, so it is only trusted if configured, e.g. behind a proxy that sets it
+    if config.CLIENT_ID_HEADER:
+        client = request.headers.get(config.CLIENT_ID_HEADER) or client
+    retry_after = rate_limiter.acquire(client)
+    if retry_after:
+        logger.debug(f"Rate limit of {client} exceeded")
+        return too_many_requests("Rate limit exceeded, try again later", retry_after)
+    return None
+
+
 @app.route('/generate_article_summary', methods=['GET'])
 def generate_article_summary():
     """
     Handles GET requests to the "/generate_article_summary" endpoint.
-      - Expects the client to send a JSON payload in the request body.
-      - Returns a 204 (No Content response) to indicate successful processing.
+      - Expects the QID of the article as query parameter, and optionally the summary mode
+        ("two_pass", "single_pass" for a single LLM call or "chunked" for long papers), "simple=true"
+        to generate the simple-language summary as well, "write=true" to write the summaries to the
+        wiki, "force=true" to regenerate a summary whose input did not change and the priority class
+        ("interactive" by default, or "bulk").
+      - Enqueues a summary job, or attaches to the job already running for the QID.
+      - Returns a 202 (Accepted) with the job id and the URL to poll for the job status, or a 429
+        with Retry-After if the client exceeded its rate limit or the queue of the class is full.
     """
     logger.debug("called: /generate_article_summary")
 
@@ -49,31 +276,258 @@ def generate_article_summary():
 
     logger.debug(f"QID: {qid}")
 
-    # Get arXiv id
-    arxivid = wiki.get_arxivid_from_qid( qid )
+    mode = request.args.get('mode', SUMMARY_MODE_TWO_PASS)
+    if mode not in config.SUMMARY_MODES:
+        return {"error": f"Invalid 'mode', expected one of {', '.join(config.SUMMARY_MODES)}"}, 400
+
+    write = get_flag_arg('write')
+    if write and not wiki.USERNAME:
+        return {"error": "Writing to the wiki is not configured"}, 503
+    force = get_flag_arg('force')
+    simple = get_flag_arg('simple')
+    priority_class = get_priority_arg(PRIORITY_INTERACTIVE)
+    if priority_class is None:
+        return {"error": f"Invalid 'priority', expected one of {', '.join(PRIORITIES)}"}, 400
 
-    logger.debug(f"arXiv ID: {arxivid}")
+    rate_limited = limit_client_rate()
+    if rate_limited:
+        return rate_limited
 
-    if( arxivid is None ):
-        return {"error": "Invalid QID"}, 400
+    if jobs.is_draining():
+        return {"error": "The service is shutting down"}, 503
 
-    # Get article text
-    logger.debug("Getting article text...")
-    article_text = other.get_rendered_text_for_arxiv_id( arxivid )
+    try:
+        # The job records its spans in the trace of the request and runs with its priority
+        with activate(tracer.create_trace("generate_article_summary", qid=qid, mode=mode)), priority(priority_class):
+            job, created = jobs.submit(f"{qid}:{mode}:{write}:{force}:{simple}", pipeline.run_summary_job, qid,
+                                       mode=mode, write=write, force=force, simple=simple)
+    except queue.Full:
+        return too_many_requests(f"Job queue for {priority_class} requests is full, try again later",
+                                 config.QUEUE_RETRY_AFTER)
 
-    # Generate summary
-    logger.debug("Calling LLM to summarize...")
-    summary = llm.summarize_article( article_text )
+    status_url = url_for('get_job', job_id=job['id'])
+    return ({"job_id": job['id'], "status": job['status'], "status_url": status_url}, 202,
+            {"Location": status_url, TRACE_ID_HEADER: job['trace_id']})
 
-    logger.debug( summary )
 
-    # Check if summary is None
-    if summary is None:
-        return "Error: Summary generation failed.", 500
+@app.route('/generate_article_summary/stream', methods=['GET'])
+def generate_article_summary_stream():
+    """
+    Handles GET requests to the "/generate_article_summary/stream" endpoint.
+      - Expects the QID of the article as query parameter, and optionally the summary mode
+        ("two_pass" or "single_pass").
+      - Runs the summary in the request and streams it as Server-Sent Events:
+        "status" events for the pipeline stages, one default event per token of the final
+        LLM pass, and a "done" event with the complete summary (or an "error" event).
+      - Runs with interactive priority; returns a 429 if the client exceeded its rate limit.
+    """
+    logger.debug("called: /generate_article_summary/stream")
+
+    # Extract QID from query parameters
+    qid = request.args.get('QID', "")
+    if not qid:
+        return {"error": "Missing 'QID' in query parameters"}, 400
+
+    mode = request.args.get('mode', SUMMARY_MODE_TWO_PASS)
+    if mode not in (SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_SINGLE_PASS):
+        return {"error": f"Invalid 'mode', expected one of {SUMMARY_MODE_TWO_PASS}, {SUMMARY_MODE_SINGLE_PASS}"}, 400
+
+    rate_limited = limit_client_rate()
+    if rate_limited:
+        return rate_limited
+
+    trace = tracer.create_trace("generate_article_summary/stream", qid=qid, mode=mode)
+
+    def generate():
+        with activate(trace):
+            yield from generate_events()
+
+    def generate_events():
+        try:
+            yield format_sse_event({"stage": "wiki"}, event="status")
+            arxivid = pipeline.lookup_item(qid)['arxiv_id']
+            if arxivid is None:
+                raise Exception("Invalid QID")
+
+            yield format_sse_event({"stage": "fetch", "arxiv_id": arxivid}, event="status")
+            article_text = pipeline.fetch_article(arxivid, mode)
+
+            yield format_sse_event({"stage": "llm"}, event="status")
+            tokens = []
+            with jobs.stage("llm"):
+                for token in llm.summarize_article_stream( article_text,
+                                                           single_pass=mode == SUMMARY_MODE_SINGLE_PASS ):
+                    tokens.append(token)
+                    yield format_sse_event({"token": token})
+
+            summary = llm.clean_string("".join(tokens))
+            yield format_sse_event({"qid": qid, "arxiv_id": arxivid, "summary": summary}, event="done")
+        except Exception as e:
+            logger.exception(f"Streaming summary for {qid} failed")
+            yield format_sse_event({"qid": qid, "error": str(e)}, event="error")
+
+    # Disable buffering in reverse proxies, so that tokens arrive immediately
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", TRACE_ID_HEADER: trace.ID})
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Handles GET requests to the "/jobs/<job_id>" endpoint.
+      - Returns the status of the job, and its result once it is done.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+
+    return jsonify(job), 200
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """
+    Handles GET requests to the "/jobs/<job_id>/result" endpoint.
+      - Returns the summary if the job is done, 202 if it is still queued or running
+        and 500 if it failed.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+
+    if job['status'] == JOB_STATUS_DONE:
+        summaries = {key: job['result'][key] for key in ("summary", "summary_simple") if key in job['result']}
+        return jsonify(summaries), 200
+    if job['status'] == JOB_STATUS_FAILED:
+        return {"error": job['error']}, 500
+
+    return {"job_id": job['id'], "status": job['status']}, 202
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Handles GET requests to the "/stats" endpoint.
+      - Returns the number of queued jobs (in total and per priority class), the hit/miss counters
+        of the LLM response cache and the entity cache, and the state and metrics of the LLM backends.
+    """
+    return {"queued_jobs": jobs.get_queue_size(),
+            "queued_jobs_by_priority": {priority_class: jobs.get_queue_size(priority_class) for priority_class in PRIORITIES},
+            "llm_cache": llm_cache.get_stats() if llm_cache else None,
+            "entity_cache": entity_cache.get_stats() if entity_cache else None,
+            "llm_backends": llm_pool.get_stats() if llm_pool else None}, 200
+
+
+@app.route('/debug/trace/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """
+    Handles GET requests to the "/debug/trace/<trace_id>" endpoint.
+      - Returns the spans of a traced request as a tree: pipeline stages, parse step and outbound
+        HTTP calls with url, status, bytes and duration, and a cProfile of the parse step if sampled.
+      - Trace ids are returned in the X-Trace-Id header of the traced endpoints.
+    """
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        return {"error": "Unknown trace"}, 404
+
+    return jsonify(trace), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Handles GET requests to the "/metrics" endpoint.
+      - Returns the metrics in the Prometheus text format: latency histograms per pipeline stage,
+        download and text sizes, LLM tokens per second, cache hit ratios, jobs and stages in flight
+        and the counters of the LLM backends.
+    """
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def read_batch_qids(entries=None):
+    """
+    Reads the QIDs of a batch request. The body is either JSON, see pipeline_helper.parse_batch_json,
+    or JSON lines (one QID string or {"QID": ...} object per line). JSON lines are read incrementally
+    from the request stream, so a malformed line is only found while the batch is running.
+
+    Args:
+        entries (list): The entries of a JSON body, or None to read JSON lines.
+
+    Yields:
+        str or BatchItemError: The QIDs, or the errors of the entries that hold none.
+    """
+    if entries is not None:
+        for number, entry in enumerate(entries, 1):
+            yield get_batch_entry_qid(entry, f"Entry {number}")
+        return
+
+    for number, line in enumerate(request.stream, 1):
+        if line.strip():
+            yield parse_batch_line(line, number)
+
+
+@app.route('/generate_article_summaries', methods=['POST'])
+def generate_article_summaries():
+    """
+    Handles POST requests to the "/generate_article_summaries" endpoint.
+      - Expects a list of QIDs (JSON) or a JSON lines body, and optionally the summary mode,
+        "simple=true", "write=true", "force=true" and the priority class ("bulk" by default) as
+        query parameters.
+      - Runs the summary pipeline for all QIDs with overlapping stages. Returns a 400 if the JSON body
+        is no list of QIDs and a 429 if the client exceeded its rate limit.
+      - Streams one NDJSON line per QID back as soon as its summary is done, and an error line for
+        every entry that holds no QID, e.g. a malformed JSON line.
+    """
+    logger.debug("called: /generate_article_summaries")
+
+    mode = request.args.get('mode', SUMMARY_MODE_TWO_PASS)
+    if mode not in config.SUMMARY_MODES:
+        return {"error": f"Invalid 'mode', expected one of {', '.join(config.SUMMARY_MODES)}"}, 400
+
+    write = get_flag_arg('write')
+    if write and not wiki.USERNAME:
+        return {"error": "Writing to the wiki is not configured"}, 503
+    force = get_flag_arg('force')
+    simple = get_flag_arg('simple')
+    priority_class = get_priority_arg(PRIORITY_BULK)
+    if priority_class is None:
+        return {"error": f"Invalid 'priority', expected one of {', '.join(PRIORITIES)}"}, 400
 
-    return jsonify({"summary": summary}), 200
+    rate_limited = limit_client_rate()
+    if rate_limited:
+        return rate_limited
 
+    # A JSON body is checked before the response starts, JSON lines are reported line by line
+    entries = None
+    if request.is_json:
+        entries = parse_batch_json(request.get_json(silent=True))
+        if entries is None:
+            return {"error": "Expected a JSON list of QIDs or an object with a 'QIDs' list"}, 400
+
+    if jobs.is_draining():
+        return {"error": "The service is shutting down"}, 503
+
+    def generate():
+        # The items compete for the stages with the priority of the batch
+        with priority(priority_class):
+            items = pipeline.resolve_batch_qids(read_batch_qids(entries))
+            for (qid, item), result, error in jobs.map_unordered(lambda qid_and_item: pipeline.run_batch_item(*qid_and_item, mode=mode, write=write, force=force, simple=simple),
+                                                                 items, max_in_flight=config.BATCH_MAX_IN_FLIGHT):
+                yield format_batch_result(qid, result, error)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def handle_sigterm(signum, frame):
+    """
+    Drains the summary jobs and exits, for the development server. gunicorn.conf.py does the same for
+    the workers of the production server.
+    """
+    drain()
+    sys.exit(0)
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    init_process()
     app.run()
\ No newline at end of file
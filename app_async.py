@@ -0,0 +1,441 @@
+import asyncio
+import math
+import queue
+from concurrent.futures import ProcessPoolExecutor
+
+from quart import Quart, request, jsonify, url_for, Response, stream_with_context
+
+from library import config_helper as config
+from library.cache_helper import ArticleCache, SummaryIndex, LLMResponseCache, EntityCache
+from library.http_helper import AsyncHTTPClient, format_sse_event
+from library.metrics_helper import MetricsHelper, METRICS_CONTENT_TYPE
+from library.trace_helper import TraceHelper, TRACE_ID_HEADER, activate
+from library.llm_pool_helper import AsyncLLMBackendPool
+from library.job_helper import AsyncJobHelper, JOB_STATUS_DONE, JOB_STATUS_FAILED
+from library.scheduler_helper import RateLimiter, PRIORITIES, PRIORITY_INTERACTIVE, PRIORITY_BULK, priority
+from library.other_helper import AsyncOtherHelper
+from library.wiki_helper import AsyncWikiHelper
+from library.llm_helper import AsyncLLMHelper, SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_SINGLE_PASS
+from library.pipeline_helper import (AsyncSummaryPipeline, format_batch_result, get_batch_entry_qid, parse_batch_json,
+                                     parse_batch_line)
+from library.secrets_helper import load_secrets
+
+import logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger("update-trigger-rest")
+
+# Asyncio variant of app.py: all helpers share one event loop and one HTTP connection pool,
+# html parsing runs in a process pool. Run it with an ASGI server, e.g.:
+#   hypercorn app_async:app
+app = Quart(__name__)
+
+# Load secrets
+secrets = load_secrets()
+llm_api_key = secrets.get("llm_api_key")
+llm_backends = secrets.get("llm_backends")
+
+# Helpers are initialized when the event loop is running
+client = None
+process_pool = None
+llm = None
+llm_cache = None
+entity_cache = None
+llm_pool = None
+wiki = None
+other = None
+summary_index = None
+jobs = None
+pipeline = None
+metrics = MetricsHelper()
+tracer = TraceHelper(max_traces=config.TRACE_MAX_TRACES, profile_rate=config.TRACE_PROFILE_RATE)
+rate_limiter = RateLimiter(config.CLIENT_RATE_LIMIT, burst=config.CLIENT_RATE_BURST) if config.CLIENT_RATE_LIMIT else None
+
+
+@app.before_serving
+async def start_helpers():
+    """
+    Initializes the helpers with the shared HTTP client and process pool.
+    """
+    global client, process_pool, llm, llm_cache, entity_cache, llm_pool, wiki, other, summary_index, jobs, pipeline
+
+    client = AsyncHTTPClient(**{**config.HTTP_OPTIONS, "read_timeout": config.LLM_READ_TIMEOUT, "retry_post": True})
+    process_pool = ProcessPoolExecutor(max_workers=config.PARSE_PROCESSES)
+
+    article_cache = ArticleCache(db_path=config.ARTICLE_CACHE_PATH, max_size_bytes=config.ARTICLE_CACHE_MAX_BYTES,
+                                 ttl_seconds=config.ARTICLE_CACHE_TTL) if config.ARTICLE_CACHE_PATH else None
+
+    summary_index = SummaryIndex(db_path=config.SUMMARY_INDEX_PATH) if config.SUMMARY_INDEX_PATH else None
+
+    llm_cache = LLMResponseCache(db_path=config.LLM_CACHE_PATH, max_size_bytes=config.LLM_CACHE_MAX_BYTES,
+                                 max_age_seconds=config.LLM_CACHE_MAX_AGE) if config.LLM_CACHE_PATH else None
+
+    llm_pool = AsyncLLMBackendPool.from_config(llm_backends, client=client, cooldown_seconds=config.LLM_BACKEND_COOLDOWN,
+                                               health_check_interval=config.LLM_HEALTH_CHECK_INTERVAL) if llm_backends else None
+
+    llm = AsyncLLMHelper( client, auth_bearer_token=llm_api_key,
+                          chunk_tokens=config.LLM_CHUNK_TOKENS, chunk_concurrency=config.LLM_CHUNK_CONCURRENCY,
+                          response_cache=llm_cache, single_pass_options=config.LLM_SINGLE_PASS_OPTIONS,
+                          backend_pool=llm_pool, metrics=metrics, llm_api_url=config.LLM_API_URL )
+    entity_cache = EntityCache(max_entries=config.ENTITY_CACHE_MAX_ENTRIES, ttl_seconds=config.ENTITY_CACHE_TTL,
+                               db_path=config.ENTITY_CACHE_PATH or None) if config.ENTITY_CACHE_MAX_ENTRIES else None
+
+    wiki = AsyncWikiHelper( client, wiki_api_url=config.WIKI_API_URL, username=secrets.get("wiki_username"),
+                            password=secrets.get("wiki_password"), entity_cache=entity_cache )
+    other = AsyncOtherHelper( client, process_pool, cache=article_cache, extractor=config.TEXT_EXTRACTOR,
+                              metrics=metrics, ar5iv_url=config.AR5IV_URL, sources=config.ARTICLE_SOURCES,
+                              fetch_timeout=config.ARTICLE_FETCH_TIMEOUT, hedge_options=config.HEDGE_OPTIONS )
+    jobs = AsyncJobHelper(max_running_jobs=config.ASYNC_MAX_JOBS, max_queue_size=config.JOB_QUEUE_SIZE,
+                          stage_limits={"wiki": config.STAGE_LIMIT_WIKI, "fetch": config.STAGE_LIMIT_FETCH,
+                                        "llm": config.STAGE_LIMIT_LLM, "write": config.STAGE_LIMIT_WRITE},
+                          priority_weights=config.PRIORITY_WEIGHTS, max_queue_sizes=config.JOB_QUEUE_SIZES)
+    pipeline = AsyncSummaryPipeline(llm, wiki, other, jobs, metrics, summary_index=summary_index,
+                                    article_char_budget=config.ARTICLE_CHAR_BUDGET,
+                                    chunked_article_char_budget=config.CHUNKED_ARTICLE_CHAR_BUDGET)
+    metrics.collect_jobs(jobs)
+    if llm_pool:
+        metrics.collect_llm_backends(llm_pool)
+
+    logger.info('Loading finished.')
+
+
+async def drain():
+    """
+    Stops accepting summary jobs and waits for the jobs in flight, at most DRAIN_TIMEOUT seconds, see app.drain.
+
+    Returns:
+        bool: Whether all jobs are finished.
+    """
+    logger.info("Draining: no new summary jobs are accepted")
+    finished = await jobs.drain(timeout=config.DRAIN_TIMEOUT)
+    logger.info("Drained all summary jobs" if finished else "Stopped draining with summary jobs in flight")
+    return finished
+
+
+@app.after_serving
+async def stop_helpers():
+    """
+    Drains the summary jobs, then closes the HTTP connections and the process pool. The ASGI server
+    calls this on shutdown (e.g. SIGTERM), after the requests in flight are finished.
+    """
+    await drain()
+    if llm_pool and llm_pool.HEALTH_CHECKER:
+        llm_pool.HEALTH_CHECKER.cancel()
+    await client.aclose()
+    process_pool.shutdown()
+
+
+@app.route("/")
+async def hello():
+    """
+    Handles GET requests to the root URL ("/").
+      - Returns a simple "Hello World!" message as the response.
+    """
+    return "Hello World!"
+
+
+@app.route('/health/live', methods=['GET'])
+async def health_live():
+    """
+    Handles GET requests to the "/health/live" endpoint (liveness probe), see app.health_live.
+    """
+    return {"status": "ok"}, 200
+
+
+@app.route('/health/ready', methods=['GET'])
+async def health_ready():
+    """
+    Handles GET requests to the "/health/ready" endpoint (readiness probe).
+      - Returns 200 if the process accepts summary requests, 503 while it is draining or if none of
+        the LLM backends is healthy.
+    """
+    checks = {"draining": jobs.is_draining()}
+    ready = not checks['draining']
+
+    if llm_pool:
+        checks['llm_backends'] = sum(1 for stats in llm_pool.get_stats() if stats['healthy'])
+        ready = ready and checks['llm_backends'] > 0
+
+    return {"ready": ready, "checks": checks}, 200 if ready else 503
+
+
+def get_flag_arg(name):
+    """
+    Returns whether a boolean query parameter is set, see app.get_flag_arg.
+    """
+    return request.args.get(name, "false").lower() in ("true", "1", "yes")
+
+
+def get_priority_arg(default):
+    """
+    Returns the priority class of the request, see app.get_priority_arg.
+    """
+    priority_class = request.args.get('priority', default)
+    return priority_class if priority_class in PRIORITIES else None
+
+
+def too_many_requests(error, retry_after):
+    """
+    Returns a 429 (Too Many Requests) response telling the client when to retry, see app.too_many_requests.
+    """
+    return {"error": error}, 429, {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def limit_client_rate():
+    """
+    Takes a request from the rate limit of the client, see app.limit_client_rate.
+
+    Returns:
+        tuple: A 429 response if the client exceeded its rate limit, otherwise None.
+    """
+    if rate_limiter is None:
+        return None
+
+    client = request.remote_addr
+    # The header can be set by any client, so it is only trusted if configured, e.g. behind a proxy that sets it
+    if config.CLIENT_ID_HEADER:
+        client = request.headers.get(config.CLIENT_ID_HEADER) or client
+    retry_after = rate_limiter.acquire(client)
+    if retry_after:
+        logger.debug(f"Rate limit of {client} exceeded")
+        return too_many_requests("Rate limit exceeded, try again later", retry_after)
+    return None
+
+
+@app.route('/generate_article_summary', methods=['GET'])
+async def generate_article_summary():
+    """
+    Handles GET requests to the "/generate_article_summary" endpoint, see app.generate_article_summary.
+    """
+    # Extract QID from query parameters
+    qid = request.args.get('QID', "")
+    if not qid:
+        return {"error": "Missing 'QID' in query parameters"}, 400
+
+    mode = request.args.get('mode', SUMMARY_MODE_TWO_PASS)
+    if mode not in config.SUMMARY_MODES:
+        return {"error": f"Invalid 'mode', expected one of {', '.join(config.SUMMARY_MODES)}"}, 400
+
+    write = get_flag_arg('write')
+    if write and not wiki.USERNAME:
+        return {"error": "Writing to the wiki is not configured"}, 503
+    force = get_flag_arg('force')
+    simple = get_flag_arg('simple')
+    priority_class = get_priority_arg(PRIORITY_INTERACTIVE)
+    if priority_class is None:
+        return {"error": f"Invalid 'priority', expected one of {', '.join(PRIORITIES)}"}, 400
+
+    rate_limited = limit_client_rate()
+    if rate_limited:
+        return rate_limited
+
+    if jobs.is_draining():
+        return {"error": "The service is shutting down"}, 503
+
+    try:
+        # The job records its spans in the trace of the request and runs with its priority
+        with activate(tracer.create_trace("generate_article_summary", qid=qid, mode=mode)), priority(priority_class):
+            job, created = jobs.submit(f"{qid}:{mode}:{write}:{force}:{simple}", pipeline.run_summary_job, qid,
+                                       mode=mode, write=write, force=force, simple=simple)
+    except queue.Full:
+        return too_many_requests(f"Job queue for {priority_class} requests is full, try again later",
+                                 config.QUEUE_RETRY_AFTER)
+
+    status_url = url_for('get_job', job_id=job['id'])
+    return ({"job_id": job['id'], "status": job['status'], "status_url": status_url}, 202,
+            {"Location": status_url, TRACE_ID_HEADER: job['trace_id']})
+
+
+@app.route('/generate_article_summary/stream', methods=['GET'])
+async def generate_article_summary_stream():
+    """
+    Handles GET requests to the "/generate_article_summary/stream" endpoint, see app.generate_article_summary_stream.
+    """
+    # Extract QID from query parameters
+    qid = request.args.get('QID', "")
+    if not qid:
+        return {"error": "Missing 'QID' in query parameters"}, 400
+
+    mode = request.args.get('mode', SUMMARY_MODE_TWO_PASS)
+    if mode not in (SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_SINGLE_PASS):
+        return {"error": f"Invalid 'mode', expected one of {SUMMARY_MODE_TWO_PASS}, {SUMMARY_MODE_SINGLE_PASS}"}, 400
+
+    rate_limited = limit_client_rate()
+    if rate_limited:
+        return rate_limited
+
+    trace = tracer.create_trace("generate_article_summary/stream", qid=qid, mode=mode)
+
+    async def generate():
+        with activate(trace):
+            async for event in generate_events():
+                yield event
+
+    async def generate_events():
+        try:
+            yield format_sse_event({"stage": "wiki"}, event="status")
+            arxivid = (await pipeline.lookup_item(qid))['arxiv_id']
+            if arxivid is None:
+                raise Exception("Invalid QID")
+
+            yield format_sse_event({"stage": "fetch", "arxiv_id": arxivid}, event="status")
+            article_text = await pipeline.fetch_article(arxivid, mode)
+
+            yield format_sse_event({"stage": "llm"}, event="status")
+            tokens = []
+            async with jobs.stage("llm"):
+                async for token in llm.summarize_article_stream( article_text,
+                                                                 single_pass=mode == SUMMARY_MODE_SINGLE_PASS ):
+                    tokens.append(token)
+                    yield format_sse_event({"token": token})
+
+            summary = llm.clean_string("".join(tokens))
+            yield format_sse_event({"qid": qid, "arxiv_id": arxivid, "summary": summary}, event="done")
+        except Exception as e:
+            logger.exception(f"Streaming summary for {qid} failed")
+            yield format_sse_event({"qid": qid, "error": str(e)}, event="error")
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", TRACE_ID_HEADER: trace.ID})
+    # Stream without a response timeout, the LLM passes can take minutes
+    response.timeout = None
+    return response
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """
+    Handles GET requests to the "/jobs/<job_id>" endpoint.
+      - Returns the status of the job, and its result once it is done.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+
+    return jsonify(job), 200
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+async def get_job_result(job_id):
+    """
+    Handles GET requests to the "/jobs/<job_id>/result" endpoint.
+      - Returns the summary if the job is done, 202 if it is still queued or running
+        and 500 if it failed.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+
+    if job['status'] == JOB_STATUS_DONE:
+        summaries = {key: job['result'][key] for key in ("summary", "summary_simple") if key in job['result']}
+        return jsonify(summaries), 200
+    if job['status'] == JOB_STATUS_FAILED:
+        return {"error": job['error']}, 500
+
+    return {"job_id": job['id'], "status": job['status']}, 202
+
+
+@app.route('/stats', methods=['GET'])
+async def get_stats():
+    """
+    Handles GET requests to the "/stats" endpoint, see app.get_stats.
+    """
+    llm_cache_stats = await asyncio.to_thread(llm_cache.get_stats) if llm_cache else None
+    return {"queued_jobs": jobs.get_queue_size(),
+            "queued_jobs_by_priority": {priority_class: jobs.get_queue_size(priority_class) for priority_class in PRIORITIES},
+            "llm_cache": llm_cache_stats,
+            "entity_cache": entity_cache.get_stats() if entity_cache else None,
+            "llm_backends": llm_pool.get_stats() if llm_pool else None}, 200
+
+
+@app.route('/debug/trace/<trace_id>', methods=['GET'])
+async def get_trace(trace_id):
+    """
+    Handles GET requests to the "/debug/trace/<trace_id>" endpoint, see app.get_trace.
+    """
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        return {"error": "Unknown trace"}, 404
+
+    return jsonify(trace), 200
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """
+    Handles GET requests to the "/metrics" endpoint, see app.get_metrics.
+    """
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+async def read_batch_qids(entries=None):
+    """
+    Reads the QIDs of a batch request, see app.read_batch_qids.
+
+    Args:
+        entries (list): The entries of a JSON body, or None to read JSON lines.
+
+    Yields:
+        str or BatchItemError: The QIDs, or the errors of the entries that hold none.
+    """
+    if entries is not None:
+        for number, entry in enumerate(entries, 1):
+            yield get_batch_entry_qid(entry, f"Entry {number}")
+        return
+
+    buffer = b""
+    number = 0
+    async for chunk in request.body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield parse_batch_line(line, number)
+
+    if buffer.strip():
+        yield parse_batch_line(buffer, number + 1)
+
+
+@app.route('/generate_article_summaries', methods=['POST'])
+async def generate_article_summaries():
+    """
+    Handles POST requests to the "/generate_article_summaries" endpoint, see app.generate_article_summaries.
+    """
+    mode = request.args.get('mode', SUMMARY_MODE_TWO_PASS)
+    if mode not in config.SUMMARY_MODES:
+        return {"error": f"Invalid 'mode', expected one of {', '.join(config.SUMMARY_MODES)}"}, 400
+
+    write = get_flag_arg('write')
+    if write and not wiki.USERNAME:
+        return {"error": "Writing to the wiki is not configured"}, 503
+    force = get_flag_arg('force')
+    simple = get_flag_arg('simple')
+    priority_class = get_priority_arg(PRIORITY_BULK)
+    if priority_class is None:
+        return {"error": f"Invalid 'priority', expected one of {', '.join(PRIORITIES)}"}, 400
+
+    rate_limited = limit_client_rate()
+    if rate_limited:
+        return rate_limited
+
+    # A JSON body is checked before the response starts, JSON lines are reported line by line
+    entries = None
+    if request.is_json:
+        entries = parse_batch_json(await request.get_json(silent=True))
+        if entries is None:
+            return {"error": "Expected a JSON list of QIDs or an object with a 'QIDs' list"}, 400
+
+    if jobs.is_draining():
+        return {"error": "The service is shutting down"}, 503
+
+    @stream_with_context
+    async def generate():
+        # The items compete for the stages with the priority of the batch
+        with priority(priority_class):
+            items = pipeline.resolve_batch_qids(read_batch_qids(entries))
+            async for (qid, item), result, error in jobs.map_unordered(
+                    lambda qid_and_item: pipeline.run_batch_item(*qid_and_item, mode=mode, write=write, force=force, simple=simple),
+                    items, max_in_flight=config.BATCH_MAX_IN_FLIGHT):
+                yield format_batch_result(qid, result, error)
+
+    return Response(generate(), mimetype='application/x-ndjson')
@@ -0,0 +1,103 @@
+import argparse
+import glob
+import os
+import re
+import statistics
+import time
+
+from library.llm_helper import LLMHelper
+from benchmark.stub_llm_server import start_stub_llm_server
+
+
+# CONSTANTS
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+
+class CountingLLMHelper(LLMHelper):
+    """
+    LLMHelper that counts its LLM calls.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.CALLS = 0
+
+    def ask_llm_stream(self, question, **kwargs):
+        self.CALLS += 1
+        return super().ask_llm_stream(question, **kwargs)
+
+
+def evaluate(llm, summarize, text):
+    """
+    Summarizes a text and measures the summary.
+
+    Args:
+        llm (CountingLLMHelper): The helper.
+        summarize (callable): The summarize method of the helper.
+        text (str): The article text.
+
+    Returns:
+        dict: Latency in seconds, number of LLM calls, and characters, words and sentences of the summary.
+    """
+    llm.CALLS = 0
+    start = time.perf_counter()
+    summary = summarize(text)
+    latency = time.perf_counter() - start
+
+    return {
+        "latency": latency,
+        "calls": llm.CALLS,
+        "chars": len(summary),
+        "words": len(summary.split()),
+        "sentences": len([s for s in re.split(r'(?<=[.!?])\s+', summary) if s]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares single-pass and two-pass summaries on a local corpus.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Directory with article texts (*.txt)")
+    parser.add_argument("--llm-url", help="Generate endpoint of a real LLM; a stub server is started if omitted")
+    parser.add_argument("--model", default="nemotron:latest")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per token of the stub server")
+    parser.add_argument("--prefill-delay", type=float, default=0.05,
+                        help="Seconds per 1000 prompt characters of the stub server")
+    args = parser.parse_args()
+
+    llm_url = args.llm_url
+    if not llm_url:
+        server, llm_url = start_stub_llm_server(token_delay=args.token_delay,
+                                                prefill_delay_per_1k_chars=args.prefill_delay)
+
+    # No response cache, every call reaches the LLM
+    llm = CountingLLMHelper()
+    llm.LLM_API_URL = llm_url
+    llm.LLM_TO_USE = args.model
+    modes = {"two_pass": llm.summarize_article, "single_pass": llm.summarize_article_single_pass}
+
+    results = {mode: [] for mode in modes}
+    print(f"{'article':<28} {'mode':<12} {'latency':>8} {'calls':>5} {'chars':>6} {'words':>5} {'sent.':>5}")
+    for path in sorted(glob.glob(os.path.join(args.corpus, "*.txt"))):
+        with open(path, encoding="utf-8") as file:
+            text = file.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+
+        for mode, summarize in modes.items():
+            result = evaluate(llm, summarize, text)
+            results[mode].append(result)
+            print(f"{name[:28]:<28} {mode:<12} {result['latency']:>7.2f}s {result['calls']:>5} "
+                  f"{result['chars']:>6} {result['words']:>5} {result['sentences']:>5}")
+
+    print()
+    for mode, mode_results in results.items():
+        if not mode_results:
+            continue
+        print(f"{'mean':<28} {mode:<12} "
+              f"{statistics.mean(r['latency'] for r in mode_results):>7.2f}s "
+              f"{statistics.mean(r['calls'] for r in mode_results):>5.1f} "
+              f"{statistics.mean(r['chars'] for r in mode_results):>6.0f} "
+              f"{statistics.mean(r['words'] for r in mode_results):>5.0f} "
+              f"{statistics.mean(r['sentences'] for r in mode_results):>5.1f}")
+
+
+if __name__ == "__main__":
+    main()
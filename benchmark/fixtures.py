@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import os
+import random
+from html import escape
+
+
+# CONSTANTS
+# Building blocks of the generated articles, chosen to resemble the vocabulary of math papers
+WORDS = ("we", "show", "that", "the", "operator", "is", "bounded", "on", "every", "compact", "subset",
+         "of", "domain", "and", "its", "spectrum", "consists", "eigenvalues", "with", "finite",
+         "multiplicity", "moreover", "estimate", "holds", "for", "all", "sufficiently", "large",
+         "this", "implies", "convergence", "sequence", "in", "norm", "which", "proves", "main",
+         "theorem", "under", "assumption", "regularity", "boundary", "solution", "unique", "weak",
+         "sense", "a", "priori", "bound", "constant", "depends", "only", "dimension")
+SECTION_TITLES = ("Introduction", "Preliminaries", "Main results", "Proof of the main theorem",
+                  "Regularity estimates", "Spectral analysis", "Numerical experiments", "Applications",
+                  "Extensions", "Concluding remarks")
+SYMBOLS = ("x", "y", "u", "f", "\\lambda", "\\Omega", "\\varepsilon", "n", "k", "t")
+
+
+def generate_formula(rng):
+    """
+    Generates a random formula as LaTeX and as the MathML that ar5iv renders for it, including the
+    nested presentation markup (mrow, msup, msub, mfrac) that makes ar5iv pages expensive to parse.
+
+    Args:
+        rng (random.Random): The random generator.
+
+    Returns:
+        tuple: The LaTeX source and the MathML presentation markup of the formula.
+    """
+    terms_tex, terms_mml = [], []
+    for _ in range(rng.randint(1, 4)):
+        base, index, power = rng.choice(SYMBOLS), rng.choice(SYMBOLS), rng.randint(2, 9)
+        kind = rng.randrange(3)
+        if kind == 0:
+            terms_tex.append(f"{base}_{{{index}}}^{{{power}}}")
+            terms_mml.append(f"<msubsup><mi>{escape(base)}</mi><mi>{escape(index)}</mi><mn>{power}</mn></msubsup>")
+        elif kind == 1:
+            terms_tex.append(f"\\frac{{{base}}}{{{index}+{power}}}")
+            terms_mml.append(f"<mfrac><mi>{escape(base)}</mi><mrow><mi>{escape(index)}</mi><mo>+</mo>"
+                             f"<mn>{power}</mn></mrow></mfrac>")
+        else:
+            terms_tex.append(f"\\|{base}\\|_{{L^{{{power}}}}}")
+            terms_mml.append(f"<mrow><mo>‖</mo><mi>{escape(base)}</mi><msub><mo>‖</mo><msup><mi>L</mi>"
+                             f"<mn>{power}</mn></msup></msub></mrow>")
+
+    relation = rng.choice(("\\leq", "=", "<"))
+    tex = f" {relation} ".join(terms_tex) if len(terms_tex) > 1 else terms_tex[0]
+    mml = "<mrow>" + f"<mo>{escape(relation)}</mo>".join(terms_mml) + "</mrow>"
+    return tex, mml
+
+
+def generate_math(rng, display=False):
+    """
+    Generates a <math> element like ar5iv: MathML with the LaTeX source as annotation.
+
+    Args:
+        rng (random.Random): The random generator.
+        display (bool): Whether the formula is displayed in its own block.
+
+    Returns:
+        str: The html of the element.
+    """
+    tex, mml = generate_formula(rng)
+    return (f'<math xmlns="http://www.w3.org/1998/Math/MathML" alttext="{escape(tex)}" '
+            f'class="ltx_Math" display="{"block" if display else "inline"}"><semantics>{mml}'
+            f'<annotation-xml encoding="MathML-Content"><apply><csymbol>formula</csymbol></apply></annotation-xml>'
+            f'<annotation encoding="application/x-tex">{escape(tex)}</annotation></semantics></math>')
+
+
+def generate_paragraph(rng, formulas):
+    """
+    Generates a paragraph of made-up sentences with inline formulas.
+
+    Args:
+        rng (random.Random): The random generator.
+        formulas (int): Number of inline formulas.
+
+    Returns:
+        str: The html of the paragraph.
+    """
+    sentences = []
+    for i in range(rng.randint(4, 8)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+        if i < formulas:
+            words.insert(rng.randrange(len(words)), generate_math(rng))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return f'<div class="ltx_para"><p class="ltx_p">{" ".join(sentences)}</p></div>'
+
+
+def generate_article_html(arxiv_id, sections=8, paragraphs=5, formulas=3, seed=None):
+    """
+    Generates an ar5iv-like html page of a made-up, MathML-heavy article: title, abstract and
+    numbered sections with paragraphs, inline and displayed formulas, plus the scripts and
+    styles that the extractors have to skip. The page only depends on the arguments.
+
+    Args:
+        arxiv_id (str): The arXiv id, used in the title and as default seed.
+        sections (int): Number of sections.
+        paragraphs (int): Number of paragraphs per section.
+        formulas (int): Number of inline formulas per paragraph.
+        seed (int): Seed of the random generator, derived from the arXiv id if None.
+
+    Returns:
+        bytes: The html page, UTF-8 encoded.
+    """
+    if seed is None:
+        seed = int(hashlib.sha256(arxiv_id.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+
+    parts = [
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+        f'<title>[{escape(arxiv_id)}] On the spectrum of a bounded operator</title>',
+        '<link rel="stylesheet" href="/assets/ar5iv.min.css"><style>.ltx_page_main{margin:auto}</style>',
+        '<script>window.MathJax = {tex: {inlineMath: [["$", "$"]]}};</script></head><body>',
+        '<div class="ltx_page_main"><div class="ltx_page_content"><article class="ltx_document ltx_authors_1line">',
+        f'<h1 class="ltx_title ltx_title_document">On the spectrum of a bounded operator ({escape(arxiv_id)})</h1>',
+        '<div class="ltx_authors"><span class="ltx_creator ltx_role_author">A. Author</span></div>',
+        '<div class="ltx_abstract"><h6 class="ltx_title ltx_title_abstract">Abstract</h6>',
+        generate_paragraph(rng, formulas), '</div>',
+    ]
+    for s in range(1, sections + 1):
+        title = SECTION_TITLES[(s - 1) % len(SECTION_TITLES)]
+        parts.append(f'<section id="S{s}" class="ltx_section"><h2 class="ltx_title ltx_title_section">'
+                     f'<span class="ltx_tag ltx_tag_section">{s} </span>{title}</h2>')
+        for p in range(paragraphs):
+            parts.append(generate_paragraph(rng, formulas))
+            if p % 2 == 1:
+                parts.append(f'<table class="ltx_equation ltx_eqn_table" id="S{s}.E{p}"><tbody><tr>'
+                             f'<td class="ltx_eqn_cell">{generate_math(rng, display=True)}</td>'
+                             f'<td class="ltx_eqn_cell ltx_eqn_eqno"><span class="ltx_tag">({s}.{p})</span></td>'
+                             f'</tr></tbody></table>')
+        parts.append('</section>')
+    parts.append('</article></div><footer class="ltx_page_footer">Generated by LaTeXML</footer></div>'
+                 '<script src="/assets/mathjax.js"></script></body></html>')
+
+    return "".join(parts).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a corpus of generated ar5iv-like article pages.")
+    parser.add_argument("--out", required=True, help="Directory to write the pages to")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--paragraphs", type=int, default=5)
+    parser.add_argument("--formulas", type=int, default=3)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for i in range(args.count):
+        arxiv_id = f"2101.{i:05d}"
+        html = generate_article_html(arxiv_id, sections=args.sections, paragraphs=args.paragraphs,
+                                     formulas=args.formulas)
+        with open(os.path.join(args.out, arxiv_id + ".html"), "wb") as file:
+            file.write(html)
+    print(f"Wrote {args.count} pages to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
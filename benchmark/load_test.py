@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmark.mock_servers import start_mock_servers, start_server
+
+
+# CONSTANTS
+SCENARIOS = ("job", "stream", "batch")
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """
+    Returns the p-th percentile of sorted values (nearest rank).
+    """
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def start_app(servers, with_caches=False):
+    """
+    Starts app.py in a background thread, configured with the urls of the mock servers.
+    The service reads its configuration on import, so this must be called before app is imported elsewhere.
+    It runs in a temporary working directory with made-up credentials, which the mock wiki accepts,
+    so that neither a real secrets.json (e.g. with llm_backends) nor real caches are used.
+
+    Args:
+        servers (dict): The mock servers, see start_mock_servers.
+        with_caches (bool): Whether the article cache, LLM response cache and summary index are enabled.
+
+    Returns:
+        str: The base url of the service.
+    """
+    for name in ("WIKI_API_URL", "AR5IV_URL", "ARXIV_HTML_URL", "ARXIV_ABSTRACT_URL", "LLM_API_URL"):
+        os.environ[name] = servers[name]
+    if not with_caches:
+        for name in ("ARTICLE_CACHE_PATH", "LLM_CACHE_PATH", "SUMMARY_INDEX_PATH"):
+            os.environ[name] = ""
+
+    sys.path.insert(0, os.getcwd())
+    os.chdir(tempfile.mkdtemp(prefix="load_test_"))
+    with open("secrets.json", "w") as file:
+        json.dump({"llm_api_key": "", "wiki_username": "benchmark", "wiki_password": "benchmark"}, file)
+
+    import logging
+    from werkzeug.serving import make_server
+    import app
+
+    # The service and werkzeug log every request
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    return start_server(make_server("127.0.0.1", 0, app.app, threaded=True))
+
+
+class LoadTest:
+    """
+    Sends requests of a scenario with a fixed number of concurrent clients and measures
+    the latency of every request.
+    """
+
+    def __init__(self, base_url, scenario="job", mode="two_pass", concurrency=8, poll_interval=0.05,
+                 batch_size=10, first_qid=1):
+        """
+        Initializes the LoadTest.
+
+        Args:
+            base_url (str): Base url of the service.
+            scenario (str): "job" (enqueue and poll until the result is there), "stream" (read the
+                Server-Sent Events until done) or "batch" (one NDJSON batch request per client request).
+            mode (str): The summary mode.
+            concurrency (int): Number of concurrent clients.
+            poll_interval (float): Seconds between two polls of a job.
+            batch_size (int): QIDs per batch request.
+            first_qid (int): Number of the first QID; every request uses new QIDs, so that
+                no request is coalesced with another one.
+        """
+        self.BASE_URL = base_url.rstrip("/")
+        self.SCENARIO = scenario
+        self.MODE = mode
+        self.CONCURRENCY = concurrency
+        self.POLL_INTERVAL = poll_interval
+        self.BATCH_SIZE = batch_size
+        self.LOCAL = threading.local()
+        self.LOCK = threading.Lock()
+        self.next_qid = first_qid
+
+    def get_session(self):
+        if not hasattr(self.LOCAL, "session"):
+            self.LOCAL.session = requests.Session()
+        return self.LOCAL.session
+
+    def take_qids(self, count):
+        with self.LOCK:
+            qids = [f"Q{self.next_qid + i}" for i in range(count)]
+            self.next_qid += count
+        return qids
+
+    def run_job(self):
+        session = self.get_session()
+        qid = self.take_qids(1)[0]
+        response = session.get(f"{self.BASE_URL}/generate_article_summary", params={"QID": qid, "mode": self.MODE})
+        response.raise_for_status()
+        result_url = self.BASE_URL + response.json()["status_url"] + "/result"
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            response = session.get(result_url)
+            if response.status_code != 202:
+                return response.status_code == 200, None
+
+    def run_stream(self):
+        start = time.perf_counter()
+        first_token = None
+        event = None
+        with self.get_session().get(f"{self.BASE_URL}/generate_article_summary/stream",
+                                    params={"QID": self.take_qids(1)[0], "mode": self.MODE}, stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line.split(":", 1)[1].strip()
+                elif line.startswith("data:") and event is None and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif not line:
+                    if event in ("done", "error"):
+                        return event == "done", first_token
+                    event = None
+        return False, first_token
+
+    def run_batch(self):
+        qids = self.take_qids(self.BATCH_SIZE)
+        response = self.get_session().post(f"{self.BASE_URL}/generate_article_summaries", params={"mode": self.MODE},
+                                           json=qids)
+        results = [json.loads(line) for line in response.text.splitlines() if line]
+        return response.ok and len(results) == len(qids) and not any("error" in r for r in results), None
+
+    def measure(self, request):
+        """
+        Runs one request of the scenario.
+
+        Returns:
+            tuple: Latency in seconds, whether the request succeeded, and the time to the first token (stream only).
+        """
+        start = time.perf_counter()
+        try:
+            ok, first_token = request()
+        except requests.exceptions.RequestException:
+            ok, first_token = False, None
+        return time.perf_counter() - start, ok, first_token
+
+    def run(self, requests_count):
+        """
+        Sends requests_count requests with CONCURRENCY clients.
+
+        Returns:
+            dict: The number of requests and errors, requests per second, and latency percentiles.
+        """
+        request = {"job": self.run_job, "stream": self.run_stream, "batch": self.run_batch}[self.SCENARIO]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.CONCURRENCY) as executor:
+            results = list(executor.map(lambda _: self.measure(request), range(requests_count)))
+        duration = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _, _ in results)
+        first_tokens = sorted(first_token for _, _, first_token in results if first_token is not None)
+        report = {
+            "scenario": self.SCENARIO,
+            "mode": self.MODE,
+            "concurrency": self.CONCURRENCY,
+            "requests": requests_count,
+            "errors": sum(1 for _, ok, _ in results if not ok),
+            "duration": duration,
+            "requests_per_second": requests_count / duration,
+        }
+        if self.SCENARIO == "batch":
+            report["summaries_per_second"] = requests_count * self.BATCH_SIZE / duration
+        for p in PERCENTILES:
+            report[f"p{p}"] = percentile(latencies, p)
+        if first_tokens:
+            report["first_token_p50"] = percentile(first_tokens, 50)
+            report["first_token_p95"] = percentile(first_tokens, 95)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the summary endpoints against mock servers.")
+    parser.add_argument("--url", help="Base url of a running service; app.py is started against mock servers if omitted")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="job")
+    parser.add_argument("--mode", default="two_pass")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=10, help="QIDs per request in the batch scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="Requests sent before measuring")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the caches of the service enabled")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per token of the mock LLM")
+    parser.add_argument("--prefill-delay", type=float, default=0.05, help="Seconds per 1000 prompt characters of the mock LLM")
+    parser.add_argument("--ar5iv-latency", type=float, default=0.05, help="Seconds before each page of the mock ar5iv")
+    parser.add_argument("--wiki-latency", type=float, default=0.01, help="Seconds before each response of the mock wiki")
+    args = parser.parse_args()
+
+    base_url = args.url
+    if not base_url:
+        servers = start_mock_servers(wiki_latency=args.wiki_latency, ar5iv_latency=args.ar5iv_latency,
+                                     token_delay=args.token_delay, prefill_delay_per_1k_chars=args.prefill_delay)
+        base_url = start_app(servers, with_caches=args.with_caches)
+
+    load_test = LoadTest(base_url, scenario=args.scenario, mode=args.mode, concurrency=args.concurrency,
+                         batch_size=args.batch_size)
+    if args.warmup:
+        load_test.run(args.warmup)
+    report = load_test.run(args.requests)
+
+    for key, value in report.items():
+        print(f"{key:<22} {value:.3f}" if isinstance(value, float) else f"{key:<22} {value}")
+
+
+if __name__ == "__main__":
+    main()
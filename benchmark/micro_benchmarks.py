@@ -0,0 +1,94 @@
+import argparse
+import statistics
+import time
+
+from library.extract_helper import EXTRACTOR_HTML5LIB, EXTRACTOR_LXML, extract_sections_from_chunks
+from library.llm_helper import LLMHelper
+from library.other_helper import OtherHelper
+from benchmark.fixtures import generate_article_html
+from benchmark.mock_servers import MockAr5ivServer, start_server
+from benchmark.stub_llm_server import start_stub_llm_server
+
+
+# CONSTANTS
+CHUNK_SIZE = 64 * 1024
+
+
+def measure(func, repeat):
+    """
+    Calls a function repeatedly.
+
+    Args:
+        func (callable): The function, without arguments.
+        repeat (int): Number of calls.
+
+    Returns:
+        tuple: The median and the minimum duration in seconds, and the result of the last call.
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), min(durations), result
+
+
+def benchmark_parse(html, repeat):
+    """
+    Measures the extraction of the section texts of a page with every extractor backend.
+    """
+    chunks = [html[i:i + CHUNK_SIZE] for i in range(0, len(html), CHUNK_SIZE)]
+    for extractor in (EXTRACTOR_LXML, EXTRACTOR_HTML5LIB):
+        median, best, (sections, _) = measure(
+            lambda: extract_sections_from_chunks(iter(chunks), extractor=extractor), repeat)
+        print(f"parse[{extractor}]".ljust(24) + f"{median * 1000:9.1f} ms  (min {best * 1000:.1f} ms)  "
+              f"{len(html) / median / 2**20:7.1f} MB/s  {sum(len(s) for s in sections)} chars")
+
+
+def benchmark_fetch(ar5iv_url, arxiv_id, repeat, max_chars):
+    """
+    Measures download and extraction of a page from the mock ar5iv, without article cache.
+    """
+    other = OtherHelper(ar5iv_url=ar5iv_url)
+    median, best, text = measure(lambda: other.get_rendered_text_for_arxiv_id(arxiv_id, max_chars=max_chars), repeat)
+    print("fetch+parse".ljust(24) + f"{median * 1000:9.1f} ms  (min {best * 1000:.1f} ms)  {len(text)} chars")
+
+
+def benchmark_llm_stream(llm_url, repeat):
+    """
+    Measures how fast the tokens of a streamed LLM response are consumed, against the stub
+    without delays, i.e. the client-side overhead per token.
+    """
+    llm = LLMHelper(llm_api_url=llm_url)
+    median, best, response = measure(
+        lambda: sum(1 for _ in llm.ask_llm_stream("Summarize: " + "word " * 200, model=llm.LLM_TO_USE)), repeat)
+    print("llm stream".ljust(24) + f"{median * 1000:9.1f} ms  (min {best * 1000:.1f} ms)  "
+          f"{response / median:9.0f} tokens/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro benchmarks of parsing, fetching and LLM stream consumption.")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--sections", type=int, default=20, help="Sections of the generated page")
+    parser.add_argument("--paragraphs", type=int, default=6, help="Paragraphs per section of the generated page")
+    parser.add_argument("--formulas", type=int, default=4, help="Inline formulas per paragraph of the generated page")
+    parser.add_argument("--max-chars", type=int, default=10000, help="Character budget of the fetch benchmark")
+    args = parser.parse_args()
+
+    page_options = {"sections": args.sections, "paragraphs": args.paragraphs, "formulas": args.formulas}
+    arxiv_id = "2101.00001"
+    html = generate_article_html(arxiv_id, **page_options)
+    print(f"Page of {len(html) / 1024:.0f} KiB, {args.repeat} runs each")
+
+    benchmark_parse(html, args.repeat)
+
+    ar5iv = MockAr5ivServer(("127.0.0.1", 0), latency=0, **page_options)
+    benchmark_fetch(start_server(ar5iv) + "/html/", arxiv_id, args.repeat, args.max_chars)
+
+    _, llm_url = start_stub_llm_server(token_delay=0, prefill_delay_per_1k_chars=0)
+    benchmark_llm_stream(llm_url, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from html import escape
+from urllib.parse import urlparse, parse_qs
+
+from benchmark.fixtures import generate_article_html
+from benchmark.stub_llm_server import start_stub_llm_server
+from library.wiki_helper import WIKI_PID_FOR_ARXIV_ID
+
+
+# CONSTANTS
+# Page of ar5iv for articles whose conversion failed
+FAILURE_PAGE = (b'<!DOCTYPE html><html><head><title>ar5iv</title></head><body><div class="ltx_page_main">'
+                b'<p>Conversion to HTML had a Fatal error and exited abruptly. '
+                b'This document may be truncated or damaged.</p></div></body></html>')
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Base request handler of the mock servers: quiet, keep-alive, JSON and html responses
+    after the configured latency.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        """
+        Sends a complete response after the latency of the server.
+        """
+        time.sleep(self.server.LATENCY)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data):
+        self.send_body(json.dumps(data).encode('utf-8'), 'application/json')
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Base server of the mock servers, handling every request in its own thread.
+    """
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients close connections early, e.g. once the character budget of a page is extracted
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockWikiHandler(MockHandler):
+    """
+    Request handler that imitates the Wikibase API of the portal: wbgetentities and wbgetclaims
+    for items whose arXiv id is derived from the QID, login and CSRF tokens, wbeditentity,
+    whose statements are stored and returned by later reads, and the recent changes of the items.
+    """
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        action = params.get('action')
+
+        if action == 'wbgetentities':
+            entities = {qid: self.server.get_entity(qid) for qid in params.get('ids', '').split('|') if qid}
+            if 'claims' not in params.get('props', 'claims').split('|'):
+                for entity in entities.values():
+                    entity.pop('claims', None)
+            self.send_json({'entities': entities, 'success': 1})
+        elif action == 'wbgetclaims' and params.get('claim'):
+            claims = self.server.get_entity(params['claim'].split('$')[0])['claims']
+            self.send_json({'claims': {property_id: [claim for claim in property_claims if claim['id'] == params['claim']]
+                                       for property_id, property_claims in claims.items()}})
+        elif action == 'wbgetclaims':
+            claims = self.server.get_entity(params.get('entity', ''))['claims']
+            if params.get('property'):
+                claims = {params['property']: claims.get(params['property'], [])}
+            self.send_json({'claims': claims})
+        elif action == 'query' and params.get('list') == 'recentchanges':
+            self.send_json(self.server.get_recent_changes(params))
+        elif action == 'query' and params.get('meta') == 'tokens':
+            token_type = params.get('type', 'csrf')
+            self.send_json({'query': {'tokens': {f'{token_type}token': uuid.uuid4().hex + '+\\'}}})
+        else:
+            self.send_json({'error': {'code': 'badvalue', 'info': f"Unsupported action {action}"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        action = params.get('action')
+
+        if action == 'login':
+            self.send_json({'login': {'result': 'Success', 'lgusername': params.get('lgname')}})
+        elif action == 'wbeditentity':
+            self.send_json(self.server.edit_entity(params['id'], json.loads(params['data'])))
+        else:
+            self.send_json({'error': {'code': 'badvalue', 'info': f"Unsupported action {action}"}})
+
+
+class MockWikiServer(MockServer):
+    """
+    HTTP server with the MockWikiHandler and the items in memory.
+    """
+
+    def __init__(self, address, latency=0.01):
+        """
+        Initializes the MockWikiServer.
+
+        Args:
+            address (tuple): Host and port to listen on, port 0 picks a free port.
+            latency (float): Seconds before each response.
+        """
+        super().__init__(address, MockWikiHandler)
+        self.LATENCY = latency
+        self.LOCK = threading.Lock()
+        self.ENTITIES = {}
+        self.RECENT_CHANGES = []
+        self.edits = 0
+
+    @staticmethod
+    def get_arxiv_id(qid):
+        """
+        Returns the arXiv id of an item, derived from its number.
+        """
+        return f"2101.{int(qid[1:]) % 100000:05d}"
+
+    def get_entity(self, qid):
+        """
+        Returns an item, created on first access with its arXiv id statement.
+        """
+        if not qid[1:].isdigit():
+            return {'id': qid, 'missing': ''}
+
+        with self.LOCK:
+            if qid not in self.ENTITIES:
+                self.ENTITIES[qid] = {
+                    'type': 'item',
+                    'id': qid,
+                    'lastrevid': 1,
+                    'claims': {WIKI_PID_FOR_ARXIV_ID: [{
+                        'id': f"{qid}${uuid.uuid4()}",
+                        'type': 'statement',
+                        'rank': 'normal',
+                        'mainsnak': {'snaktype': 'value', 'property': WIKI_PID_FOR_ARXIV_ID,
+                                     'datavalue': {'type': 'string', 'value': self.get_arxiv_id(qid)}},
+                    }]},
+                }
+            return json.loads(json.dumps(self.ENTITIES[qid]))
+
+    def add_recent_change(self, qid, change_type='edit'):
+        """
+        Records a change of an item, e.g. to imitate an import.
+        """
+        with self.LOCK:
+            self.RECENT_CHANGES.append({
+                'type': change_type,
+                'title': f"Item:{qid}",
+                'rcid': len(self.RECENT_CHANGES) + 1,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            })
+
+    def get_recent_changes(self, params):
+        """
+        Returns the response of a recentchanges query, oldest first, with rcstart, rccontinue and rclimit.
+        """
+        limit = int(params.get('rclimit', 10))
+        with self.LOCK:
+            changes = [change for change in self.RECENT_CHANGES if change['timestamp'] >= params.get('rcstart', '')]
+        if 'rccontinue' in params:
+            first_rcid = int(params['rccontinue'].split('|')[1])
+            changes = [change for change in changes if change['rcid'] >= first_rcid]
+
+        response = {'batchcomplete': '', 'query': {'recentchanges': changes[:limit]}}
+        if len(changes) > limit:
+            response['continue'] = {'rccontinue': f"{changes[limit]['timestamp']}|{changes[limit]['rcid']}",
+                                    'continue': '-||'}
+        return response
+
+    def edit_entity(self, qid, data):
+        """
+        Stores the statements of a wbeditentity request. A statement replaces all statements of its property.
+
+        Returns:
+            dict: The API response.
+        """
+        self.get_entity(qid)
+        with self.LOCK:
+            entity = self.ENTITIES[qid]
+            for claim in data.get('claims', []):
+                claim.setdefault('id', f"{qid}${uuid.uuid4()}")
+                entity['claims'][claim['mainsnak']['property']] = [claim]
+            entity['lastrevid'] += 1
+            self.edits += 1
+            response = {'entity': json.loads(json.dumps(entity)), 'success': 1}
+        self.add_recent_change(qid)
+        return response
+
+
+class MockAr5ivHandler(MockHandler):
+    """
+    Request handler that serves generated ar5iv-like article pages under /html/<arxiv id>,
+    with ETags for conditional requests, and their abstracts like the arXiv export API under /api/query.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/api/query':
+            arxiv_id = parse_qs(url.query).get('id_list', [''])[0]
+            self.send_body(self.server.get_abstract_feed(arxiv_id), 'application/atom+xml; charset=utf-8')
+            return
+        if not url.path.startswith('/html/'):
+            self.send_body(b'Not found', 'text/plain', status=404)
+            return
+
+        arxiv_id = url.path[len('/html/'):]
+        time.sleep(self.server.SLOW_IDS.get(arxiv_id, 0))
+        if arxiv_id in self.server.FAILING_IDS:
+            self.send_body(FAILURE_PAGE, 'text/html; charset=utf-8')
+            return
+
+        html = self.server.get_page(arxiv_id)
+        etag = '"' + hashlib.sha256(html).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_body(b'', 'text/html', status=304, headers={'ETag': etag})
+            return
+
+        self.send_body(html, 'text/html; charset=utf-8', headers={'ETag': etag})
+
+
+class MockAr5ivServer(MockServer):
+    """
+    HTTP server with the MockAr5ivHandler. Pages are generated once per arXiv id, see
+    benchmark.fixtures.generate_article_html. Articles in FAILING_IDS are served as conversion
+    failure pages, articles in SLOW_IDS after an additional delay, e.g. to exercise hedged requests.
+    """
+
+    def __init__(self, address, latency=0.05, sections=8, paragraphs=5, formulas=3):
+        """
+        Initializes the MockAr5ivServer.
+
+        Args:
+            address (tuple): Host and port to listen on, port 0 picks a free port.
+            latency (float): Seconds before each response.
+            sections (int): Number of sections per page.
+            paragraphs (int): Number of paragraphs per section.
+            formulas (int): Number of inline formulas per paragraph.
+        """
+        super().__init__(address, MockAr5ivHandler)
+        self.LATENCY = latency
+        self.PAGE_OPTIONS = {'sections': sections, 'paragraphs': paragraphs, 'formulas': formulas}
+        self.LOCK = threading.Lock()
+        self.PAGES = {}
+        self.FAILING_IDS = set()
+        self.SLOW_IDS = {}
+
+    def get_page(self, arxiv_id):
+        with self.LOCK:
+            if arxiv_id not in self.PAGES:
+                self.PAGES[arxiv_id] = generate_article_html(arxiv_id, **self.PAGE_OPTIONS)
+            return self.PAGES[arxiv_id]
+
+    @staticmethod
+    def get_abstract_feed(arxiv_id):
+        """
+        Returns an Atom feed like the arXiv export API, with an error entry for invalid ids.
+        """
+        if not arxiv_id:
+            entry = ('<entry><id>http://arxiv.org/api/errors#incorrect_id_format</id><title>Error</title>'
+                     '<summary>incorrect id format</summary></entry>')
+        else:
+            entry = (f'<entry><id>http://arxiv.org/abs/{escape(arxiv_id)}v1</id>'
+                     f'<title>On the spectrum of a bounded operator ({escape(arxiv_id)})</title>'
+                     '<summary>We show that the operator is bounded on every compact subset of the domain '
+                     'and that its spectrum consists of eigenvalues with finite multiplicity.</summary></entry>')
+        return f'<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom">{entry}</feed>'.encode('utf-8')
+
+
+def start_server(server):
+    """
+    Runs a server in a background thread.
+
+    Returns:
+        str: The base url of the server.
+    """
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def start_mock_servers(host="127.0.0.1", wiki_latency=0.01, ar5iv_latency=0.05, token_delay=0.02,
+                       prefill_delay_per_1k_chars=0.05, page_options=None):
+    """
+    Starts mock servers for the wiki, ar5iv, arxiv.org (html pages and export API) and Ollama on free ports.
+
+    Args:
+        host (str): Host to listen on.
+        wiki_latency (float): Seconds before each wiki response.
+        ar5iv_latency (float): Seconds before each article page.
+        token_delay (float): Seconds per generated LLM token.
+        prefill_delay_per_1k_chars (float): Seconds per 1000 characters of an LLM prompt.
+        page_options (dict): Size of the generated pages, see MockAr5ivServer.
+
+    Returns:
+        dict: The servers ("wiki", "ar5iv", "arxiv", "llm") and the urls to configure the service with
+              ("WIKI_API_URL", "AR5IV_URL", "ARXIV_HTML_URL", "ARXIV_ABSTRACT_URL", "LLM_API_URL").
+    """
+    wiki = MockWikiServer((host, 0), latency=wiki_latency)
+    ar5iv = MockAr5ivServer((host, 0), latency=ar5iv_latency, **(page_options or {}))
+    arxiv = MockAr5ivServer((host, 0), latency=ar5iv_latency, **(page_options or {}))
+    arxiv_url = start_server(arxiv)
+    llm, llm_url = start_stub_llm_server(host=host, token_delay=token_delay,
+                                         prefill_delay_per_1k_chars=prefill_delay_per_1k_chars)
+    return {
+        "wiki": wiki,
+        "ar5iv": ar5iv,
+        "arxiv": arxiv,
+        "llm": llm,
+        "WIKI_API_URL": start_server(wiki) + "/api.php",
+        "AR5IV_URL": start_server(ar5iv) + "/html/",
+        "ARXIV_HTML_URL": arxiv_url + "/html/",
+        "ARXIV_ABSTRACT_URL": arxiv_url + "/api/query",
+        "LLM_API_URL": llm_url,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock servers of the wiki, ar5iv and Ollama for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--wiki-latency", type=float, default=0.01, help="Seconds before each wiki response")
+    parser.add_argument("--ar5iv-latency", type=float, default=0.05, help="Seconds before each article page")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per generated token")
+    parser.add_argument("--prefill-delay", type=float, default=0.05, help="Seconds per 1000 prompt characters")
+    args = parser.parse_args()
+
+    servers = start_mock_servers(host=args.host, wiki_latency=args.wiki_latency, ar5iv_latency=args.ar5iv_latency,
+                                 token_delay=args.token_delay, prefill_delay_per_1k_chars=args.prefill_delay)
+    print("Configure the service with:")
+    for name in ("WIKI_API_URL", "AR5IV_URL", "ARXIV_HTML_URL", "ARXIV_ABSTRACT_URL", "LLM_API_URL"):
+        print(f"  export {name}={servers[name]}")
+    threading.Event().wait()
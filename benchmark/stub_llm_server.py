@@ -0,0 +1,185 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# CONSTANTS
+# Number of sentences the stub writes for prompts that ask for about 5 sentences, and for all others
+CONCISE_SENTENCES = 5
+LONG_SENTENCES = 12
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Request handler that imitates the /api/generate endpoint of Ollama. The response is made up of
+    sentences of the article in the prompt and streamed as NDJSON, one word per token, with delays
+    that model the prompt processing and the token generation of a real LLM. Like a chatty model,
+    the stub appends a second paragraph after the summary, which a stop sequence can cut off.
+    The options num_predict and stop are honored. Like Ollama, the final line carries a context,
+    and a request with a context continues from it: only the new prompt is processed, and the
+    previous response is the source of the new one. GET requests (health checks) are answered with 200.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # Health checks probe /api/tags
+        body = json.dumps({'models': []}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request_data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = request_data.get('prompt', '')
+        options = request_data.get('options') or {}
+        previous_response = self.server.get_context_response(request_data.get('context'))
+
+        tokens = self.server.generate_tokens(prompt, options, previous_response)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        start = time.perf_counter()
+        time.sleep(self.server.PREFILL_DELAY_PER_1K_CHARS * len(prompt) / 1000)
+        eval_start = time.perf_counter()
+        for token in tokens:
+            time.sleep(self.server.TOKEN_DELAY)
+            self.write_chunk({'model': request_data.get('model'), 'response': token, 'done': False})
+        end = time.perf_counter()
+
+        self.write_chunk({
+            'model': request_data.get('model'),
+            'response': '',
+            'done': True,
+            'prompt_eval_count': len(prompt) // 4,
+            'eval_count': len(tokens),
+            'eval_duration': int((end - eval_start) * 1e9),
+            'total_duration': int((end - start) * 1e9),
+            'context': self.server.add_context("".join(tokens)),
+        })
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        """
+        Writes one NDJSON line as HTTP chunk.
+        """
+        line = (json.dumps(data) + '\n').encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    HTTP server with the StubLLMHandler.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, token_delay=0.02, prefill_delay_per_1k_chars=0.05):
+        """
+        Initializes the StubLLMServer.
+
+        Args:
+            address (tuple): Host and port to listen on, port 0 picks a free port.
+            token_delay (float): Seconds per generated token.
+            prefill_delay_per_1k_chars (float): Seconds per 1000 characters of the prompt.
+        """
+        super().__init__(address, StubLLMHandler)
+        self.TOKEN_DELAY = token_delay
+        self.PREFILL_DELAY_PER_1K_CHARS = prefill_delay_per_1k_chars
+        self.LOCK = threading.Lock()
+        self.CONTEXTS = {}
+
+    def add_context(self, response):
+        """
+        Stores a response and returns its context. The first number identifies the response, the
+        others pad the context to the length of a real one (one number per 4 characters).
+        """
+        with self.LOCK:
+            context_id = len(self.CONTEXTS) + 1
+            self.CONTEXTS[context_id] = response
+        return [context_id] + [0] * (len(response) // 4)
+
+    def get_context_response(self, context):
+        """
+        Returns the response of a context, or None for no or an unknown context.
+        """
+        if not context:
+            return None
+        with self.LOCK:
+            return self.CONTEXTS.get(context[0])
+
+    @staticmethod
+    def generate_tokens(prompt, options, previous_response=None):
+        """
+        Generates the response tokens for a prompt.
+
+        Args:
+            prompt (str): The prompt. The text after the last blank lines is used as source.
+            options (dict): The generation options.
+            previous_response (str): The response of the context the request continues from,
+                used as source instead of the prompt.
+
+        Returns:
+            list: The tokens.
+        """
+        source = previous_response or prompt.split("\n \n \n")[-1]
+        sentences = [sentence for sentence in re.split(r'(?<=[.!?])\s+', source) if sentence.strip()] or ["Nothing."]
+        count = CONCISE_SENTENCES if "5 sentences" in prompt else LONG_SENTENCES
+        start = "This article" if "This article" in prompt else "This paper is about"
+
+        summary = [start + " " + sentences[0]] + [sentences[i % len(sentences)] for i in range(1, count)]
+        text = " ".join(summary) + "\n\nNote: " + " ".join(sentences[:3])
+
+        for stop in options.get('stop', []):
+            if stop in text:
+                text = text[:text.index(stop)]
+
+        tokens = re.findall(r'\S+\s*|\s+', text)
+        if options.get('num_predict'):
+            tokens = tokens[:options['num_predict']]
+        return tokens
+
+
+def start_stub_llm_server(host="127.0.0.1", port=0, token_delay=0.02, prefill_delay_per_1k_chars=0.05):
+    """
+    Starts a StubLLMServer in a background thread.
+
+    Args:
+        host (str): Host to listen on.
+        port (int): Port to listen on, 0 picks a free port.
+        token_delay (float): Seconds per generated token.
+        prefill_delay_per_1k_chars (float): Seconds per 1000 characters of the prompt.
+
+    Returns:
+        tuple: The server and the url of its generate endpoint.
+    """
+    server = StubLLMServer((host, port), token_delay=token_delay,
+                           prefill_delay_per_1k_chars=prefill_delay_per_1k_chars)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/api/generate"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub of the Ollama generate API for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per generated token")
+    parser.add_argument("--prefill-delay", type=float, default=0.05, help="Seconds per 1000 prompt characters")
+    args = parser.parse_args()
+
+    server = StubLLMServer((args.host, args.port), token_delay=args.token_delay,
+                           prefill_delay_per_1k_chars=args.prefill_delay)
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/api/generate")
+    server.serve_forever()
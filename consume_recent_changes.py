@@ -0,0 +1,31 @@
+import signal
+from datetime import datetime, timezone
+
+from library import config_helper as config
+from library.recent_changes_helper import RecentChangesConsumer
+from library.wiki_helper import WikiHelper
+
+import logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("update-trigger-rest")
+
+# Initialize helpers
+wiki = WikiHelper( wiki_api_url=config.WIKI_API_URL, http_options=config.HTTP_OPTIONS )
+consumer = RecentChangesConsumer( wiki, config.SERVICE_URL, checkpoint_path=config.RC_CHECKPOINT_PATH,
+                                  # Without checkpoint and RC_START, only changes from now on are consumed
+                                  start=config.RC_START or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                  rate=config.RC_RATE, batch_size=config.RC_BATCH_SIZE,
+                                  poll_interval=config.RC_POLL_INTERVAL, mode=config.RC_SUMMARY_MODE,
+                                  write=config.RC_WRITE,
+                                  exclude_user=config.RC_EXCLUDE_USER,
+                                  http_options={**config.HTTP_OPTIONS, "read_timeout": config.LLM_READ_TIMEOUT} )
+
+
+
+if __name__ == "__main__":
+    # Stop after the current batch, the checkpoint is then up to date
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: consumer.stop())
+
+    logger.info(f"Consuming recent changes of {config.WIKI_API_URL} for {config.SERVICE_URL}")
+    consumer.run()
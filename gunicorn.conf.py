@@ -0,0 +1,53 @@
+import os
+import signal
+
+# Production server for app.py, a preforking gunicorn with threaded workers:
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The jobs are shared by the worker processes through the work ledger, so that every worker
+# answers the status requests of every job.
+os.environ.setdefault("JOB_LEDGER_PATH", "cache/jobs.sqlite3")
+
+from library import config_helper as config
+
+
+bind = config.SERVER_BIND
+workers = config.SERVER_WORKERS
+worker_class = "gthread"
+threads = config.SERVER_THREADS
+
+# The app and its helpers are created once in the main process and shared by the forked workers
+preload_app = True
+
+# Streamed summaries and batch requests take minutes; workers whose main loop hangs are still restarted
+timeout = 60
+graceful_timeout = config.DRAIN_TIMEOUT
+keepalive = 5
+
+
+def post_worker_init(worker):
+    """
+    Prepares a forked worker: re-creates the HTTP sessions and starts the background threads (see
+    app.init_process). On SIGTERM the worker stops accepting summary jobs at once, while gunicorn
+    finishes the requests in flight.
+    """
+    import app
+
+    app.init_process()
+
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        app.start_draining()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+def worker_exit(server, worker):
+    """
+    Waits for the summary jobs of an exiting worker, until DRAIN_TIMEOUT seconds after SIGTERM.
+    """
+    import app
+
+    app.drain()
@@ -0,0 +1,631 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from collections import OrderedDict
+from contextlib import closing
+
+
+class ArticleCache:
+    """
+    A persistent cache for extracted article texts (as list of section texts), stored compressed in SQLite.
+    Entries are keyed by arXiv id (including the version, if given) and remember the
+    ETag/Last-Modified headers and the source of the page they were extracted from, so that
+    expired entries can be revalidated with a conditional request to that source. Texts extracted with a
+    character budget are stored as incomplete and only serve requests within that budget.
+    """
+
+    def __init__(self, db_path="cache/articles.sqlite3", max_size_bytes=1024 ** 3, ttl_seconds=7 * 24 * 3600):
+        """
+        Initializes the ArticleCache.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+            max_size_bytes (int): Maximum total size of the compressed texts. Least recently
+                used entries are evicted beyond that.
+            ttl_seconds (int): Time after which an entry has to be revalidated.
+        """
+        self.DB_PATH = db_path
+        self.MAX_SIZE_BYTES = max_size_bytes
+        self.TTL_SECONDS = ttl_seconds
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                " key TEXT PRIMARY KEY,"
+                " text BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " validated REAL NOT NULL,"
+                " accessed REAL NOT NULL,"
+                " complete INTEGER NOT NULL DEFAULT 1,"
+                " source TEXT)"
+            )
+            # Databases created before texts could be truncated
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(articles)")]
+            if 'complete' not in columns:
+                conn.execute("ALTER TABLE articles ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+            # Databases created before articles had several sources
+            if 'source' not in columns:
+                conn.execute("ALTER TABLE articles ADD COLUMN source TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS articles_accessed ON articles (accessed)")
+
+    def _connect(self):
+        """
+        Opens a new database connection. Connections are not shared between threads or processes.
+        """
+        return sqlite3.connect(self.DB_PATH, timeout=30)
+
+    def get(self, key):
+        """
+        Returns a cache entry and marks it as recently used.
+
+        Args:
+            key (str): The arXiv id.
+
+        Returns:
+            dict: The entry with the keys "sections", "etag", "last_modified", "source" (the
+                  source the page came from, None for old entries), "fresh" (False if the entry
+                  has to be revalidated) and "complete" (False if the text was truncated), or
+                  None if not cached.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT text, etag, last_modified, validated, complete, source FROM articles WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE articles SET accessed = ? WHERE key = ?", (now, key))
+
+        text, etag, last_modified, validated, complete, source = row
+        return {
+            'sections': self._decode_sections(zlib.decompress(text).decode('utf-8')),
+            'etag': etag,
+            'last_modified': last_modified,
+            'source': source,
+            'fresh': now - validated < self.TTL_SECONDS,
+            'complete': bool(complete),
+        }
+
+    def put(self, key, sections, etag=None, last_modified=None, complete=True, source=None):
+        """
+        Stores the text for a key and evicts least recently used entries if the cache is too large.
+
+        Args:
+            key (str): The arXiv id.
+            sections (list): The extracted section texts.
+            etag (str): The ETag header of the page, if any.
+            last_modified (str): The Last-Modified header of the page, if any.
+            complete (bool): False if the text was truncated to a character budget.
+            source (str): The source the page came from, see source_helper. The ETag and
+                Last-Modified headers are only valid for that source.
+        """
+        now = time.time()
+        compressed = zlib.compress(json.dumps(sections).encode('utf-8'))
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO articles"
+                " (key, text, size, etag, last_modified, validated, accessed, complete, source)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, compressed, len(compressed), etag, last_modified, now, now, int(complete), source)
+            )
+            self._evict(conn)
+
+    def mark_validated(self, key):
+        """
+        Marks an entry as fresh again, e.g. after the server answered a conditional request with 304.
+
+        Args:
+            key (str): The arXiv id.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE articles SET validated = ?, accessed = ? WHERE key = ?", (now, now, key))
+
+    @staticmethod
+    def _decode_sections(data):
+        """
+        Decodes the stored section texts. Entries written before texts were split into
+        sections contain the plain text.
+        """
+        try:
+            sections = json.loads(data)
+        except ValueError:
+            sections = None
+        return sections if isinstance(sections, list) else [data]
+
+    def _evict(self, conn):
+        """
+        Deletes least recently used entries until the total size is below MAX_SIZE_BYTES.
+        """
+        total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM articles").fetchone()[0]
+        if total_size <= self.MAX_SIZE_BYTES:
+            return
+
+        for key, size in conn.execute("SELECT key, size FROM articles ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM articles WHERE key = ?", (key,))
+            logging.debug(f"Evicted {key} from article cache")
+            total_size -= size
+            if total_size <= self.MAX_SIZE_BYTES:
+                break
+
+
+class SummaryIndex:
+    """
+    A local index of the generated summaries, stored in SQLite. Every summary is stored with
+    the fingerprint of its input (see LLMHelper.get_summary_fingerprint), so that a repeated
+    request for an unchanged article can be answered without calling the LLM again.
+    """
+
+    def __init__(self, db_path="cache/summaries.sqlite3"):
+        """
+        Initializes the SummaryIndex.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self.DB_PATH = db_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " key TEXT PRIMARY KEY,"
+                " fingerprint TEXT NOT NULL,"
+                " summary TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        """
+        Opens a new database connection. Connections are not shared between threads or processes.
+        """
+        return sqlite3.connect(self.DB_PATH, timeout=30)
+
+    def get(self, key, fingerprint):
+        """
+        Returns the stored summary, if it was generated from an input with the given fingerprint.
+
+        Args:
+            key (str): The QID and summary mode, e.g. "Q92247:two_pass".
+            fingerprint (str): The fingerprint of the current input.
+
+        Returns:
+            str: The summary, or None if there is none for this input.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT summary FROM summaries WHERE key = ? AND fingerprint = ?", (key, fingerprint)
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def put(self, key, fingerprint, summary):
+        """
+        Stores a summary with the fingerprint of its input, replacing older summaries for the key.
+
+        Args:
+            key (str): The QID and summary mode, e.g. "Q92247:two_pass".
+            fingerprint (str): The fingerprint of the input.
+            summary (str): The summary.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, fingerprint, summary, created) VALUES (?, ?, ?, ?)",
+                (key, fingerprint, summary, time.time())
+            )
+
+
+class LLMResponseCache:
+    """
+    A persistent cache for LLM responses, stored in SQLite. Entries are keyed by a hash of the model,
+    the prompt and the generation options, so that identical requests are answered without the LLM.
+    Entries older than max_age_seconds are dropped, and least recently used entries are evicted
+    beyond max_size_bytes. Hits and misses are counted per process.
+    """
+
+    def __init__(self, db_path="cache/llm_responses.sqlite3", max_size_bytes=256 * 1024 ** 2,
+                 max_age_seconds=30 * 24 * 3600):
+        """
+        Initializes the LLMResponseCache.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+            max_size_bytes (int): Maximum total size of the responses.
+            max_age_seconds (int): Time after which a response is not used anymore.
+        """
+        self.DB_PATH = db_path
+        self.MAX_SIZE_BYTES = max_size_bytes
+        self.MAX_AGE_SECONDS = max_age_seconds
+        self.LOCK = threading.Lock()
+        self.HITS = 0
+        self.MISSES = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _connect(self):
+        """
+        Opens a new database connection. Connections are not shared between threads or processes.
+        """
+        return sqlite3.connect(self.DB_PATH, timeout=30)
+
+    @staticmethod
+    def get_key(model, prompt, options=None):
+        """
+        Returns the cache key of a request.
+
+        Args:
+            model (str): The model.
+            prompt (str): The prompt.
+            options (dict): The generation options, or None.
+
+        Returns:
+            str: The key as hex digest.
+        """
+        return hashlib.sha256(json.dumps([model, prompt, options], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt, options=None):
+        """
+        Returns the cached response of a request and marks it as recently used.
+
+        Args:
+            model (str): The model.
+            prompt (str): The prompt.
+            options (dict): The generation options, or None.
+
+        Returns:
+            str: The response, or None if not cached.
+        """
+        key = self.get_key(model, prompt, options)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created > ?", (key, now - self.MAX_AGE_SECONDS)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+
+        with self.LOCK:
+            if row is None:
+                self.MISSES += 1
+            else:
+                self.HITS += 1
+
+        return row[0] if row else None
+
+    def put(self, model, prompt, response, options=None):
+        """
+        Stores the response of a request and evicts expired and least recently used entries.
+
+        Args:
+            model (str): The model.
+            prompt (str): The prompt.
+            response (str): The response.
+            options (dict): The generation options, or None.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.get_key(model, prompt, options), model, response, len(response.encode('utf-8')), now, now)
+            )
+            conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.MAX_AGE_SECONDS,))
+            self._evict(conn)
+
+    def get_stats(self):
+        """
+        Returns the hit and miss counters of this process and the size of the cache.
+
+        Returns:
+            dict: The keys "hits", "misses", "hit_ratio", "entries" and "size_bytes".
+        """
+        with closing(self._connect()) as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+        with self.LOCK:
+            hits, misses = self.HITS, self.MISSES
+
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+            'entries': entries,
+            'size_bytes': size,
+        }
+
+    def _evict(self, conn):
+        """
+        Deletes least recently used entries until the total size is below MAX_SIZE_BYTES.
+        """
+        total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.MAX_SIZE_BYTES:
+            return
+
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            if total_size <= self.MAX_SIZE_BYTES:
+                break
+
+
+class EntityCache:
+    """
+    A cache for the claims of wiki items, kept in memory and optionally shared on disk in SQLite
+    (e.g. between the workers of a server). Entries remember the lastrevid of the item: within
+    ttl_seconds after the last validation they are served without any request, afterwards the
+    WikiHelper compares the lastrevid with the wiki and only fetches the claims again if the item
+    has changed. Edit responses update the entries in place. Least recently used entries are
+    evicted beyond max_entries, in memory and on disk.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=30, db_path=None):
+        """
+        Initializes the EntityCache.
+
+        Args:
+            max_entries (int): Maximum number of cached items.
+            ttl_seconds (int): Time after which an entry has to be revalidated.
+            db_path (str): Path to the SQLite database file, or None to keep the entries in memory only.
+        """
+        self.MAX_ENTRIES = max_entries
+        self.TTL_SECONDS = ttl_seconds
+        self.DB_PATH = db_path
+        self.LOCK = threading.Lock()
+        self.HITS = 0
+        self.MISSES = 0
+
+        # Entries by item ID, least recently used first
+        self.ENTRIES = OrderedDict()
+
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entities ("
+                    " item_id TEXT PRIMARY KEY,"
+                    " claims BLOB NOT NULL,"
+                    " lastrevid INTEGER,"
+                    " validated REAL NOT NULL,"
+                    " accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS entities_accessed ON entities (accessed)")
+
+    def _connect(self):
+        """
+        Opens a new database connection. Connections are not shared between threads or processes.
+        """
+        return sqlite3.connect(self.DB_PATH, timeout=30)
+
+    def get(self, item_id):
+        """
+        Returns a cache entry and marks it as recently used. The claims must not be modified.
+
+        Args:
+            item_id (str): The ID of the item.
+
+        Returns:
+            dict: The entry with the keys "claims", "lastrevid" (None if the claims were updated from
+                  an edit response and have to be fetched again once stale) and "fresh" (False if the
+                  entry has to be revalidated), or None if not cached.
+        """
+        entry = self._lookup(item_id)
+        fresh = entry is not None and time.time() - entry['validated'] < self.TTL_SECONDS
+        with self.LOCK:
+            if fresh:
+                self.HITS += 1
+            else:
+                self.MISSES += 1
+
+        if entry is None:
+            return None
+        return {'claims': entry['claims'], 'lastrevid': entry['lastrevid'], 'fresh': fresh}
+
+    def put(self, item_id, claims, lastrevid):
+        """
+        Stores the claims of an item as validated now.
+
+        Args:
+            item_id (str): The ID of the item.
+            claims (dict): The claims by property ID, as returned by wbgetentities.
+            lastrevid (int): The revision the claims were read from, or None if unknown.
+        """
+        self._store(item_id, {'claims': claims, 'lastrevid': lastrevid, 'validated': time.time()})
+
+    def mark_validated(self, item_id):
+        """
+        Marks an entry as fresh again, e.g. after the wiki returned the same lastrevid.
+
+        Args:
+            item_id (str): The ID of the item.
+        """
+        now = time.time()
+        with self.LOCK:
+            entry = self.ENTRIES.get(item_id)
+            if entry is not None:
+                self.ENTRIES[item_id] = {**entry, 'validated': now}
+
+        if self.DB_PATH:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("UPDATE entities SET validated = ? WHERE item_id = ?", (now, item_id))
+
+    def update_claims(self, item_id, claims, lastrevid):
+        """
+        Replaces the claims of some properties of a cached item, e.g. from the entity returned by wbeditentity.
+        Uncached items are stored if the lastrevid is known.
+
+        Args:
+            item_id (str): The ID of the item.
+            claims (dict): The new claims by property ID.
+            lastrevid (int): The revision of the item after the edit, or None if unknown.
+        """
+        entry = self._lookup(item_id)
+        if entry is None:
+            if lastrevid is not None:
+                self.put(item_id, claims, lastrevid)
+            return
+
+        self.put(item_id, {**entry['claims'], **claims}, lastrevid)
+
+    def update_claim(self, item_id, claim):
+        """
+        Replaces (or adds) a single claim of a cached item, e.g. from the claim returned by
+        wbcreateclaim, wbsetclaimvalue or wbsetqualifier. These responses do not tell whether the
+        item was changed by others since it was cached, so its claims are fetched again once stale.
+
+        Args:
+            item_id (str): The ID of the item.
+            claim (dict): The claim, with its ID and mainsnak.
+        """
+        entry = self._lookup(item_id)
+        if entry is None:
+            return
+
+        property_id = claim['mainsnak']['property']
+        property_claims = [c for c in entry['claims'].get(property_id, []) if c.get('id') != claim.get('id')]
+        property_claims.append(claim)
+        self.put(item_id, {**entry['claims'], property_id: property_claims}, None)
+
+    def invalidate(self, item_id):
+        """
+        Removes an item, e.g. after an edit whose response does not contain the changed claims.
+
+        Args:
+            item_id (str): The ID of the item.
+        """
+        with self.LOCK:
+            self.ENTRIES.pop(item_id, None)
+
+        if self.DB_PATH:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM entities WHERE item_id = ?", (item_id,))
+
+    def get_stats(self):
+        """
+        Returns the hit and miss counters of this process and the number of items in memory.
+
+        Returns:
+            dict: The keys "hits", "misses", "hit_ratio" and "entries".
+        """
+        with self.LOCK:
+            hits, misses, entries = self.HITS, self.MISSES, len(self.ENTRIES)
+
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+            'entries': entries,
+        }
+
+    def _lookup(self, item_id):
+        """
+        Returns an entry from memory or, if enabled, from disk and marks it as recently used. With a
+        database, an entry in memory is only used while its revision and validation time match the
+        ones on disk, so that writes and invalidations of other processes are seen at once.
+        """
+        with self.LOCK:
+            entry = self.ENTRIES.get(item_id)
+            if entry is not None:
+                self.ENTRIES.move_to_end(item_id)
+
+        if not self.DB_PATH:
+            return entry
+        if entry is not None and self._is_current(item_id, entry):
+            return entry
+        return self._load(item_id)
+
+    def _is_current(self, item_id, entry):
+        """
+        Tells whether an entry in memory matches the one on disk. Reading the two columns by primary
+        key is much cheaper than loading and decompressing the claims.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT lastrevid, validated FROM entities WHERE item_id = ?", (item_id,)).fetchone()
+        return row is not None and row == (entry['lastrevid'], entry['validated'])
+
+    def _load(self, item_id):
+        """
+        Reads an entry from disk into memory.
+        """
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT claims, lastrevid, validated FROM entities WHERE item_id = ?", (item_id,)
+            ).fetchone()
+            if row is None:
+                with self.LOCK:
+                    self.ENTRIES.pop(item_id, None)
+                return None
+            conn.execute("UPDATE entities SET accessed = ? WHERE item_id = ?", (time.time(), item_id))
+
+        claims, lastrevid, validated = row
+        entry = {'claims': json.loads(zlib.decompress(claims).decode('utf-8')), 'lastrevid': lastrevid,
+                 'validated': validated}
+        self._store_in_memory(item_id, entry)
+        return entry
+
+    def _store(self, item_id, entry):
+        """
+        Writes an entry to memory and, if enabled, to disk.
+        """
+        self._store_in_memory(item_id, entry)
+
+        if self.DB_PATH:
+            compressed = zlib.compress(json.dumps(entry['claims']).encode('utf-8'))
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entities (item_id, claims, lastrevid, validated, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (item_id, compressed, entry['lastrevid'], entry['validated'], time.time())
+                )
+                self._evict(conn)
+
+    def _store_in_memory(self, item_id, entry):
+        """
+        Writes an entry to memory and evicts the least recently used entries beyond MAX_ENTRIES.
+        """
+        with self.LOCK:
+            self.ENTRIES[item_id] = entry
+            self.ENTRIES.move_to_end(item_id)
+            while len(self.ENTRIES) > self.MAX_ENTRIES:
+                self.ENTRIES.popitem(last=False)
+
+    def _evict(self, conn):
+        """
+        Deletes least recently used entries on disk beyond MAX_ENTRIES. Entries served from memory
+        are not marked as used on disk, so the order there is the one of the last write or load.
+        """
+        excess = conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0] - self.MAX_ENTRIES
+        if excess > 0:
+            conn.execute("DELETE FROM entities WHERE item_id IN"
+                         " (SELECT item_id FROM entities ORDER BY accessed LIMIT ?)", (excess,))
+            logging.debug(f"Evicted {excess} entities from the entity cache")
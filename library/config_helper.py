@@ -0,0 +1,95 @@
+import os
+import json
+
+from library.llm_helper import (LLM_API_URL, LLM_MAX_ARTICLE_CHARS, SINGLE_PASS_OPTIONS,
+                                SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_CHUNKED, SUMMARY_MODE_SINGLE_PASS)
+from library.ledger_helper import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from library.scheduler_helper import PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_WEIGHTS
+from library.other_helper import AR5IV_URL, ARTICLE_FETCH_TIMEOUT
+from library.source_helper import (SOURCE_AR5IV, SOURCE_ARXIV_HTML, SOURCE_ABSTRACT, ARXIV_HTML_URL, ARXIV_ABSTRACT_URL,
+                                   HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_MAX_DELAY)
+
+
+# Configuration of the service (app.py and app_async.py) and of the recent changes consumer
+# (consume_recent_changes.py), read from environment variables.
+WIKI_API_URL = os.environ.get("WIKI_API_URL", "https://portal.mardi4nfdi.de/api.php")
+AR5IV_URL = os.environ.get("AR5IV_URL", AR5IV_URL)
+ARXIV_HTML_URL = os.environ.get("ARXIV_HTML_URL", ARXIV_HTML_URL)
+ARXIV_ABSTRACT_URL = os.environ.get("ARXIV_ABSTRACT_URL", ARXIV_ABSTRACT_URL)
+SOURCE_URLS = {SOURCE_AR5IV: AR5IV_URL, SOURCE_ARXIV_HTML: ARXIV_HTML_URL, SOURCE_ABSTRACT: ARXIV_ABSTRACT_URL}
+ARTICLE_SOURCES = [(source, SOURCE_URLS[source]) for source in
+                   os.environ.get("ARTICLE_SOURCES", ",".join(SOURCE_URLS)).split(",")]
+ARTICLE_FETCH_TIMEOUT = float(os.environ.get("ARTICLE_FETCH_TIMEOUT", ARTICLE_FETCH_TIMEOUT))
+HEDGE_OPTIONS = {
+    "percentile": float(os.environ.get("HEDGE_PERCENTILE", HEDGE_PERCENTILE)),
+    "min_delay": float(os.environ.get("HEDGE_MIN_DELAY", HEDGE_MIN_DELAY)),
+    "max_delay": float(os.environ.get("HEDGE_MAX_DELAY", HEDGE_MAX_DELAY)),
+}
+LLM_API_URL = os.environ.get("LLM_API_URL", LLM_API_URL)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+JOB_QUEUE_SIZES = {
+    PRIORITY_INTERACTIVE: int(os.environ.get("JOB_QUEUE_SIZE_INTERACTIVE", JOB_QUEUE_SIZE)),
+    PRIORITY_BULK: int(os.environ.get("JOB_QUEUE_SIZE_BULK", JOB_QUEUE_SIZE)),
+}
+PRIORITY_WEIGHTS = {
+    PRIORITY_INTERACTIVE: float(os.environ.get("PRIORITY_WEIGHT_INTERACTIVE", PRIORITY_WEIGHTS[PRIORITY_INTERACTIVE])),
+    PRIORITY_BULK: float(os.environ.get("PRIORITY_WEIGHT_BULK", PRIORITY_WEIGHTS[PRIORITY_BULK])),
+}
+QUEUE_RETRY_AFTER = int(os.environ.get("QUEUE_RETRY_AFTER", 30))
+CLIENT_RATE_LIMIT = float(os.environ.get("CLIENT_RATE_LIMIT", 0))
+CLIENT_RATE_BURST = int(os.environ.get("CLIENT_RATE_BURST", 10))
+CLIENT_ID_HEADER = os.environ.get("CLIENT_ID_HEADER", "")
+STAGE_LIMIT_WIKI = int(os.environ.get("STAGE_LIMIT_WIKI", 4))
+STAGE_LIMIT_FETCH = int(os.environ.get("STAGE_LIMIT_FETCH", 4))
+STAGE_LIMIT_LLM = int(os.environ.get("STAGE_LIMIT_LLM", 2))
+STAGE_LIMIT_WRITE = int(os.environ.get("STAGE_LIMIT_WRITE", 1))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", 16))
+JOB_LEDGER_PATH = os.environ.get("JOB_LEDGER_PATH", "")
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", JOB_LEASE_SECONDS))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", JOB_MAX_ATTEMPTS))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+ARTICLE_CACHE_PATH = os.environ.get("ARTICLE_CACHE_PATH", "cache/articles.sqlite3")
+ARTICLE_CACHE_MAX_BYTES = int(os.environ.get("ARTICLE_CACHE_MAX_BYTES", 1024 ** 3))
+ARTICLE_CACHE_TTL = int(os.environ.get("ARTICLE_CACHE_TTL", 7 * 24 * 3600))
+SUMMARY_INDEX_PATH = os.environ.get("SUMMARY_INDEX_PATH", "cache/summaries.sqlite3")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "cache/llm_responses.sqlite3")
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+LLM_CACHE_MAX_AGE = int(os.environ.get("LLM_CACHE_MAX_AGE", 30 * 24 * 3600))
+ENTITY_CACHE_MAX_ENTRIES = int(os.environ.get("ENTITY_CACHE_MAX_ENTRIES", 10000))
+ENTITY_CACHE_TTL = int(os.environ.get("ENTITY_CACHE_TTL", 30))
+ENTITY_CACHE_PATH = os.environ.get("ENTITY_CACHE_PATH", "")
+TEXT_EXTRACTOR = os.environ.get("TEXT_EXTRACTOR", "lxml")
+ARTICLE_CHAR_BUDGET = int(os.environ.get("ARTICLE_CHAR_BUDGET", LLM_MAX_ARTICLE_CHARS))
+CHUNKED_ARTICLE_CHAR_BUDGET = int(os.environ.get("CHUNKED_ARTICLE_CHAR_BUDGET", 200000))
+LLM_CHUNK_TOKENS = int(os.environ.get("LLM_CHUNK_TOKENS", 2000))
+LLM_CHUNK_CONCURRENCY = int(os.environ.get("LLM_CHUNK_CONCURRENCY", 2))
+LLM_SINGLE_PASS_OPTIONS = json.loads(os.environ.get("LLM_SINGLE_PASS_OPTIONS", json.dumps(SINGLE_PASS_OPTIONS)))
+SUMMARY_MODES = (SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_CHUNKED, SUMMARY_MODE_SINGLE_PASS)
+HTTP_OPTIONS = {
+    "connect_timeout": float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+    "read_timeout": float(os.environ.get("HTTP_READ_TIMEOUT", 60)),
+    "retries": int(os.environ.get("HTTP_RETRIES", 3)),
+    "backoff_factor": float(os.environ.get("HTTP_BACKOFF_FACTOR", 0.5)),
+    "pool_maxsize": int(os.environ.get("HTTP_POOL_MAXSIZE", 20)),
+}
+LLM_BACKEND_COOLDOWN = float(os.environ.get("LLM_BACKEND_COOLDOWN", 30))
+LLM_HEALTH_CHECK_INTERVAL = float(os.environ.get("LLM_HEALTH_CHECK_INTERVAL", 15))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 300))
+TRACE_MAX_TRACES = int(os.environ.get("TRACE_MAX_TRACES", 1000))
+TRACE_PROFILE_RATE = float(os.environ.get("TRACE_PROFILE_RATE", 0))
+SERVICE_URL = os.environ.get("SERVICE_URL", "http://localhost:5000")
+RC_CHECKPOINT_PATH = os.environ.get("RC_CHECKPOINT_PATH", "cache/recent_changes.json")
+RC_START = os.environ.get("RC_START")
+RC_RATE = float(os.environ.get("RC_RATE", 0.5))
+RC_BATCH_SIZE = int(os.environ.get("RC_BATCH_SIZE", 50))
+RC_POLL_INTERVAL = float(os.environ.get("RC_POLL_INTERVAL", 60))
+RC_SUMMARY_MODE = os.environ.get("RC_SUMMARY_MODE", SUMMARY_MODE_TWO_PASS)
+RC_WRITE = os.environ.get("RC_WRITE", "true").lower() == "true"
+RC_EXCLUDE_USER = os.environ.get("RC_EXCLUDE_USER")
+ASYNC_MAX_JOBS = int(os.environ.get("ASYNC_MAX_JOBS", 200))
+PARSE_PROCESSES = int(os.environ.get("PARSE_PROCESSES", os.cpu_count() or 1))
+SERVER_BIND = os.environ.get("SERVER_BIND", "0.0.0.0:5000")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 2))
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 16))
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", 120))
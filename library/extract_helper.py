@@ -0,0 +1,338 @@
+# CONSTANTS
+EXTRACTOR_HTML5LIB = "html5lib"
+EXTRACTOR_LXML = "lxml"
+LATEX_ANNOTATION_ENCODING = "application/x-tex"
+
+
+def parse_html5lib(html):
+    """
+    Parses an html page with BeautifulSoup and html5lib. Scripts and styles are removed
+    and MathML is replaced by its LaTeX annotation.
+
+    Args:
+        html (bytes): The html page.
+
+    Returns:
+        BeautifulSoup: The cleaned document.
+    """
+    # Imported on first use, processes using the lxml backend do not load bs4 and html5lib
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html5lib')
+    # Remove <script> and <style> tags
+    for script_or_style in soup(['script', 'style']):
+        script_or_style.decompose()
+
+    # Convert MathML to LaTeX
+    for math in soup.find_all('math'):
+        latex_annotation = math.find('annotation', {'encoding': LATEX_ANNOTATION_ENCODING})
+        if latex_annotation:
+            # Replace MathML content with the LaTeX equivalent
+            math.replace_with(f"${latex_annotation.get_text()}$")
+        else:
+            # If no LaTeX annotation exists, remove the MathML entirely
+            math.decompose()
+
+    return soup
+
+
+def extract_text_html5lib(html):
+    """
+    Extracts the text of an html page with BeautifulSoup and html5lib. Scripts and styles
+    are removed and MathML is replaced by its LaTeX annotation.
+
+    Args:
+        html (bytes): The html page.
+
+    Returns:
+        str: The extracted text.
+    """
+    # Extract and return the text content
+    return parse_html5lib(html).get_text(separator=' ', strip=True)
+
+
+def extract_sections_html5lib(html):
+    """
+    Extracts the text of an html page with BeautifulSoup and html5lib, split into the
+    text segments of the <section> elements. Text outside of (sub)sections, e.g. title and
+    abstract, forms segments of its own. Joining the segments with spaces gives the same
+    text as extract_text_html5lib.
+
+    Args:
+        html (bytes): The html page.
+
+    Returns:
+        list: The text segments.
+    """
+    from bs4 import NavigableString
+
+    sections = []
+    current_section = None
+    for string in parse_html5lib(html).find_all(string=True):
+        # Skip comments, doctypes etc. like get_text does
+        if type(string) is not NavigableString:
+            continue
+        text = string.strip()
+        if not text:
+            continue
+
+        section = string.find_parent('section')
+        if not sections or section is not current_section:
+            sections.append([])
+            current_section = section
+        sections[-1].append(text)
+
+    return [' '.join(strings) for strings in sections]
+
+
+class TextExtractionTarget:
+    """
+    Parser target for lxml that extracts the text of an html page in a single pass while
+    the page is parsed. It produces the same text as extract_text_html5lib: every text
+    node is stripped, empty ones are dropped, scripts and styles are skipped and MathML
+    is replaced by its LaTeX annotation. The text is split into segments at the start and
+    end of every <section> element, like extract_sections_html5lib.
+
+    If max_chars is given, budget_reached is set as soon as that many characters are extracted,
+    so that the caller can stop feeding the parser.
+    """
+
+    def __init__(self, max_chars=None):
+        self.max_chars = max_chars
+        self.length = 0
+        self.budget_reached = False
+        self.sections = [[]]
+        self.pending = []
+        self.skip_depth = 0
+        self.math_depth = 0
+        self.latex = None
+        self.in_latex_annotation = False
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag in ('script', 'style'):
+            self.skip_depth += 1
+        elif tag == 'math':
+            self.math_depth += 1
+        elif (tag == 'annotation' and self.math_depth and self.latex is None
+              and attrib.get('encoding') == LATEX_ANNOTATION_ENCODING):
+            # Only the first LaTeX annotation of a formula is used
+            self.latex = []
+            self.in_latex_annotation = True
+        elif tag == 'section':
+            self._start_section()
+
+    def end(self, tag):
+        self._flush()
+        if tag in ('script', 'style') and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == 'annotation':
+            self.in_latex_annotation = False
+        elif tag == 'math' and self.math_depth:
+            self.math_depth -= 1
+            if not self.math_depth:
+                if self.latex is not None:
+                    self._append(f"${''.join(self.latex)}$")
+                self.latex = None
+        elif tag == 'section':
+            self._start_section()
+
+    def data(self, data):
+        # Same newline normalization as html5lib
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+        if self.skip_depth:
+            return
+        if self.math_depth:
+            if self.in_latex_annotation:
+                self.latex.append(data)
+            return
+        self.pending.append(data)
+
+    def comment(self, text):
+        # Comments separate text nodes
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return [' '.join(strings) for strings in self.sections if strings]
+
+    def _flush(self):
+        """
+        Finishes the current text node.
+        """
+        if self.pending:
+            text = ''.join(self.pending).strip()
+            if text:
+                self._append(text)
+            self.pending = []
+
+    def _start_section(self):
+        """
+        Starts a new text segment, unless the current one is still empty.
+        """
+        if self.sections[-1]:
+            self.sections.append([])
+
+    def _append(self, text):
+        """
+        Adds a text node to the output and checks the character budget.
+        """
+        # Account for the separator
+        self.length += len(text) + (1 if self.length else 0)
+        self.sections[-1].append(text)
+        if self.max_chars is not None and self.length >= self.max_chars:
+            self.budget_reached = True
+
+
+def extract_text_lxml(html):
+    """
+    Extracts the text of an html page with lxml in a single streaming pass.
+    Produces the same output as extract_text_html5lib, but considerably faster.
+
+    Args:
+        html (bytes): The html page.
+
+    Returns:
+        str: The extracted text.
+    """
+    return ' '.join(extract_sections_lxml_from_chunks([html])[0])
+
+
+def extract_sections_lxml(html):
+    """
+    Extracts the text segments of the sections of an html page with lxml in a single streaming pass.
+    Produces the same output as extract_sections_html5lib, but considerably faster.
+
+    Args:
+        html (bytes): The html page.
+
+    Returns:
+        list: The text segments.
+    """
+    return extract_sections_lxml_from_chunks([html])[0]
+
+
+def extract_sections_lxml_from_chunks(chunks, max_chars=None):
+    """
+    Extracts the text segments of the sections of an html page from an iterable of chunks
+    (e.g. response.iter_content()), parsing each chunk as it arrives. Once max_chars characters
+    are extracted, no further chunks are read, so memory and time scale with the budget
+    instead of the page size.
+
+    Args:
+        chunks (iterable): The html page in chunks of bytes.
+        max_chars (int): The maximum number of characters to extract, or None for all.
+
+    Returns:
+        tuple: The text segments (joined at most max_chars characters) and a bool telling
+               whether the text was truncated.
+    """
+    from lxml import etree
+
+    target = TextExtractionTarget(max_chars=max_chars)
+    parser = etree.HTMLParser(target=target, huge_tree=True)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if target.budget_reached:
+            break
+
+    return truncate_sections(parser.close(), max_chars)
+
+
+def truncate_sections(sections, max_chars=None):
+    """
+    Truncates text segments so that joining them with spaces gives at most max_chars characters.
+
+    Args:
+        sections (list): The text segments.
+        max_chars (int): The maximum number of characters, or None for no limit.
+
+    Returns:
+        tuple: The truncated text segments and a bool telling whether the text was truncated.
+    """
+    if max_chars is None:
+        return sections, False
+
+    truncated_sections = []
+    length = 0
+    for section in sections:
+        if length:
+            # Separator
+            length += 1
+        if length + len(section) >= max_chars:
+            remaining = section[:max(0, max_chars - length)]
+            if remaining:
+                truncated_sections.append(remaining)
+            return truncated_sections, True
+        truncated_sections.append(section)
+        length += len(section)
+
+    return truncated_sections, False
+
+
+EXTRACTORS = {
+    EXTRACTOR_HTML5LIB: extract_sections_html5lib,
+    EXTRACTOR_LXML: extract_sections_lxml,
+}
+
+
+def extract_sections(html, extractor=EXTRACTOR_LXML):
+    """
+    Extracts the text segments of the sections of an html page with the given extractor backend.
+
+    Args:
+        html (bytes): The html page.
+        extractor (str): The extractor backend, EXTRACTOR_LXML or EXTRACTOR_HTML5LIB.
+
+    Returns:
+        list: The text segments.
+
+    Raises:
+        ValueError: If the extractor backend is unknown.
+    """
+    if extractor not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor: {extractor}")
+
+    return EXTRACTORS[extractor](html)
+
+
+def extract_text(html, extractor=EXTRACTOR_LXML):
+    """
+    Extracts the text of an html page with the given extractor backend.
+
+    Args:
+        html (bytes): The html page.
+        extractor (str): The extractor backend, EXTRACTOR_LXML or EXTRACTOR_HTML5LIB.
+
+    Returns:
+        str: The extracted text.
+
+    Raises:
+        ValueError: If the extractor backend is unknown.
+    """
+    return ' '.join(extract_sections(html, extractor=extractor))
+
+
+def extract_sections_from_chunks(chunks, max_chars=None, extractor=EXTRACTOR_LXML):
+    """
+    Extracts the text segments of the sections of an html page from an iterable of chunks with
+    the given extractor backend. The lxml backend stops reading chunks once the character budget
+    is reached; the html5lib backend cannot parse incrementally and reads the whole page before
+    truncating.
+
+    Args:
+        chunks (iterable): The html page in chunks of bytes.
+        max_chars (int): The maximum number of characters to extract, or None for all.
+        extractor (str): The extractor backend, EXTRACTOR_LXML or EXTRACTOR_HTML5LIB.
+
+    Returns:
+        tuple: The text segments (joined at most max_chars characters) and a bool telling
+               whether the text was truncated.
+
+    Raises:
+        ValueError: If the extractor backend is unknown.
+    """
+    if extractor == EXTRACTOR_LXML:
+        return extract_sections_lxml_from_chunks(chunks, max_chars=max_chars)
+
+    return truncate_sections(extract_sections(b''.join(chunks), extractor=extractor), max_chars)
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import requests
+from contextlib import asynccontextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from library.trace_helper import span, trace_response
+
+
+# CONSTANTS
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 60
+HTTP_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+HTTP_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+
+
+def format_sse_event(data, event=None):
+    """
+    Formats a Server-Sent Event.
+
+    Args:
+        data (dict): The event data, sent as JSON.
+        event (str): The event type, or None for the default "message" type.
+
+    Returns:
+        str: The event in the text/event-stream format.
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that applies a default timeout to every request without an explicit timeout
+    and records every request as span of the current trace.
+    """
+
+    def __init__(self, timeout=None, *args, **kwargs):
+        """
+        Initializes the TimeoutHTTPAdapter.
+
+        Args:
+            timeout (tuple): Default (connect, read) timeout in seconds.
+        """
+        self.TIMEOUT = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.TIMEOUT
+        with span("http", method=request.method, url=request.url) as http_span:
+            response = super().send(request, **kwargs)
+            trace_response(http_span, response)
+        return response
+
+
+def create_session(connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                   retries=3, backoff_factor=0.5, pool_connections=10, pool_maxsize=20,
+                   retry_post=False):
+    """
+    Creates a session for outbound HTTP calls. Connections are kept alive in a pool per host,
+    every request gets a default timeout, and failed requests (connection errors, 429 and 5xx)
+    are retried with exponential backoff, honoring Retry-After headers. Read timeouts are not retried.
+
+    Args:
+        connect_timeout (float): Timeout for establishing a connection in seconds.
+        read_timeout (float): Timeout between two received bytes in seconds.
+        retries (int): Maximum number of retries.
+        backoff_factor (float): Backoff factor; retry n waits backoff_factor * 2^(n-1) seconds.
+        pool_connections (int): Number of hosts to keep connection pools for.
+        pool_maxsize (int): Maximum number of kept-alive connections per host.
+        retry_post (bool): Whether POST requests are retried as well. Only enable this
+            for endpoints where repeating a request is harmless.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    allowed_methods = Retry.DEFAULT_ALLOWED_METHODS
+    if retry_post:
+        allowed_methods = allowed_methods | {"POST"}
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=HTTP_RETRY_STATUS_CODES,
+        allowed_methods=allowed_methods,
+        # Read timeouts are not retried but raised as requests.exceptions.ReadTimeout,
+        # a slow server would only multiply the waiting time
+        read=False,
+        # Return the last response instead of raising, so raise_for_status() reports it
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(timeout=(connect_timeout, read_timeout), max_retries=retry,
+                                 pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+class AsyncHTTPClient:
+    """
+    Asyncio HTTP client (based on httpx) with the same behavior as the sessions of create_session:
+    a shared connection pool with keep-alive, default timeouts and retries with exponential backoff
+    on connection errors, 429 and 5xx. One client is meant to be shared by all async helpers.
+    """
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retries=3, backoff_factor=0.5, pool_connections=10, pool_maxsize=20, retry_post=False):
+        """
+        Initializes the AsyncHTTPClient. The arguments are the same as for create_session.
+        """
+        import httpx
+
+        self.RETRIES = retries
+        self.BACKOFF_FACTOR = backoff_factor
+        self.RETRY_POST = retry_post
+        self.CLIENT = httpx.AsyncClient(
+            # Retries connection errors
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=None,
+                                max_keepalive_connections=pool_connections * pool_maxsize),
+            follow_redirects=True,
+        )
+
+    async def request(self, method, url, retry=None, **kwargs):
+        """
+        Sends a request and reads the response.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The url.
+            retry (bool): Whether to retry on 429 and 5xx. Defaults to True for idempotent methods.
+            **kwargs: Further arguments for httpx.AsyncClient.request, e.g. params or json.
+
+        Returns:
+            httpx.Response: The response.
+        """
+        async with self.stream(method, url, retry=retry, **kwargs) as response:
+            await response.aread()
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method, url, retry=None, **kwargs):
+        """
+        Sends a request and yields the response before its body is read.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The url.
+            retry (bool): Whether to retry on 429 and 5xx. Defaults to True for idempotent methods.
+            **kwargs: Further arguments for httpx.AsyncClient.build_request, e.g. params or json.
+
+        Yields:
+            httpx.Response: The response with the body not read yet.
+        """
+        if retry is None:
+            retry = method.upper() in HTTP_IDEMPOTENT_METHODS or (self.RETRY_POST and method.upper() == "POST")
+
+        request = self.CLIENT.build_request(method, url, **kwargs)
+        with span("http", method=request.method, url=str(request.url)) as http_span:
+            attempt = 0
+            while True:
+                response = await self.CLIENT.send(request, stream=True)
+                if not retry or attempt >= self.RETRIES or response.status_code not in HTTP_RETRY_STATUS_CODES:
+                    break
+
+                await response.aclose()
+                attempt += 1
+                await asyncio.sleep(self._get_retry_delay(response, attempt))
+
+            http_span['attributes']['status'] = response.status_code
+            try:
+                yield response
+            finally:
+                await response.aclose()
+                http_span['attributes']['bytes'] = response.num_bytes_downloaded
+
+    def _get_retry_delay(self, response, attempt):
+        """
+        Returns the time to wait before the next attempt, honoring a Retry-After header in seconds.
+        """
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return int(retry_after)
+        return self.BACKOFF_FACTOR * (2 ** (attempt - 1))
+
+    async def aclose(self):
+        """
+        Closes all connections.
+        """
+        await self.CLIENT.aclose()
@@ -0,0 +1,665 @@
+import asyncio
+import os
+import socket
+import threading
+import queue
+import uuid
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, asynccontextmanager
+
+from library.scheduler_helper import (FairQueue, FairSemaphore, AsyncFairSemaphore, StrideScheduler, get_priority,
+                                      priority)
+from library.trace_helper import bind_context, get_trace_id
+
+
+# CONSTANTS
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+
+class JobHelper:
+    """
+    A helper class to run long running jobs (e.g. article summaries) in a bounded pool of
+    background worker threads. Jobs with the same key are coalesced, i.e. a repeated
+    submission attaches to the job that is already queued or running.
+
+    Jobs and stages are scheduled by priority class (see scheduler_helper): every class has its own
+    bounded queue, and workers and stage slots are handed to the waiting classes in weighted fair
+    order. The class is the current priority of the submitter, and jobs run with it.
+
+    With a WorkLedger (see ledger_helper) the jobs are stored in the ledger instead of memory, so
+    that the workers of several replicas share them: workers claim jobs with a lease, renew it while
+    the job runs and take over the jobs of replicas that stopped renewing. Job functions are then
+    called by name and must be registered with register_handler; their arguments and results must
+    be JSON serializable.
+    """
+
+    def __init__(self, worker_count=4, max_queue_size=100, stage_limits=None, max_finished_jobs=1000,
+                 ledger=None, lease_seconds=60, poll_interval=1.0, priority_weights=None, max_queue_sizes=None):
+        """
+        Initializes the JobHelper.
+
+        Args:
+            worker_count (int): Number of worker threads processing jobs.
+            max_queue_size (int): Maximum number of jobs waiting for a worker, per priority class.
+            stage_limits (dict): Maximum concurrency per pipeline stage, e.g. {"llm": 2}.
+            max_finished_jobs (int): Number of finished jobs to keep for status requests.
+            ledger (WorkLedger): The ledger shared with other replicas, or None to keep the jobs in memory.
+            lease_seconds (float): Duration of the leases on ledger jobs, renewed every third of it.
+            poll_interval (float): Seconds an idle worker waits before it polls the ledger again.
+            priority_weights (dict): The weight by priority class, PRIORITY_WEIGHTS by default.
+            max_queue_sizes (dict): Maximum number of waiting jobs by priority class, overriding max_queue_size.
+        """
+        self.WORKER_COUNT = worker_count
+        self.MAX_FINISHED_JOBS = max_finished_jobs
+        self.STAGE_LIMITS = dict(stage_limits or {})
+        self.LEDGER = ledger
+        self.LEASE_SECONDS = lease_seconds
+        self.POLL_INTERVAL = poll_interval
+        self.SCHEDULER = StrideScheduler(priority_weights)
+        self.MAX_QUEUE_SIZES = {priority_class: max_queue_size for priority_class in self.SCHEDULER.WEIGHTS}
+        self.MAX_QUEUE_SIZES.update(max_queue_sizes or {})
+
+        self.LOCK = threading.Lock()
+        self.QUEUE = FairQueue(self.SCHEDULER.WEIGHTS, self.MAX_QUEUE_SIZES)
+        self.JOBS = OrderedDict()
+        self.ACTIVE_JOBS_BY_KEY = {}
+        self.WORKERS = []
+        self.WORKER_ID = None
+
+        # Ledger jobs: functions by name, and the context of jobs submitted in this process by job id
+        self.HANDLERS = {}
+        self.CONTEXTS = OrderedDict()
+        self.JOB_SUBMITTED = threading.Event()
+        self.LEDGER_JOBS_RUNNING = 0
+
+        # Set on shutdown, see drain
+        self.DRAINING = threading.Event()
+
+        self.STAGE_SEMAPHORES = {
+            stage_name: FairSemaphore(limit, self.SCHEDULER.WEIGHTS)
+            for stage_name, limit in self.STAGE_LIMITS.items()
+        }
+
+    def start_workers(self):
+        """
+        Starts the worker threads, if they are not running yet. Workers are started lazily
+        on the first submission, so that no threads exist before the process is forked.
+        """
+        with self.LOCK:
+            if self.WORKERS:
+                return
+            if self.LEDGER is not None:
+                # Leases are held per process, the id is unique across hosts and restarts
+                self.WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+                heartbeat = threading.Thread(target=self._renew_leases, name="job-heartbeat", daemon=True)
+                heartbeat.start()
+                self.WORKERS.append(heartbeat)
+            for i in range(self.WORKER_COUNT):
+                target = self._work_ledger if self.LEDGER is not None else self._work
+                worker = threading.Thread(target=target, name=f"job-worker-{i}", daemon=True)
+                worker.start()
+                self.WORKERS.append(worker)
+
+    def register_handler(self, func):
+        """
+        Registers a job function under its name, so that ledger jobs submitted by any replica can
+        be run by this one.
+
+        Args:
+            func (callable): The function.
+
+        Returns:
+            callable: The function, so that this can be used as decorator.
+        """
+        self.HANDLERS[func.__name__] = func
+        return func
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Submits a job. If a job with the same key is queued or running, that job is returned instead.
+        The job runs in a copy of the caller's context, so that it continues the caller's trace, and
+        is queued with the caller's priority class.
+
+        Args:
+            key (str): The key used to coalesce duplicate jobs, e.g. the QID.
+            func (callable): The function to run. Its return value becomes the job result.
+            *args: Positional arguments for func.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            tuple: The job (dict) and a bool telling whether a new job was created.
+
+        Raises:
+            queue.Full: If the job queue of the priority class is full, or the helper is draining.
+            ValueError: If a ledger is used and func is not registered.
+        """
+        if self.DRAINING.is_set():
+            raise queue.Full()
+
+        self.start_workers()
+
+        if self.LEDGER is not None:
+            return self._submit_to_ledger(key, func, args, kwargs)
+
+        with self.LOCK:
+            active_job_id = self.ACTIVE_JOBS_BY_KEY.get(key)
+            if active_job_id:
+                logging.debug(f"Attaching to in-flight job {active_job_id} for key {key}")
+                return dict(self.JOBS[active_job_id]), False
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'key': key,
+                'status': JOB_STATUS_QUEUED,
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'result': None,
+                'error': None,
+                'trace_id': get_trace_id(),
+                'priority': get_priority(),
+            }
+
+            # Raises queue.Full before the job is registered. The job runs in the context
+            # of the submitter, e.g. with its trace and priority
+            self.QUEUE.put_nowait((job['id'], bind_context(func), args, kwargs), job['priority'])
+
+            self.JOBS[job['id']] = job
+            self.ACTIVE_JOBS_BY_KEY[key] = job['id']
+            self._forget_finished_jobs()
+
+            return dict(job), True
+
+    def get_job(self, job_id):
+        """
+        Returns a snapshot of a job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict: The job, or None if the job is unknown.
+        """
+        if self.LEDGER is not None:
+            return self.LEDGER.get_job(job_id)
+
+        with self.LOCK:
+            job = self.JOBS.get(job_id)
+            return dict(job) if job else None
+
+    def get_queue_size(self, priority_class=None):
+        """
+        Returns the number of jobs waiting for a worker, in all replicas if a ledger is used.
+
+        Args:
+            priority_class (str): The priority class, or None for all classes.
+        """
+        if self.LEDGER is not None:
+            return self.LEDGER.get_counts(priority_class).get(JOB_STATUS_QUEUED, 0)
+        return self.QUEUE.qsize(priority_class)
+
+    def get_running_count(self):
+        """
+        Returns the number of jobs running, in all replicas if a ledger is used.
+        """
+        if self.LEDGER is not None:
+            return self.LEDGER.get_counts().get(JOB_STATUS_RUNNING, 0)
+        with self.LOCK:
+            return sum(1 for job in self.JOBS.values() if job['status'] == JOB_STATUS_RUNNING)
+
+    def get_in_flight_count(self):
+        """
+        Returns the number of jobs of this process that are not finished: queued and running jobs,
+        or the running jobs if a ledger is used.
+        """
+        with self.LOCK:
+            if self.LEDGER is not None:
+                return self.LEDGER_JOBS_RUNNING
+            return len(self.ACTIVE_JOBS_BY_KEY)
+
+    def is_draining(self):
+        """
+        Returns whether the helper is draining, i.e. does not accept jobs anymore.
+        """
+        return self.DRAINING.is_set()
+
+    def start_draining(self):
+        """
+        Stops accepting jobs, e.g. when the process received SIGTERM. Submissions raise queue.Full,
+        and workers stop claiming jobs from the ledger. Jobs in flight continue.
+        """
+        self.DRAINING.set()
+        self.JOB_SUBMITTED.set()
+
+    def drain(self, timeout=None):
+        """
+        Stops accepting jobs and waits until the jobs in flight are finished, e.g. before the process
+        exits. Queued jobs in memory are still run; queued ledger jobs are left to other replicas,
+        and the leases of ledger jobs still running at the timeout expire, so that other replicas
+        take them over.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, or None to wait until all jobs are finished.
+
+        Returns:
+            bool: Whether all jobs are finished.
+        """
+        self.start_draining()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.get_in_flight_count():
+            if deadline is not None and time.monotonic() >= deadline:
+                logging.warning(f"{self.get_in_flight_count()} jobs still running after {timeout} seconds")
+                return False
+            time.sleep(0.1)
+        return True
+
+    @contextmanager
+    def stage(self, stage_name):
+        """
+        Context manager limiting the number of concurrent executions of a pipeline stage.
+        Stages without a configured limit are not restricted. Free slots go to the waiting
+        priority classes in weighted fair order.
+
+        Args:
+            stage_name (str): The name of the stage, e.g. "wiki", "fetch" or "llm".
+        """
+        semaphore = self.STAGE_SEMAPHORES.get(stage_name)
+        if semaphore is None:
+            yield
+            return
+
+        with semaphore.slot():
+            yield
+
+    def map_unordered(self, func, items, max_in_flight=16):
+        """
+        Runs func for every item in a temporary thread pool and yields the results in the order
+        they finish. Items are consumed lazily, so at most max_in_flight items are read ahead.
+        Together with stage() this pipelines the stages: while one item waits for the LLM,
+        the next ones are already fetched.
+
+        Args:
+            func (callable): The function to call with each item.
+            items (iterable): The items to process.
+            max_in_flight (int): Maximum number of items processed at the same time.
+
+        Yields:
+            tuple: The item, the result of func (or None) and the raised exception (or None).
+        """
+        items = iter(items)
+        in_flight = {}
+        exhausted = False
+        func = bind_context(func)
+
+        executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="batch-worker")
+        try:
+            while True:
+                # Fill up the pipeline
+                while not exhausted and len(in_flight) < max_in_flight:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    in_flight[executor.submit(func, item)] = item
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    try:
+                        yield item, future.result(), None
+                    except Exception as e:
+                        yield item, None, e
+        finally:
+            # Do not start queued items if the consumer went away
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _work(self):
+        """
+        Worker loop: takes jobs from the queue and runs them.
+        """
+        while True:
+            (job_id, func, args, kwargs), _ = self.QUEUE.get()
+            self._run_job(job_id, func, args, kwargs)
+
+    def _run_job(self, job_id, func, args, kwargs):
+        """
+        Runs a single job and stores its result or error.
+        """
+        with self.LOCK:
+            job = self.JOBS[job_id]
+            job['status'] = JOB_STATUS_RUNNING
+            job['started'] = time.time()
+
+        try:
+            result = func(*args, **kwargs)
+            status, error = JOB_STATUS_DONE, None
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {str(e)}")
+            result, status, error = None, JOB_STATUS_FAILED, str(e)
+
+        with self.LOCK:
+            job['status'] = status
+            job['result'] = result
+            job['error'] = error
+            job['finished'] = time.time()
+            if self.ACTIVE_JOBS_BY_KEY.get(job['key']) == job_id:
+                del self.ACTIVE_JOBS_BY_KEY[job['key']]
+
+    def _forget_finished_jobs(self):
+        """
+        Drops the oldest finished jobs if more than MAX_FINISHED_JOBS are kept. Must be called with LOCK held.
+        """
+        finished_job_ids = [job_id for job_id, job in self.JOBS.items()
+                            if job['status'] in (JOB_STATUS_DONE, JOB_STATUS_FAILED)]
+        for job_id in finished_job_ids[:max(0, len(finished_job_ids) - self.MAX_FINISHED_JOBS)]:
+            del self.JOBS[job_id]
+
+    def _submit_to_ledger(self, key, func, args, kwargs):
+        """
+        Adds a job to the ledger. If a worker of this process claims it, the job runs in the context
+        of the submitter, e.g. with its trace.
+        """
+        if self.HANDLERS.get(func.__name__) is not func:
+            raise ValueError(f"Job function {func.__name__} is not registered")
+
+        priority_class = get_priority()
+        job, created = self.LEDGER.enqueue(key, func.__name__, args, kwargs, trace_id=get_trace_id(),
+                                           priority=priority_class, max_queued=self.MAX_QUEUE_SIZES[priority_class])
+        if created:
+            with self.LOCK:
+                self.CONTEXTS[job['id']] = bind_context(func)
+                # Jobs claimed by other replicas never come back here
+                while len(self.CONTEXTS) > self.MAX_FINISHED_JOBS:
+                    self.CONTEXTS.popitem(last=False)
+            self.JOB_SUBMITTED.set()
+        return job, created
+
+    def _work_ledger(self):
+        """
+        Worker loop for ledger jobs: claims jobs, with the priority classes in weighted fair order,
+        runs them and stores their results in the ledger.
+        """
+        while not self.DRAINING.is_set():
+            with self.LOCK:
+                priorities = self.SCHEDULER.order()
+                # Counted before the claim, so that drain does not miss a job being claimed
+                self.LEDGER_JOBS_RUNNING += 1
+            try:
+                job = self.LEDGER.claim(self.WORKER_ID, lease_seconds=self.LEASE_SECONDS, priorities=priorities)
+            except Exception as e:
+                logging.error(f"Claiming a job failed: {str(e)}")
+                job = None
+
+            if job is None:
+                with self.LOCK:
+                    self.LEDGER_JOBS_RUNNING -= 1
+                self.JOB_SUBMITTED.wait(self.POLL_INTERVAL)
+                self.JOB_SUBMITTED.clear()
+                continue
+
+            with self.LOCK:
+                self.SCHEDULER.charge(job['priority'])
+                func = self.CONTEXTS.pop(job['id'], None) or self.HANDLERS.get(job['handler'])
+
+            if func is None:
+                result, status, error = None, JOB_STATUS_FAILED, f"Unknown job function {job['handler']}"
+            else:
+                try:
+                    with priority(job['priority']):
+                        result = func(*job['args'], **job['kwargs'])
+                    status, error = JOB_STATUS_DONE, None
+                except Exception as e:
+                    logging.error(f"Job {job['id']} failed: {str(e)}")
+                    result, status, error = None, JOB_STATUS_FAILED, str(e)
+
+            try:
+                if not self.LEDGER.finish(job['id'], self.WORKER_ID, status, result=result, error=error):
+                    logging.warning(f"Lost the lease of job {job['id']}, its result is discarded")
+            except Exception as e:
+                logging.error(f"Storing the result of job {job['id']} failed: {str(e)}")
+            finally:
+                with self.LOCK:
+                    self.LEDGER_JOBS_RUNNING -= 1
+
+    def _renew_leases(self):
+        """
+        Heartbeat loop: renews the leases of the jobs running in this process every third of LEASE_SECONDS.
+        """
+        while True:
+            time.sleep(self.LEASE_SECONDS / 3)
+            try:
+                self.LEDGER.heartbeat(self.WORKER_ID, lease_seconds=self.LEASE_SECONDS)
+            except Exception as e:
+                logging.error(f"Renewing the job leases failed: {str(e)}")
+
+
+class AsyncJobHelper(JobHelper):
+    """
+    Asyncio variant of the JobHelper. Jobs are coroutines running as tasks in the event loop
+    instead of threads, so that hundreds of jobs waiting for the network can be in flight.
+    Must be used from within the event loop. Jobs are kept in memory; a ledger is not supported.
+    Jobs and stages are scheduled by priority class like in the JobHelper.
+    """
+
+    def __init__(self, max_running_jobs=200, max_queue_size=1000, stage_limits=None, max_finished_jobs=1000,
+                 priority_weights=None, max_queue_sizes=None):
+        """
+        Initializes the AsyncJobHelper.
+
+        Args:
+            max_running_jobs (int): Maximum number of jobs running at the same time.
+            max_queue_size (int): Maximum number of jobs waiting to run, per priority class.
+            stage_limits (dict): Maximum concurrency per pipeline stage, e.g. {"llm": 2}.
+            max_finished_jobs (int): Number of finished jobs to keep for status requests.
+            priority_weights (dict): The weight by priority class, PRIORITY_WEIGHTS by default.
+            max_queue_sizes (dict): Maximum number of waiting jobs by priority class, overriding max_queue_size.
+        """
+        # Jobs run as tasks, there are no worker threads
+        super().__init__(worker_count=0, max_queue_size=max_queue_size, stage_limits=stage_limits,
+                         max_finished_jobs=max_finished_jobs, priority_weights=priority_weights,
+                         max_queue_sizes=max_queue_sizes)
+        self.MAX_RUNNING_JOBS = max_running_jobs
+
+        self.TASKS = set()
+        self.QUEUED_JOBS = {priority_class: 0 for priority_class in self.SCHEDULER.WEIGHTS}
+
+        self.JOB_SEMAPHORE = AsyncFairSemaphore(max_running_jobs, self.SCHEDULER.WEIGHTS)
+        self.STAGE_SEMAPHORES = {
+            stage_name: AsyncFairSemaphore(limit, self.SCHEDULER.WEIGHTS)
+            for stage_name, limit in self.STAGE_LIMITS.items()
+        }
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Submits a job. If a job with the same key is queued or running, that job is returned instead.
+        The job runs as a task in a copy of the caller's context, with the caller's priority class.
+
+        Args:
+            key (str): The key used to coalesce duplicate jobs, e.g. the QID.
+            func (callable): The coroutine function to run. Its return value becomes the job result.
+            *args: Positional arguments for func.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            tuple: The job (dict) and a bool telling whether a new job was created.
+
+        Raises:
+            queue.Full: If the job queue of the priority class is full, or the helper is draining.
+        """
+        if self.DRAINING.is_set():
+            raise queue.Full()
+
+        with self.LOCK:
+            active_job_id = self.ACTIVE_JOBS_BY_KEY.get(key)
+            if active_job_id:
+                logging.debug(f"Attaching to in-flight job {active_job_id} for key {key}")
+                return dict(self.JOBS[active_job_id]), False
+
+            priority_class = get_priority()
+            if self.QUEUED_JOBS[priority_class] >= self.MAX_QUEUE_SIZES[priority_class]:
+                raise queue.Full()
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'key': key,
+                'status': JOB_STATUS_QUEUED,
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'result': None,
+                'error': None,
+                'trace_id': get_trace_id(),
+                'priority': priority_class,
+            }
+            self.JOBS[job['id']] = job
+            self.ACTIVE_JOBS_BY_KEY[key] = job['id']
+            self.QUEUED_JOBS[priority_class] += 1
+            self._forget_finished_jobs()
+
+        # Keep a reference, the event loop only keeps weak references to tasks
+        task = asyncio.get_running_loop().create_task(self._run_job(job['id'], func, args, kwargs))
+        self.TASKS.add(task)
+        task.add_done_callback(self.TASKS.discard)
+
+        return dict(job), True
+
+    def get_queue_size(self, priority_class=None):
+        """
+        Returns the number of jobs waiting to run.
+
+        Args:
+            priority_class (str): The priority class, or None for all classes.
+        """
+        with self.LOCK:
+            if priority_class is not None:
+                return self.QUEUED_JOBS[priority_class]
+            return sum(self.QUEUED_JOBS.values())
+
+    async def drain(self, timeout=None):
+        """
+        Stops accepting jobs and waits until the jobs in flight, including the queued ones, are finished,
+        see JobHelper.drain.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, or None to wait until all jobs are finished.
+
+        Returns:
+            bool: Whether all jobs are finished.
+        """
+        self.start_draining()
+        if not self.TASKS:
+            return True
+        _, pending = await asyncio.wait(set(self.TASKS), timeout=timeout)
+        if pending:
+            logging.warning(f"{len(pending)} jobs still running after {timeout} seconds")
+        return not pending
+
+    @asynccontextmanager
+    async def stage(self, stage_name):
+        """
+        Async context manager limiting the number of concurrent executions of a pipeline stage.
+        Stages without a configured limit are not restricted. Free slots go to the waiting
+        priority classes in weighted fair order.
+
+        Args:
+            stage_name (str): The name of the stage, e.g. "wiki", "fetch" or "llm".
+        """
+        semaphore = self.STAGE_SEMAPHORES.get(stage_name)
+        if semaphore is None:
+            yield
+            return
+
+        async with semaphore.slot():
+            yield
+
+    async def map_unordered(self, func, items, max_in_flight=16):
+        """
+        Runs the coroutine function func for every item and yields the results in the order
+        they finish, see JobHelper.map_unordered.
+
+        Args:
+            func (callable): The coroutine function to call with each item.
+            items (iterable or async iterable): The items to process.
+            max_in_flight (int): Maximum number of items processed at the same time.
+
+        Yields:
+            tuple: The item, the result of func (or None) and the raised exception (or None).
+        """
+        if not hasattr(items, '__aiter__'):
+            items = self._to_async_iterator(items)
+        items = aiter(items)
+        in_flight = {}
+        exhausted = False
+
+        try:
+            while True:
+                # Fill up the pipeline
+                while not exhausted and len(in_flight) < max_in_flight:
+                    try:
+                        item = await anext(items)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    in_flight[asyncio.ensure_future(func(item))] = item
+
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    item = in_flight.pop(task)
+                    if task.exception() is not None:
+                        yield item, None, task.exception()
+                    else:
+                        yield item, task.result(), None
+        finally:
+            # Do not leave items running if the consumer went away
+            for task in in_flight:
+                task.cancel()
+
+    @staticmethod
+    async def _to_async_iterator(items):
+        """
+        Wraps an iterable into an async iterator.
+        """
+        for item in items:
+            yield item
+
+    async def _run_job(self, job_id, func, args, kwargs):
+        """
+        Runs a single job as soon as it is granted one of the MAX_RUNNING_JOBS slots, and stores its
+        result or error.
+        """
+        with self.LOCK:
+            job = self.JOBS[job_id]
+
+        async with self.JOB_SEMAPHORE.slot(job['priority']):
+            with self.LOCK:
+                job['status'] = JOB_STATUS_RUNNING
+                job['started'] = time.time()
+                self.QUEUED_JOBS[job['priority']] -= 1
+
+            try:
+                result = await func(*args, **kwargs)
+                status, error = JOB_STATUS_DONE, None
+            except Exception as e:
+                logging.error(f"Job {job_id} failed: {str(e)}")
+                result, status, error = None, JOB_STATUS_FAILED, str(e)
+
+            with self.LOCK:
+                job['status'] = status
+                job['result'] = result
+                job['error'] = error
+                job['finished'] = time.time()
+                if self.ACTIVE_JOBS_BY_KEY.get(job['key']) == job_id:
+                    del self.ACTIVE_JOBS_BY_KEY[job['key']]
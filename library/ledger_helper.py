@@ -0,0 +1,350 @@
+import os
+import json
+import queue
+import sqlite3
+import time
+import uuid
+import logging
+from contextlib import closing
+
+from library.job_helper import JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, JOB_STATUS_DONE, JOB_STATUS_FAILED
+from library.scheduler_helper import PRIORITY_INTERACTIVE, PRIORITIES
+
+
+# CONSTANTS
+JOB_LEASE_SECONDS = 60
+JOB_MAX_ATTEMPTS = 3
+
+
+class WorkLedger:
+    """
+    Interface of a durable job ledger shared by several replicas of the service. Jobs are stored with
+    the name of their handler and its JSON arguments, so that any replica can run them. Workers claim
+    jobs with a time-bounded lease and renew it while the job runs; jobs whose lease expired, e.g.
+    because the replica was restarted, are claimed again by another worker. At most one job per key
+    is queued or running across all replicas.
+
+    Implement this interface to use a shared store other than SQLite (see SQLiteWorkLedger).
+    All methods must be atomic across processes.
+    """
+
+    def enqueue(self, key, handler, args, kwargs, trace_id=None, priority=PRIORITY_INTERACTIVE, max_queued=None):
+        """
+        Adds a job, unless a job with the same key is queued or running.
+
+        Args:
+            key (str): The key used to coalesce duplicate jobs, e.g. the QID.
+            handler (str): The name of the function running the job.
+            args (list): JSON serializable positional arguments of the handler.
+            kwargs (dict): JSON serializable keyword arguments of the handler.
+            trace_id (str): The id of the trace of the submitting request, or None.
+            priority (str): The priority class of the job.
+            max_queued (int): Maximum number of queued jobs of the priority class, or None for no limit.
+
+        Returns:
+            tuple: The job (dict) and a bool telling whether a new job was created.
+
+        Raises:
+            queue.Full: If max_queued jobs of the priority class are queued already.
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id, lease_seconds=JOB_LEASE_SECONDS, priorities=PRIORITIES):
+        """
+        Claims the oldest queued job, or a running job whose lease expired, of the first priority
+        class that has one.
+
+        Args:
+            worker_id (str): The id of the claiming worker.
+            lease_seconds (float): Duration of the lease.
+            priorities (list): The priority classes in the order they are to be served.
+
+        Returns:
+            dict: The job with the keys of get_job and "handler", "args" and "kwargs", or None if there is no job.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        """
+        Renews the leases of all jobs running on a worker.
+
+        Args:
+            worker_id (str): The id of the worker.
+            lease_seconds (float): Duration of the renewed leases.
+
+        Returns:
+            int: The number of renewed leases.
+        """
+        raise NotImplementedError
+
+    def finish(self, job_id, worker_id, status, result=None, error=None):
+        """
+        Stores the result or error of a job, if the worker still holds its lease.
+
+        Args:
+            job_id (str): The ID of the job.
+            worker_id (str): The id of the worker.
+            status (str): JOB_STATUS_DONE or JOB_STATUS_FAILED.
+            result: The JSON serializable result.
+            error (str): The error message.
+
+        Returns:
+            bool: False if the lease was lost, i.e. the job was claimed by another worker.
+        """
+        raise NotImplementedError
+
+    def get_job(self, job_id):
+        """
+        Returns a job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict: The job with the keys "id", "key", "status", "created", "started", "finished",
+                  "result", "error", "trace_id", "priority", "worker" and "attempts", or None if the
+                  job is unknown.
+        """
+        raise NotImplementedError
+
+    def get_counts(self, priority=None):
+        """
+        Returns the number of jobs per status.
+
+        Args:
+            priority (str): The priority class, or None for all classes.
+
+        Returns:
+            dict: The counts by status.
+        """
+        raise NotImplementedError
+
+
+class SQLiteWorkLedger(WorkLedger):
+    """
+    A WorkLedger stored in SQLite, for replicas on one host or sharing a local volume. Claims run in
+    write transactions, so that a job is leased to one worker at a time. Jobs that lost their lease
+    max_attempts times are failed instead of being claimed again. Only the latest max_finished_jobs
+    finished jobs are kept.
+    """
+
+    def __init__(self, db_path="cache/jobs.sqlite3", max_attempts=JOB_MAX_ATTEMPTS, max_finished_jobs=1000):
+        """
+        Initializes the SQLiteWorkLedger.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+            max_attempts (int): Number of times a job is claimed before it is failed.
+            max_finished_jobs (int): Number of finished jobs to keep for status requests.
+        """
+        self.DB_PATH = db_path
+        self.MAX_ATTEMPTS = max_attempts
+        self.MAX_FINISHED_JOBS = max_finished_jobs
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with closing(self._connect()) as conn:
+            # Readers do not block the claiming writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " key TEXT NOT NULL,"
+                " handler TEXT NOT NULL,"
+                " args TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " worker TEXT,"
+                " lease_expires REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " created REAL NOT NULL,"
+                " started REAL,"
+                " finished REAL,"
+                " result TEXT,"
+                " error TEXT,"
+                " trace_id TEXT,"
+                " priority TEXT NOT NULL DEFAULT 'interactive')"
+            )
+            # Ledgers created before jobs had priority classes
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'priority' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'interactive'")
+            # At most one active job per key
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (key)"
+                         " WHERE status IN ('queued', 'running')")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_priority_status ON jobs (priority, status, created)")
+
+    def _connect(self):
+        """
+        Opens a new database connection in autocommit mode, transactions are started explicitly.
+        Connections are not shared between threads or processes.
+        """
+        return sqlite3.connect(self.DB_PATH, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _to_job(row):
+        """
+        Converts a row of the jobs table into a job.
+        """
+        (job_id, key, handler, args, status, worker, lease_expires, attempts, created, started, finished,
+         result, error, trace_id, priority) = row
+        args, kwargs = json.loads(args)
+        return {
+            'id': job_id,
+            'key': key,
+            'status': status,
+            'created': created,
+            'started': started,
+            'finished': finished,
+            'result': json.loads(result) if result is not None else None,
+            'error': error,
+            'trace_id': trace_id,
+            'priority': priority,
+            'worker': worker,
+            'attempts': attempts,
+            'handler': handler,
+            'args': args,
+            'kwargs': kwargs,
+        }
+
+    def enqueue(self, key, handler, args, kwargs, trace_id=None, priority=PRIORITY_INTERACTIVE, max_queued=None):
+        """
+        Adds a job in a write transaction, see WorkLedger.enqueue.
+        """
+        payload = json.dumps([list(args), kwargs])
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT * FROM jobs WHERE key = ? AND status IN (?, ?)",
+                                   (key, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING)).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    logging.debug(f"Attaching to in-flight job {row[0]} for key {key}")
+                    return self._public(self._to_job(row)), False
+
+                if max_queued is not None:
+                    queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE priority = ? AND status = ?",
+                                          (priority, JOB_STATUS_QUEUED)).fetchone()[0]
+                    if queued >= max_queued:
+                        raise queue.Full()
+
+                job_id = uuid.uuid4().hex
+                conn.execute("INSERT INTO jobs (id, key, handler, args, status, created, trace_id, priority)"
+                             " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (job_id, key, handler, payload, JOB_STATUS_QUEUED, time.time(), trace_id, priority))
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return self._public(self._to_job(row)), True
+
+    def claim(self, worker_id, lease_seconds=JOB_LEASE_SECONDS, priorities=PRIORITIES):
+        """
+        Claims a job in a write transaction, see WorkLedger.claim.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs that lost their lease too often are given up, e.g. if they crash the worker
+                failed = conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished = ?"
+                    " WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                    (JOB_STATUS_FAILED, f"Lease expired {self.MAX_ATTEMPTS} times", now,
+                     JOB_STATUS_RUNNING, now, self.MAX_ATTEMPTS)
+                ).rowcount
+                if failed:
+                    logging.warning(f"Failed {failed} jobs after {self.MAX_ATTEMPTS} expired leases")
+
+                row = None
+                for priority in priorities:
+                    row = conn.execute(
+                        "SELECT * FROM jobs WHERE priority = ? AND (status = ? OR (status = ? AND lease_expires < ?))"
+                        " ORDER BY created LIMIT 1",
+                        (priority, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, now)
+                    ).fetchone()
+                    if row is not None:
+                        break
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row[4] == JOB_STATUS_RUNNING:
+                    logging.info(f"Reclaiming job {row[0]} from {row[5]} after its lease expired")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1,"
+                    " started = ? WHERE id = ?",
+                    (JOB_STATUS_RUNNING, worker_id, now + lease_seconds, now, row[0])
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row[0],)).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return self._to_job(row)
+
+    def heartbeat(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        """
+        Renews the leases of a worker, see WorkLedger.heartbeat.
+        """
+        with closing(self._connect()) as conn:
+            return conn.execute("UPDATE jobs SET lease_expires = ? WHERE worker = ? AND status = ?",
+                                (time.time() + lease_seconds, worker_id, JOB_STATUS_RUNNING)).rowcount
+
+    def finish(self, job_id, worker_id, status, result=None, error=None):
+        """
+        Stores the result of a job and drops the oldest finished jobs, see WorkLedger.finish.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_expires = NULL"
+                    " WHERE id = ? AND worker = ? AND status = ?",
+                    (status, json.dumps(result) if result is not None else None, error, time.time(),
+                     job_id, worker_id, JOB_STATUS_RUNNING)
+                ).rowcount
+                self._forget_finished_jobs(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return updated == 1
+
+    def get_job(self, job_id):
+        """
+        Returns a job, see WorkLedger.get_job.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._public(self._to_job(row)) if row else None
+
+    def get_counts(self, priority=None):
+        """
+        Returns the number of jobs per status, see WorkLedger.get_counts.
+        """
+        with closing(self._connect()) as conn:
+            if priority is not None:
+                return dict(conn.execute("SELECT status, COUNT(*) FROM jobs WHERE priority = ? GROUP BY status",
+                                         (priority,)).fetchall())
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    @staticmethod
+    def _public(job):
+        """
+        Returns a job without the arguments of its handler.
+        """
+        return {name: value for name, value in job.items() if name not in ('handler', 'args', 'kwargs')}
+
+    def _forget_finished_jobs(self, conn):
+        """
+        Deletes the oldest finished jobs beyond MAX_FINISHED_JOBS.
+        """
+        conn.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN (?, ?)"
+                     " ORDER BY finished DESC LIMIT -1 OFFSET ?)",
+                     (JOB_STATUS_DONE, JOB_STATUS_FAILED, self.MAX_FINISHED_JOBS))
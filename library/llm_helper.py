@@ -1,5 +1,87 @@
 import requests
 import json
+import re
+import time
+import hashlib
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from library.http_helper import create_session
+from library.trace_helper import bind_context
+from library.metrics_helper import (MetricsHelper, STAGE_LLM_PASS_1, STAGE_LLM_PASS_2, STAGE_LLM_SINGLE_PASS,
+                                    STAGE_LLM_CHUNK, STAGE_LLM_REDUCE, STAGE_LLM_SIMPLE)
+
+
+# CONSTANTS
+LLM_API_URL = "https://ollama.zib.de/ollama/api/generate"
+LLM_MAX_ARTICLE_CHARS = 10000
+LLM_CHARS_PER_TOKEN = 4
+SUMMARY_MODE_TWO_PASS = "two_pass"
+SUMMARY_MODE_CHUNKED = "chunked"
+SUMMARY_MODE_SINGLE_PASS = "single_pass"
+# Bounds the output of single-pass summaries: about 5 sentences fit into 400 tokens,
+# and the summary is a single paragraph
+SINGLE_PASS_OPTIONS = {"num_predict": 400, "stop": ["\n\n"]}
+
+PROMPT_SUMMARY = (" Write a summary about the following scientific article suitable for a mathematician. "
+                  " The summary should describe the overall idea in a connected and coherent text. "
+                  " Do not use bullet points, or enumeration or technical jargon that is not explained, "
+                  " or references to the structure (e.g., sections, figures, or tables) of the article. "
+                  " The summary should provide a readable and concise overview. "
+                  " Ignore anything that seems not complete. "
+                  " Start the summary with: \"This paper is about ... \". \n \n \n"
+                  " This is the scientific article: \n \n \n")
+
+PROMPT_CONCISE = (" Take the following text and make a new concise text starting with \"This article ... \" "
+                  " with about 5 sentences out of it. Make sure to leave any Latex commands unchanged. Do not repeat the task in the beginning. This is the text: "
+                  " \n \n \n")
+
+# Follow-up prompts continue from the context of the previous generation, which already holds the
+# article and the previous response, so that the article is not processed again
+PROMPT_CONCISE_FOLLOW_UP = (" Now take your summary and make a new concise text starting with \"This article ... \" "
+                            " with about 5 sentences out of it. Make sure to leave any Latex commands unchanged. "
+                            " Do not repeat the task in the beginning. \n \n \n")
+
+PROMPT_SIMPLE = (" Take the following summary of a scientific article and rewrite it for readers without a background "
+                 " in mathematics as a new text starting with \"This article ... \" with about 5 sentences in simple language. "
+                 " Explain technical terms with everyday words and leave out formulas and Latex commands. "
+                 " Do not repeat the task in the beginning. This is the summary: \n \n \n")
+
+PROMPT_SIMPLE_FOLLOW_UP = (" Now rewrite your concise text for readers without a background in mathematics as a new text "
+                           " starting with \"This article ... \" with about 5 sentences in simple language. "
+                           " Explain technical terms with everyday words and leave out formulas and Latex commands. "
+                           " Do not repeat the task in the beginning. \n \n \n")
+
+PROMPT_CHUNK_SUMMARY = (" Write a summary about the following part of a scientific article suitable for a mathematician. "
+                        " Describe the ideas and results of this part in a connected and coherent text. "
+                        " Do not use bullet points, or enumeration or references to the structure "
+                        " (e.g., sections, figures, or tables) of the article. "
+                        " Ignore anything that seems not complete. \n \n \n"
+                        " This is the part of the scientific article: \n \n \n")
+
+PROMPT_REDUCE = (" The following texts are summaries of consecutive parts of a scientific article. "
+                 " Combine them into a new concise text starting with \"This article ... \" "
+                 " with about 5 sentences that describes the overall idea of the article. "
+                 " Make sure to leave any Latex commands unchanged. Do not repeat the task in the beginning. "
+                 " These are the summaries: \n \n \n")
+
+
+PROMPT_SINGLE_PASS = (" Write a concise summary of the following scientific article suitable for a mathematician. "
+                      " The summary should be a single paragraph of about 5 sentences starting with \"This article ... \" "
+                      " that describes the overall idea in a connected and coherent text. "
+                      " Do not use bullet points, or enumeration or technical jargon that is not explained, "
+                      " or references to the structure (e.g., sections, figures, or tables) of the article. "
+                      " Ignore anything that seems not complete. "
+                      " Make sure to leave any Latex commands unchanged. Do not repeat the task in the beginning. \n \n \n"
+                      " This is the scientific article: \n \n \n")
+
+
+class LLMError(Exception):
+    """
+    Raised if a request to the LLM fails, e.g. on timeouts, HTTP errors or a malformed response.
+    Responses are never error messages, so a summary may start with any word, e.g. "Error bounds ...".
+    """
 
 
 class LLMHelper:
@@ -8,12 +90,41 @@ class LLMHelper:
 
     Args:
         auth_bearer_token (str): Authorization bearer token for API requests.
+        chunk_tokens (int): Approximate number of tokens per chunk in chunked summarization.
+        chunk_concurrency (int): Number of chunks summarized at the same time in chunked summarization.
+        http_options (dict): Timeout, retry and pool options for the session, see http_helper.create_session.
+            Generation requests are retried by default, since repeating them is harmless.
+        response_cache (LLMResponseCache): Cache for LLM responses, or None to disable caching.
+        single_pass_options (dict): Generation options for single-pass summaries, e.g. num_predict and stop
+            sequences to bound the output length. Defaults to SINGLE_PASS_OPTIONS.
+        backend_pool (LLMBackendPool): Pool of LLM backends to balance the requests across, or None
+            to send all requests to llm_api_url.
+        metrics (MetricsHelper): Collects the duration of the LLM passes and the token counts, or None to discard them.
+        llm_api_url (str): Url of the generate endpoint used without backend pool.
     """
 
-    def __init__(self, auth_bearer_token=""):
+    def __init__(self, auth_bearer_token="", chunk_tokens=2000, chunk_concurrency=2, http_options=None,
+                 response_cache=None, single_pass_options=None, backend_pool=None, metrics=None,
+                 llm_api_url=LLM_API_URL):
         self.AUTH_BEARER_TOKEN = auth_bearer_token
+        self.BACKEND_POOL = backend_pool
+        self.METRICS = metrics or MetricsHelper()
+        self.RESPONSE_CACHE = response_cache
+        self.SINGLE_PASS_OPTIONS = SINGLE_PASS_OPTIONS if single_pass_options is None else single_pass_options
+        self.LLM_API_URL = llm_api_url
+        self.HTTP_OPTIONS = {'retry_post': True, **(http_options or {})}
         self.LLM_TO_USE = "nemotron:latest"
+        self.CHUNK_TOKENS = chunk_tokens
+        self.CHUNK_CONCURRENCY = chunk_concurrency
+        self.reset_session()
+
 
+    def reset_session(self):
+        """
+        Replaces the HTTP session, e.g. in a process forked after the helper was created, so that
+        no connections are shared with the parent process.
+        """
+        self.SESSION = create_session(**self.HTTP_OPTIONS)
 
     def clean_string(self, input_string):
         """
@@ -28,81 +139,864 @@ class LLMHelper:
         return cleaned
 
 
-    def ask_llm(self, question, model="llama3.2:latest", debug=False):
+    def get_summary_fingerprint(self, arxiv_id, article, mode=SUMMARY_MODE_TWO_PASS, simple=False):
         """
-        Sends a question to the LLM and retrieves the response.
+        Returns a fingerprint of everything a summary depends on: the arXiv id, the extracted text,
+        the model and the prompts (and chunk size) of the summary mode. A summary with the same
+        fingerprint does not need to be generated again.
 
         Args:
-            question (str): The question to ask the LLM.
-            model (str): The model to use for the LLM (default is 'llama3.2:latest').
-            debug (bool): Whether to print debug information (default is False).
+            arxiv_id (str): The arXiv id, including the version if given.
+            article (str or list): The article text, or the section texts in chunked mode.
+            mode (str): The summary mode.
+            simple (bool): Whether the fingerprint is for the simple-language summary, see summarize_simple.
 
         Returns:
-            str: The response from the LLM, or an error message if the request fails.
+            str: The fingerprint as hex digest.
+        """
+        if mode == SUMMARY_MODE_CHUNKED:
+            prompts = [PROMPT_CHUNK_SUMMARY, PROMPT_REDUCE, self.CHUNK_TOKENS]
+        elif mode == SUMMARY_MODE_SINGLE_PASS:
+            prompts = [PROMPT_SINGLE_PASS, LLM_MAX_ARTICLE_CHARS, self.SINGLE_PASS_OPTIONS]
+        else:
+            prompts = [PROMPT_SUMMARY, PROMPT_CONCISE, PROMPT_CONCISE_FOLLOW_UP, LLM_MAX_ARTICLE_CHARS]
+        if simple:
+            prompts += [PROMPT_SIMPLE, PROMPT_SIMPLE_FOLLOW_UP]
 
-        Raises:
-            requests.exceptions.RequestException: If there is an issue with the HTTP request.
-            json.JSONDecodeError: If there is an issue parsing the JSON response.
+        text_hash = hashlib.sha256(json.dumps(article).encode('utf-8')).hexdigest()
+        return hashlib.sha256(json.dumps([arxiv_id, text_hash, self.LLM_TO_USE, mode, prompts]).encode('utf-8')).hexdigest()
+
+
+    def get_request_headers(self, api_key=None):
+        """
+        Returns the headers for requests to the LLM API.
+
+        Args:
+            api_key (str): The bearer token, or None for AUTH_BEARER_TOKEN.
         """
-        url = "https://ollama.zib.de/ollama/api/generate"
         headers = {
             "accept": "application/json",
-            "Authorization": f"Bearer {self.AUTH_BEARER_TOKEN}",
             "Content-Type": "application/json",
         }
+        # Local LLM servers need no token
+        api_key = api_key or self.AUTH_BEARER_TOKEN
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+
+    @staticmethod
+    def build_request_data(question, model, options=None, previous=None):
+        """
+        Returns the body of a request to the generate API. With a previous generation, its context
+        is sent along, so that the LLM continues from it.
+        """
         data = {
             "model": model,
             "prompt": question
         }
+        if options:
+            data["options"] = options
+        if previous and previous.get("context"):
+            data["context"] = previous["context"]
+        return data
+
+
+    def ask_llm(self, question, model="llama3.2:latest", debug=False, options=None, use_cache=True,
+                previous=None, result=None, cache_question=None):
+        """
+        Sends a question to the LLM and retrieves the response. Responses are served from
+        and stored in the response cache, if configured.
 
+        Args:
+            question (str): The question to ask the LLM.
+            model (str): The model to use for the LLM (default is 'llama3.2:latest').
+            debug (bool): Whether to print debug information (default is False).
+            options (dict): Generation options for the LLM API, e.g. {"temperature": 0}, or None.
+            use_cache (bool): Whether a cached response may be returned. If False, the LLM is asked
+                and its response replaces the cached one.
+            previous (dict): The result of a previous generation to continue from, see ask_llm_stream.
+            result (dict): If given, updated with the final line of the response, see ask_llm_stream.
+                Stays empty if the response is served from the cache.
+            cache_question (str): The question the response is cached under, if not question. Follow-up
+                questions are cached under their standalone equivalent, see ask_llm_follow_up.
+
+        Returns:
+            str: The response from the LLM.
+
+        Raises:
+            LLMError: If the request fails or the response is empty.
+        """
+        cache_question = cache_question or question
+        if self.RESPONSE_CACHE and use_cache:
+            cached_response = self.RESPONSE_CACHE.get(model, cache_question, options)
+            # Empty responses cached by earlier versions are not used
+            self.METRICS.observe_cache("llm_response", bool(cached_response))
+            if cached_response:
+                return cached_response
+
+        full_response = "".join(self.ask_llm_stream(question, model=model, options=options,
+                                                    previous=previous, result=result)).strip()
+
+        if debug:
+            print("[ask_llm] " + full_response)
+
+        # E.g. a single-pass summary starting with a stop sequence (see SINGLE_PASS_OPTIONS)
+        if not full_response:
+            raise LLMError("Empty LLM response")
+
+        # Only successful responses are cached
+        if self.RESPONSE_CACHE:
+            self.RESPONSE_CACHE.put(model, cache_question, full_response, options)
+
+        return full_response
+
+
+    def ask_llm_follow_up(self, question, previous, fallback_question, use_cache=True, result=None):
+        """
+        Asks a follow-up question that continues from a previous generation, whose context already
+        holds the article and the previous response, so that the LLM does not process them again.
+        Without context (e.g. if the previous response came from the cache), or if the continued
+        request fails, the standalone fallback question is asked instead.
+
+        Args:
+            question (str): The follow-up question.
+            previous (dict): The result of the previous generation, see ask_llm_stream.
+            fallback_question (str): The equivalent question including the previous response.
+            use_cache (bool): Whether a cached response may be used.
+            result (dict): If given, updated with the final line of the response, see ask_llm_stream.
+
+        Returns:
+            str: The response from the LLM.
+
+        Raises:
+            LLMError: If the fallback request fails.
+        """
+        if previous and previous.get('context'):
+            try:
+                return self.ask_llm(question, model=previous.get('model', self.LLM_TO_USE), use_cache=use_cache,
+                                    previous=previous, result=result, cache_question=fallback_question)
+            except LLMError as e:
+                logging.warning(f"Continuing the previous generation failed, asking the standalone question: {e}")
+
+        return self.ask_llm(fallback_question, model=self.LLM_TO_USE, use_cache=use_cache, result=result)
+
+
+    def ask_llm_stream(self, question, model="llama3.2:latest", options=None, previous=None, result=None):
+        """
+        Sends a question to the LLM and yields the tokens of the response as they arrive.
+        With a backend pool, the request goes to the least loaded backend and fails over to the
+        next one if the backend fails before the first token, see stream_from_backends.
+
+        Args:
+            question (str): The question to ask the LLM.
+            model (str): The model to use for the LLM (default is 'llama3.2:latest').
+            options (dict): Generation options for the LLM API, or None.
+            previous (dict): The result of a previous generation to continue from.
+            result (dict): If given, updated with the final line of the response, e.g. the model, the
+                context and eval_count, and the url of the backend ("backend").
+
+        Yields:
+            str: The response tokens.
+
+        Raises:
+            LLMError: If the request fails.
+        """
         try:
-            response = requests.post(url, headers=headers, json=data, stream=True)
+            yield from self.stream_from_backends(question, model=model, options=options, previous=previous,
+                                                 result=result)
+        except requests.exceptions.Timeout as e:
+            raise LLMError(f"LLM request timed out: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise LLMError(f"LLM request failed: {e}") from e
+        except json.JSONDecodeError as e:
+            logging.error(f"Malformed LLM response: {e.doc}")
+            raise LLMError(f"Malformed LLM response: {e}") from e
+
+
+    def stream_from_backends(self, question, model="llama3.2:latest", options=None, previous=None, result=None):
+        """
+        Sends a question to the LLM and yields the tokens of the response as they arrive.
+        With a backend pool, the request goes to the least loaded backend and fails over to the
+        next one if the backend fails before the first token.
+
+        Args:
+            question (str): The question to ask the LLM.
+            model (str): The model to use for the LLM (default is 'llama3.2:latest').
+            options (dict): Generation options for the LLM API, or None.
+            previous (dict): The result of a previous generation to continue from. Its context is sent
+                along, and with a backend pool the request prefers the backend of the previous generation,
+                which may still hold the processed context.
+            result (dict): If given, updated with the final line of the response, e.g. the model, the
+                context and eval_count, and the url of the backend ("backend").
+
+        Yields:
+            str: The response tokens.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+            json.JSONDecodeError: If there is an issue parsing the JSON response.
+        """
+        if self.BACKEND_POOL is None:
+            yield from self.stream_response(self.LLM_API_URL, self.build_request_data(question, model, options, previous),
+                                            result=result)
+            if result is not None:
+                result['backend'] = self.LLM_API_URL
+            return
+
+        tried_backends = self.get_incompatible_backends(model)
+        last_error = None
+        while True:
+            backend = self.BACKEND_POOL.acquire(exclude=tried_backends, prefer=previous and previous.get('backend'))
+            if backend is None:
+                raise last_error or requests.exceptions.ConnectionError("No LLM backend available")
+            tried_backends.append(backend)
+
+            data = self.build_request_data(question, model, options, previous)
+            response_result = {}
+            error = None
+            started = time.perf_counter()
+            try:
+                for token in self.stream_response(backend.URL, data, api_key=backend.API_KEY, result=response_result):
+                    response_result['yielded'] = True
+                    yield token
+            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                error = e
+                # Tokens already sent cannot be taken back
+                if response_result.get('yielded'):
+                    raise
+            finally:
+                # Client errors (e.g. unknown model) do not take the backend out of rotation
+                client_error = (isinstance(error, requests.exceptions.HTTPError) and error.response is not None
+                                and error.response.status_code < 500)
+                self.BACKEND_POOL.release(backend, error=error, mark_unhealthy=not client_error,
+                                          latency=time.perf_counter() - started,
+                                          eval_count=response_result.get('eval_count'))
+
+            if error is None:
+                if result is not None:
+                    result.update(response_result, backend=backend.URL)
+                    result.pop('yielded', None)
+                return
+            logging.warning(f"LLM backend {backend.URL} failed, trying the next one: {error}")
+            last_error = error
+
+
+    def get_incompatible_backends(self, model):
+        """
+        Returns the backends of the pool that are restricted to another model. Requests only go to
+        backends of the requested model, so that the response cache, the summary fingerprint and the
+        "generated by" qualifier name the model that answered, and the context of a previous generation
+        (token ids of the model) is only continued by the same model.
+
+        Args:
+            model (str): The requested model.
+
+        Returns:
+            list: The backends.
+        """
+        return [backend for backend in self.BACKEND_POOL.BACKENDS if backend.MODEL and backend.MODEL != model]
+
+
+    def stream_response(self, url, data, api_key=None, result=None):
+        """
+        Posts a request to a generate endpoint and yields the tokens of the streamed response.
+
+        Args:
+            url (str): Url of the generate endpoint.
+            data (dict): The request body, see build_request_data.
+            api_key (str): The bearer token, or None for AUTH_BEARER_TOKEN.
+            result (dict): If given, updated with the final line of the response (e.g. eval_count).
+
+        Yields:
+            str: The response tokens.
+        """
+        with self.SESSION.post(url, headers=self.get_request_headers(api_key), json=data, stream=True) as response:
             response.raise_for_status()
-            full_response = ""
             for line in response.iter_lines():
                 if line:
                     json_line = json.loads(line)
-                    full_response += json_line.get("response", "")
+                    token = json_line.get("response", "")
+                    if token:
+                        yield token
+                    if json_line.get("done"):
+                        self.METRICS.observe_llm_response(data['model'], json_line)
+                        if result is not None:
+                            result.update(json_line)
 
-            if debug:
-                print("[ask_llm] " + full_response.strip())
 
-            return full_response.strip()
-
-        except requests.exceptions.Timeout:
-            print("Error: Request timed out")
-            return "Error: Timeout"
-        except requests.exceptions.RequestException as e:
-            print(f"Error: {e}")
-            return "Error generating response"
-        except json.JSONDecodeError as e:
-            print("JSON Parsing Error:", e)
-            print("Raw Response:", response.text)
-            return "Error generating response due to JSON format"
+    def summarize_article(self, text, use_cache=True, result=None):
+        """
+        Summarizes an article in two passes: a summary of the beginning of the article,
+        which is then rewritten into a concise text of about 5 sentences. The second pass
+        continues from the context of the first one instead of sending the summary again.
 
+        Args:
+            text (str): The text of the article.
+            use_cache (bool): Whether cached LLM responses may be used.
+            result (dict): If given, updated with the result of the last generation, see ask_llm_stream,
+                so that summarize_simple can continue from it.
 
-    def summarize_article(self, text):
-        question1 = (" Write a summary about the following scientific article suitable for a mathematician. "
-                     " The summary should describe the overall idea in a connected and coherent text. "
-                     " Do not use bullet points, or enumeration or technical jargon that is not explained, "
-                     " or references to the structure (e.g., sections, figures, or tables) of the article. "
-                     " The summary should provide a readable and concise overview. "
-                     " Ignore anything that seems not complete. "
-                     " Start the summary with: \"This paper is about ... \". \n \n \n"
-                     " This is the scientific article: \n \n \n")
+        Returns:
+            str: The summary.
 
-        llm_query1 = question1 + text[:10000]
+        Raises:
+            LLMError: If a pass fails; the second pass is not started if the first one failed.
+        """
+        llm_query1 = PROMPT_SUMMARY + text[:LLM_MAX_ARTICLE_CHARS]
 
-        summary_raw = self.ask_llm(llm_query1, model=self.LLM_TO_USE, debug=False)
+        pass_1 = {}
+        with self.METRICS.time_stage(STAGE_LLM_PASS_1):
+            summary_raw = self.ask_llm(llm_query1, model=self.LLM_TO_USE, debug=False, use_cache=use_cache, result=pass_1)
         summary_raw = self.clean_string( summary_raw )
 
-        question2 = (" Take the following text and make a new concise text starting with \"This article ... \" "
-                     " with about 5 sentences out of it. Make sure to leave any Latex commands unchanged. Do not repeat the task in the beginning. This is the text: "
-                     " \n \n \n")
-
-        llm_query2 = question2 + summary_raw[:10000]
+        llm_query2 = PROMPT_CONCISE + summary_raw[:LLM_MAX_ARTICLE_CHARS]
 
-        summary = self.ask_llm(llm_query2, model=self.LLM_TO_USE)
+        with self.METRICS.time_stage(STAGE_LLM_PASS_2):
+            summary = self.ask_llm_follow_up(PROMPT_CONCISE_FOLLOW_UP, pass_1, llm_query2, use_cache=use_cache,
+                                             result=result)
         summary = self.clean_string(summary)
 
         return summary
+
+
+    def summarize_article_single_pass(self, text, use_cache=True, result=None):
+        """
+        Summarizes the beginning of an article into a concise text of about 5 sentences with
+        a single LLM call. The output length is bounded by SINGLE_PASS_OPTIONS.
+
+        Args:
+            text (str): The text of the article.
+            use_cache (bool): Whether cached LLM responses may be used.
+            result (dict): If given, updated with the result of the generation, see summarize_article.
+
+        Returns:
+            str: The summary.
+
+        Raises:
+            LLMError: If the request fails or the summary is empty.
+        """
+        with self.METRICS.time_stage(STAGE_LLM_SINGLE_PASS):
+            summary = self.ask_llm(PROMPT_SINGLE_PASS + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                   options=self.SINGLE_PASS_OPTIONS, use_cache=use_cache, result=result)
+        return self.clean_string(summary)
+
+
+    def summarize_simple(self, summary, previous=None, use_cache=True):
+        """
+        Rewrites a summary into simple language for readers without a background in mathematics
+        (the "simple" summary, WIKI_PID_FOR_SUMMARY_SIMPLE). With the result of the generation
+        of the summary, the rewrite continues from its context, which already holds the article.
+
+        Args:
+            summary (str): The summary.
+            previous (dict): The result of the last generation of the summary, see summarize_article,
+                or None to rewrite the summary on its own.
+            use_cache (bool): Whether cached LLM responses may be used.
+
+        Returns:
+            str: The simple summary.
+
+        Raises:
+            LLMError: If the request fails.
+        """
+        with self.METRICS.time_stage(STAGE_LLM_SIMPLE):
+            summary_simple = self.ask_llm_follow_up(PROMPT_SIMPLE_FOLLOW_UP, previous, PROMPT_SIMPLE + summary,
+                                                    use_cache=use_cache)
+        return self.clean_string(summary_simple)
+
+
+    def summarize_article_stream(self, text, single_pass=False):
+        """
+        Summarizes an article like summarize_article (or summarize_article_single_pass), but yields
+        the tokens of the final pass as they arrive, so that clients can show the summary while it is written.
+
+        Args:
+            text (str): The text of the article.
+            single_pass (bool): Whether to summarize with a single LLM call.
+
+        Yields:
+            str: The tokens of the summary, with newlines and tabs replaced by spaces.
+
+        Raises:
+            LLMError: If a pass fails or the summary is empty.
+        """
+        if single_pass:
+            stage = STAGE_LLM_SINGLE_PASS
+            tokens = self.ask_llm_stream(PROMPT_SINGLE_PASS + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                         options=self.SINGLE_PASS_OPTIONS)
+        else:
+            pass_1 = {}
+            with self.METRICS.time_stage(STAGE_LLM_PASS_1):
+                summary_raw = self.ask_llm(PROMPT_SUMMARY + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                           result=pass_1)
+            summary_raw = self.clean_string( summary_raw )
+            stage = STAGE_LLM_PASS_2
+            if pass_1.get('context'):
+                tokens = self.ask_llm_stream(PROMPT_CONCISE_FOLLOW_UP, model=pass_1.get('model', self.LLM_TO_USE),
+                                             previous=pass_1)
+            else:
+                tokens = self.ask_llm_stream(PROMPT_CONCISE + summary_raw[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE)
+
+        with self.METRICS.time_stage(stage):
+            empty = True
+            for token in tokens:
+                empty = empty and not token.strip()
+                yield token.replace("\n", " ").replace("\t", " ")
+            if empty:
+                raise LLMError("Empty LLM response")
+
+
+    def split_into_chunks(self, sections, chunk_tokens=None):
+        """
+        Packs section texts into chunks of about chunk_tokens tokens. Consecutive sections are
+        combined as long as they fit; sections that are too long on their own are split at
+        sentence boundaries.
+
+        Args:
+            sections (list): The section texts of the article.
+            chunk_tokens (int): Approximate number of tokens per chunk (default is CHUNK_TOKENS).
+
+        Returns:
+            list: The chunks.
+        """
+        max_chars = (chunk_tokens or self.CHUNK_TOKENS) * LLM_CHARS_PER_TOKEN
+
+        # Split sections that do not fit into a chunk
+        pieces = []
+        for section in sections:
+            if len(section) <= max_chars:
+                pieces.append(section)
+                continue
+            for sentence in re.split(r'(?<=[.!?])\s+', section):
+                # Sentences longer than a chunk are cut hard
+                pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+
+        chunks = []
+        for piece in pieces:
+            if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+                chunks[-1] += " " + piece
+            else:
+                chunks.append(piece)
+
+        return chunks
+
+
+    @staticmethod
+    def drop_failed_summaries(partial_summaries):
+        """
+        Removes the failed chunks from the partial summaries, so that the others are still reduced.
+
+        Args:
+            partial_summaries (list): The summaries of the chunks, or the LLMError of a failed chunk.
+
+        Returns:
+            list: The successful partial summaries.
+
+        Raises:
+            LLMError: The error of the first chunk, if all chunks failed.
+        """
+        errors = [summary for summary in partial_summaries if isinstance(summary, LLMError)]
+        if errors and len(errors) == len(partial_summaries):
+            raise errors[0]
+        if errors:
+            logging.warning(f"Summaries of {len(errors)} of {len(partial_summaries)} chunks failed: {errors[0]}")
+        return [summary for summary in partial_summaries if not isinstance(summary, LLMError)]
+
+
+    def summarize_article_chunked(self, sections, use_cache=True, result=None):
+        """
+        Summarizes a long article with map-reduce: the section texts are packed into chunks,
+        the chunks are summarized concurrently (CHUNK_CONCURRENCY at a time), and the partial
+        summaries are reduced into the final summary of about 5 sentences. Failed chunks are
+        left out of the reduce step.
+
+        Args:
+            sections (list): The section texts of the article.
+            use_cache (bool): Whether cached LLM responses may be used.
+            result (dict): If given, updated with the result of the reduce generation, see summarize_article.
+
+        Returns:
+            str: The summary.
+
+        Raises:
+            LLMError: If all chunks or the reduce step failed.
+        """
+        def summarize_chunk(chunk):
+            with self.METRICS.time_stage(STAGE_LLM_CHUNK):
+                try:
+                    return self.clean_string(self.ask_llm(PROMPT_CHUNK_SUMMARY + chunk, model=self.LLM_TO_USE,
+                                                          use_cache=use_cache))
+                except LLMError as e:
+                    return e
+
+        # Chunks are summarized in other threads, which need the context of the trace
+        summarize_chunk = bind_context(summarize_chunk)
+
+        with ThreadPoolExecutor(max_workers=self.CHUNK_CONCURRENCY) as executor:
+            partial_summaries = self.drop_failed_summaries(
+                list(executor.map(summarize_chunk, self.split_into_chunks(sections))))
+
+            # Summarize the summaries again until they fit into a single reduce call
+            while len(partial_summaries) > 1:
+                chunks = self.split_into_chunks(partial_summaries)
+                if len(chunks) == 1 or len(chunks) >= len(partial_summaries):
+                    break
+                partial_summaries = self.drop_failed_summaries(list(executor.map(summarize_chunk, chunks)))
+
+        with self.METRICS.time_stage(STAGE_LLM_REDUCE):
+            summary = self.ask_llm(PROMPT_REDUCE + "\n \n".join(partial_summaries), model=self.LLM_TO_USE, use_cache=use_cache,
+                                   result=result)
+        return self.clean_string(summary)
+
+
+class AsyncLLMHelper(LLMHelper):
+    """
+    Asyncio variant of the LLMHelper. The methods calling the LLM are coroutines and use a
+    shared AsyncHTTPClient, so that many summaries can wait for the LLM in one event loop.
+
+    Args:
+        client (AsyncHTTPClient): The shared HTTP client.
+        auth_bearer_token (str): Authorization bearer token for API requests.
+        chunk_tokens (int): Approximate number of tokens per chunk in chunked summarization.
+        chunk_concurrency (int): Number of chunks summarized at the same time in chunked summarization.
+        response_cache (LLMResponseCache): Cache for LLM responses, or None to disable caching.
+        single_pass_options (dict): Generation options for single-pass summaries, defaults to SINGLE_PASS_OPTIONS.
+        backend_pool (AsyncLLMBackendPool): Pool of LLM backends, or None to send all requests to llm_api_url.
+        metrics (MetricsHelper): Collects the duration of the LLM passes and the token counts, or None to discard them.
+        llm_api_url (str): Url of the generate endpoint used without backend pool.
+    """
+
+    def __init__(self, client, auth_bearer_token="", chunk_tokens=2000, chunk_concurrency=2, response_cache=None,
+                 single_pass_options=None, backend_pool=None, metrics=None, llm_api_url=LLM_API_URL):
+        super().__init__(auth_bearer_token=auth_bearer_token, chunk_tokens=chunk_tokens,
+                         chunk_concurrency=chunk_concurrency, response_cache=response_cache,
+                         single_pass_options=single_pass_options, backend_pool=backend_pool, metrics=metrics,
+                         llm_api_url=llm_api_url)
+        self.CLIENT = client
+
+    def reset_session(self):
+        """
+        Creates no session: the requests go through the shared AsyncHTTPClient.
+        """
+
+
+    async def ask_llm(self, question, model="llama3.2:latest", debug=False, options=None, use_cache=True,
+                      previous=None, result=None, cache_question=None):
+        """
+        Sends a question to the LLM and retrieves the response, see LLMHelper.ask_llm.
+
+        Args:
+            question (str): The question to ask the LLM.
+            model (str): The model to use for the LLM (default is 'llama3.2:latest').
+            debug (bool): Whether to print debug information (default is False).
+            options (dict): Generation options for the LLM API, or None.
+            use_cache (bool): Whether a cached response may be returned.
+            previous (dict): The result of a previous generation to continue from.
+            result (dict): If given, updated with the final line of the response.
+            cache_question (str): The question the response is cached under, if not question.
+
+        Returns:
+            str: The response from the LLM.
+
+        Raises:
+            LLMError: If the request fails or the response is empty.
+        """
+        cache_question = cache_question or question
+        # SQLite access blocks, keep it off the event loop
+        if self.RESPONSE_CACHE and use_cache:
+            cached_response = await asyncio.to_thread(self.RESPONSE_CACHE.get, model, cache_question, options)
+            self.METRICS.observe_cache("llm_response", bool(cached_response))
+            if cached_response:
+                return cached_response
+
+        full_response = "".join([token async for token in self.ask_llm_stream(question, model=model, options=options,
+                                                                               previous=previous, result=result)]).strip()
+
+        if debug:
+            print("[ask_llm] " + full_response)
+
+        if not full_response:
+            raise LLMError("Empty LLM response")
+
+        # Only successful responses are cached
+        if self.RESPONSE_CACHE:
+            await asyncio.to_thread(self.RESPONSE_CACHE.put, model, cache_question, full_response, options)
+
+        return full_response
+
+
+    async def ask_llm_follow_up(self, question, previous, fallback_question, use_cache=True, result=None):
+        """
+        Asks a follow-up question that continues from a previous generation, see LLMHelper.ask_llm_follow_up.
+
+        Args:
+            question (str): The follow-up question.
+            previous (dict): The result of the previous generation.
+            fallback_question (str): The equivalent question including the previous response.
+            use_cache (bool): Whether a cached response may be used.
+            result (dict): If given, updated with the final line of the response.
+
+        Returns:
+            str: The response from the LLM.
+
+        Raises:
+            LLMError: If the fallback request fails.
+        """
+        if previous and previous.get('context'):
+            try:
+                return await self.ask_llm(question, model=previous.get('model', self.LLM_TO_USE), use_cache=use_cache,
+                                          previous=previous, result=result, cache_question=fallback_question)
+            except LLMError as e:
+                logging.warning(f"Continuing the previous generation failed, asking the standalone question: {e}")
+
+        return await self.ask_llm(fallback_question, model=self.LLM_TO_USE, use_cache=use_cache, result=result)
+
+
+    async def ask_llm_stream(self, question, model="llama3.2:latest", options=None, previous=None, result=None):
+        """
+        Sends a question to the LLM and yields the tokens of the response as they arrive,
+        see LLMHelper.ask_llm_stream.
+
+        Args:
+            question (str): The question to ask the LLM.
+            model (str): The model to use for the LLM (default is 'llama3.2:latest').
+            options (dict): Generation options for the LLM API, or None.
+            previous (dict): The result of a previous generation to continue from.
+            result (dict): If given, updated with the final line of the response and the url of the backend.
+
+        Yields:
+            str: The response tokens.
+
+        Raises:
+            LLMError: If the request fails.
+        """
+        import httpx
+
+        try:
+            async for token in self.stream_from_backends(question, model=model, options=options, previous=previous,
+                                                         result=result):
+                yield token
+        except httpx.TimeoutException as e:
+            raise LLMError(f"LLM request timed out: {e}") from e
+        except httpx.HTTPError as e:
+            raise LLMError(f"LLM request failed: {e}") from e
+        except json.JSONDecodeError as e:
+            logging.error(f"Malformed LLM response: {e.doc}")
+            raise LLMError(f"Malformed LLM response: {e}") from e
+
+
+    async def stream_from_backends(self, question, model="llama3.2:latest", options=None, previous=None, result=None):
+        """
+        Sends a question to the LLM and yields the tokens of the response as they arrive,
+        see LLMHelper.stream_from_backends.
+
+        Raises:
+            httpx.HTTPError: If there is an issue with the HTTP request.
+            json.JSONDecodeError: If there is an issue parsing the JSON response.
+        """
+        import httpx
+
+        if self.BACKEND_POOL is None:
+            async for token in self.stream_response(self.LLM_API_URL, self.build_request_data(question, model, options, previous),
+                                                    result=result):
+                yield token
+            if result is not None:
+                result['backend'] = self.LLM_API_URL
+            return
+
+        tried_backends = self.get_incompatible_backends(model)
+        last_error = None
+        while True:
+            backend = await self.BACKEND_POOL.acquire(exclude=tried_backends, prefer=previous and previous.get('backend'))
+            if backend is None:
+                raise last_error or httpx.ConnectError("No LLM backend available")
+            tried_backends.append(backend)
+
+            data = self.build_request_data(question, model, options, previous)
+            response_result = {}
+            error = None
+            started = time.perf_counter()
+            try:
+                async for token in self.stream_response(backend.URL, data, api_key=backend.API_KEY, result=response_result):
+                    response_result['yielded'] = True
+                    yield token
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                error = e
+                # Tokens already sent cannot be taken back
+                if response_result.get('yielded'):
+                    raise
+            finally:
+                # Client errors (e.g. unknown model) do not take the backend out of rotation
+                client_error = isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500
+                self.BACKEND_POOL.release(backend, error=error, mark_unhealthy=not client_error,
+                                          latency=time.perf_counter() - started,
+                                          eval_count=response_result.get('eval_count'))
+
+            if error is None:
+                if result is not None:
+                    result.update(response_result, backend=backend.URL)
+                    result.pop('yielded', None)
+                return
+            logging.warning(f"LLM backend {backend.URL} failed, trying the next one: {error}")
+            last_error = error
+
+
+    async def stream_response(self, url, data, api_key=None, result=None):
+        """
+        Posts a request to a generate endpoint and yields the tokens of the streamed response,
+        see LLMHelper.stream_response.
+        """
+        async with self.CLIENT.stream("POST", url, retry=True,
+                                      headers=self.get_request_headers(api_key), json=data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    json_line = json.loads(line)
+                    token = json_line.get("response", "")
+                    if token:
+                        yield token
+                    if json_line.get("done"):
+                        self.METRICS.observe_llm_response(data['model'], json_line)
+                        if result is not None:
+                            result.update(json_line)
+
+
+    async def summarize_article(self, text, use_cache=True, result=None):
+        """
+        Summarizes an article in two passes, see LLMHelper.summarize_article.
+
+        Args:
+            text (str): The text of the article.
+            use_cache (bool): Whether cached LLM responses may be used.
+            result (dict): If given, updated with the result of the last generation.
+
+        Returns:
+            str: The summary.
+        """
+        pass_1 = {}
+        with self.METRICS.time_stage(STAGE_LLM_PASS_1):
+            summary_raw = await self.ask_llm(PROMPT_SUMMARY + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                             use_cache=use_cache, result=pass_1)
+        summary_raw = self.clean_string(summary_raw)
+
+        with self.METRICS.time_stage(STAGE_LLM_PASS_2):
+            summary = await self.ask_llm_follow_up(PROMPT_CONCISE_FOLLOW_UP, pass_1,
+                                                   PROMPT_CONCISE + summary_raw[:LLM_MAX_ARTICLE_CHARS],
+                                                   use_cache=use_cache, result=result)
+        return self.clean_string(summary)
+
+
+    async def summarize_simple(self, summary, previous=None, use_cache=True):
+        """
+        Rewrites a summary into simple language, see LLMHelper.summarize_simple.
+
+        Args:
+            summary (str): The summary.
+            previous (dict): The result of the last generation of the summary, or None.
+            use_cache (bool): Whether cached LLM responses may be used.
+
+        Returns:
+            str: The simple summary.
+        """
+        with self.METRICS.time_stage(STAGE_LLM_SIMPLE):
+            summary_simple = await self.ask_llm_follow_up(PROMPT_SIMPLE_FOLLOW_UP, previous, PROMPT_SIMPLE + summary,
+                                                          use_cache=use_cache)
+        return self.clean_string(summary_simple)
+
+
+    async def summarize_article_chunked(self, sections, use_cache=True, result=None):
+        """
+        Summarizes a long article with map-reduce, see LLMHelper.summarize_article_chunked.
+
+        Args:
+            sections (list): The section texts of the article.
+            use_cache (bool): Whether cached LLM responses may be used.
+            result (dict): If given, updated with the result of the reduce generation.
+
+        Returns:
+            str: The summary.
+
+        Raises:
+            LLMError: If all chunks or the reduce step failed.
+        """
+        semaphore = asyncio.Semaphore(self.CHUNK_CONCURRENCY)
+
+        async def summarize_chunk(chunk):
+            async with semaphore:
+                with self.METRICS.time_stage(STAGE_LLM_CHUNK):
+                    try:
+                        return self.clean_string(await self.ask_llm(PROMPT_CHUNK_SUMMARY + chunk, model=self.LLM_TO_USE,
+                                                                    use_cache=use_cache))
+                    except LLMError as e:
+                        return e
+
+        partial_summaries = self.drop_failed_summaries(
+            await asyncio.gather(*map(summarize_chunk, self.split_into_chunks(sections))))
+
+        # Summarize the summaries again until they fit into a single reduce call
+        while len(partial_summaries) > 1:
+            chunks = self.split_into_chunks(partial_summaries)
+            if len(chunks) == 1 or len(chunks) >= len(partial_summaries):
+                break
+            partial_summaries = self.drop_failed_summaries(await asyncio.gather(*map(summarize_chunk, chunks)))
+
+        with self.METRICS.time_stage(STAGE_LLM_REDUCE):
+            summary = await self.ask_llm(PROMPT_REDUCE + "\n \n".join(partial_summaries), model=self.LLM_TO_USE,
+                                         use_cache=use_cache, result=result)
+        return self.clean_string(summary)
+
+
+    async def summarize_article_single_pass(self, text, use_cache=True, result=None):
+        """
+        Summarizes an article with a single LLM call, see LLMHelper.summarize_article_single_pass.
+
+        Args:
+            text (str): The text of the article.
+            use_cache (bool): Whether cached LLM responses may be used.
+            result (dict): If given, updated with the result of the generation.
+
+        Returns:
+            str: The summary.
+        """
+        with self.METRICS.time_stage(STAGE_LLM_SINGLE_PASS):
+            summary = await self.ask_llm(PROMPT_SINGLE_PASS + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                         options=self.SINGLE_PASS_OPTIONS, use_cache=use_cache, result=result)
+        return self.clean_string(summary)
+
+
+    async def summarize_article_stream(self, text, single_pass=False):
+        """
+        Summarizes an article and yields the tokens of the final pass, see LLMHelper.summarize_article_stream.
+
+        Args:
+            text (str): The text of the article.
+            single_pass (bool): Whether to summarize with a single LLM call.
+
+        Yields:
+            str: The tokens of the summary, with newlines and tabs replaced by spaces.
+        """
+        if single_pass:
+            stage = STAGE_LLM_SINGLE_PASS
+            tokens = self.ask_llm_stream(PROMPT_SINGLE_PASS + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                         options=self.SINGLE_PASS_OPTIONS)
+        else:
+            pass_1 = {}
+            with self.METRICS.time_stage(STAGE_LLM_PASS_1):
+                summary_raw = await self.ask_llm(PROMPT_SUMMARY + text[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE,
+                                                 result=pass_1)
+            summary_raw = self.clean_string(summary_raw)
+            stage = STAGE_LLM_PASS_2
+            if pass_1.get('context'):
+                tokens = self.ask_llm_stream(PROMPT_CONCISE_FOLLOW_UP, model=pass_1.get('model', self.LLM_TO_USE),
+                                             previous=pass_1)
+            else:
+                tokens = self.ask_llm_stream(PROMPT_CONCISE + summary_raw[:LLM_MAX_ARTICLE_CHARS], model=self.LLM_TO_USE)
+
+        with self.METRICS.time_stage(stage):
+            empty = True
+            async for token in tokens:
+                empty = empty and not token.strip()
+                yield token.replace("\n", " ").replace("\t", " ")
+            if empty:
+                raise LLMError("Empty LLM response")
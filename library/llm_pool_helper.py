@@ -0,0 +1,345 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+
+from library.http_helper import create_session
+
+
+# CONSTANTS
+LLM_BACKEND_COOLDOWN = 30
+LLM_HEALTH_CHECK_INTERVAL = 15
+LLM_HEALTH_CHECK_TIMEOUT = 5
+
+
+class LLMBackend:
+    """
+    An LLM endpoint (Ollama generate API) of an LLMBackendPool, with its current state and metrics.
+    """
+
+    def __init__(self, url, model=None, weight=1, max_concurrency=4, api_key=None, health_url=None):
+        """
+        Initializes the LLMBackend.
+
+        Args:
+            url (str): Url of the generate endpoint, e.g. "http://localhost:11434/api/generate".
+            model (str): The only model served by this backend, or None for any model. Requests for other models
+                skip the backend.
+            weight (float): Share of the load relative to the other backends.
+            max_concurrency (int): Maximum number of requests in flight on this backend.
+            api_key (str): Bearer token for this backend, or None for the token of the LLMHelper.
+            health_url (str): Url probed by the health checks. Defaults to the /api/tags endpoint next to url.
+        """
+        self.URL = url
+        self.MODEL = model
+        self.WEIGHT = weight
+        self.MAX_CONCURRENCY = max_concurrency
+        self.API_KEY = api_key
+        self.HEALTH_URL = health_url or re.sub(r'/api/generate/?$', '/api/tags', url)
+
+        self.in_flight = 0
+        self.healthy = True
+        self.unhealthy_until = 0
+        self.requests = 0
+        self.failures = 0
+        self.tokens = 0
+        self.latency_seconds = 0.0
+        self.last_error = None
+
+    def is_available(self, now):
+        """
+        Returns whether requests may be sent to the backend: it is healthy, or its cooldown
+        after a failure is over, so that one request can probe it again.
+        """
+        return self.healthy or now >= self.unhealthy_until
+
+    def get_stats(self):
+        """
+        Returns the state and metrics of the backend.
+
+        Returns:
+            dict: The url, model, weight, state and request counters.
+        """
+        return {
+            'url': self.URL,
+            'model': self.MODEL,
+            'weight': self.WEIGHT,
+            'max_concurrency': self.MAX_CONCURRENCY,
+            'healthy': self.healthy,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'tokens': self.tokens,
+            'latency_seconds': self.latency_seconds,
+            'last_error': self.last_error,
+        }
+
+
+class LLMBackendPool:
+    """
+    A pool of LLM backends. Requests go to the available backend with the fewest outstanding requests
+    relative to its weight, up to the concurrency cap of each backend. Backends that fail are taken
+    out of rotation for a cooldown, and health checks in the background probe all backends periodically.
+    """
+
+    def __init__(self, backends, cooldown_seconds=LLM_BACKEND_COOLDOWN, health_check_interval=LLM_HEALTH_CHECK_INTERVAL):
+        """
+        Initializes the LLMBackendPool.
+
+        Args:
+            backends (list): The LLMBackends.
+            cooldown_seconds (float): Time a failed backend is skipped.
+            health_check_interval (float): Seconds between two health checks, or 0 to disable them.
+        """
+        self.BACKENDS = backends
+        self.COOLDOWN_SECONDS = cooldown_seconds
+        self.HEALTH_CHECK_INTERVAL = health_check_interval
+        self.LOCK = threading.Lock()
+        self.CONDITION = threading.Condition(self.LOCK)
+        self.HEALTH_CHECKER = None
+
+    @classmethod
+    def from_config(cls, backend_configs, **kwargs):
+        """
+        Creates a pool from a list of backend configurations, e.g. the "llm_backends" of secrets.json.
+
+        Args:
+            backend_configs (list): Dicts with the arguments of LLMBackend, e.g.
+                {"url": "http://gpu1:11434/api/generate", "weight": 2, "max_concurrency": 4}.
+            **kwargs: Further arguments for the pool.
+
+        Returns:
+            LLMBackendPool: The pool.
+        """
+        return cls([LLMBackend(**backend_config) for backend_config in backend_configs], **kwargs)
+
+    def _try_acquire(self, exclude, prefer=None):
+        """
+        Reserves a slot on the best available backend. Must be called with LOCK held.
+
+        Args:
+            exclude (list): Backends not to use, e.g. those that already failed for the request.
+            prefer (str): Url of a backend to use if it has a free slot, e.g. the backend holding
+                the context a request continues from.
+
+        Returns:
+            tuple: The backend (or None if all are busy or unavailable) and a bool telling whether
+                   any backend could become free, i.e. whether waiting makes sense.
+        """
+        now = time.time()
+        candidates = [backend for backend in self.BACKENDS
+                      if backend not in exclude and backend.is_available(now)]
+        free = [backend for backend in candidates if backend.in_flight < backend.MAX_CONCURRENCY]
+        if not free:
+            return None, bool(candidates)
+
+        preferred = [backend for backend in free if backend.URL == prefer]
+        if preferred:
+            preferred[0].in_flight += 1
+            return preferred[0], True
+
+        backend = min(free, key=lambda b: ((b.in_flight + 1) / b.WEIGHT, b.requests / b.WEIGHT))
+        backend.in_flight += 1
+        return backend, True
+
+    def acquire(self, exclude=(), prefer=None):
+        """
+        Reserves a slot on the best available backend, waiting while all backends are at their cap.
+
+        Args:
+            exclude (list): Backends not to use, e.g. those that already failed for the request.
+            prefer (str): Url of a backend to use if it has a free slot, see _try_acquire.
+
+        Returns:
+            LLMBackend: The backend, or None if no backend is available.
+        """
+        self.start_health_checks()
+
+        with self.CONDITION:
+            while True:
+                backend, can_wait = self._try_acquire(exclude, prefer=prefer)
+                if backend is not None or not can_wait:
+                    return backend
+                # Wake up regularly, cooldowns may expire
+                self.CONDITION.wait(timeout=1)
+
+    def release(self, backend, error=None, mark_unhealthy=True, latency=None, eval_count=None):
+        """
+        Frees the slot of a request and records its outcome.
+
+        Args:
+            backend (LLMBackend): The backend.
+            error (Exception): The error of the request, or None if it succeeded.
+            mark_unhealthy (bool): Whether the error takes the backend out of rotation for the cooldown.
+                Client errors (4xx) should not.
+            latency (float): Duration of the request in seconds.
+            eval_count (int): Number of generated tokens, as reported by the backend.
+        """
+        with self.CONDITION:
+            backend.in_flight -= 1
+            backend.requests += 1
+            backend.latency_seconds += latency or 0
+            backend.tokens += eval_count or 0
+            if error is None:
+                backend.healthy = True
+            else:
+                backend.failures += 1
+                backend.last_error = str(error)
+                if mark_unhealthy:
+                    self._mark_unhealthy(backend)
+            self.CONDITION.notify_all()
+
+    def _mark_unhealthy(self, backend):
+        """
+        Takes a backend out of rotation for the cooldown. Must be called with LOCK held.
+        """
+        if backend.healthy:
+            logging.warning(f"LLM backend {backend.URL} is unhealthy: {backend.last_error}")
+        backend.healthy = False
+        backend.unhealthy_until = time.time() + self.COOLDOWN_SECONDS
+
+    def set_health(self, backend, healthy, error=None):
+        """
+        Records the result of a health check.
+
+        Args:
+            backend (LLMBackend): The backend.
+            healthy (bool): Whether the backend answered the health check.
+            error (str): The error of the health check, if any.
+        """
+        with self.CONDITION:
+            if healthy:
+                if not backend.healthy:
+                    logging.info(f"LLM backend {backend.URL} is healthy again")
+                backend.healthy = True
+                self.CONDITION.notify_all()
+            else:
+                backend.last_error = error
+                self._mark_unhealthy(backend)
+
+    def start_health_checks(self):
+        """
+        Starts the health check thread, if not running yet. Called lazily, so that the thread is
+        started in the process that uses the pool (e.g. after forking worker processes).
+        """
+        with self.LOCK:
+            if not self.HEALTH_CHECK_INTERVAL or self.HEALTH_CHECKER is not None:
+                return
+            self.HEALTH_CHECKER = threading.Thread(target=self._check_health_forever, daemon=True)
+            self.HEALTH_CHECKER.start()
+
+    def _check_health_forever(self):
+        """
+        Probes the health url of every backend every HEALTH_CHECK_INTERVAL seconds.
+        """
+        session = create_session(connect_timeout=LLM_HEALTH_CHECK_TIMEOUT, read_timeout=LLM_HEALTH_CHECK_TIMEOUT,
+                                 retries=0)
+        while True:
+            time.sleep(self.HEALTH_CHECK_INTERVAL)
+            for backend in self.BACKENDS:
+                try:
+                    response = session.get(backend.HEALTH_URL)
+                    self.set_health(backend, response.status_code < 500, f"Health check returned {response.status_code}")
+                except Exception as e:
+                    self.set_health(backend, False, str(e))
+
+    def get_stats(self):
+        """
+        Returns the state and metrics of all backends.
+
+        Returns:
+            list: The stats of the backends, see LLMBackend.get_stats.
+        """
+        with self.LOCK:
+            return [backend.get_stats() for backend in self.BACKENDS]
+
+
+class AsyncLLMBackendPool(LLMBackendPool):
+    """
+    Asyncio variant of the LLMBackendPool: acquire is a coroutine, and the health checks run as task
+    in the event loop with the shared AsyncHTTPClient.
+    """
+
+    def __init__(self, backends, client=None, **kwargs):
+        """
+        Initializes the AsyncLLMBackendPool.
+
+        Args:
+            backends (list): The LLMBackends.
+            client (AsyncHTTPClient): The shared HTTP client for the health checks.
+            **kwargs: Further arguments, see LLMBackendPool.
+        """
+        super().__init__(backends, **kwargs)
+        self.CLIENT = client
+        self.WAITERS = []
+
+    async def acquire(self, exclude=(), prefer=None):
+        """
+        Reserves a slot on the best available backend, see LLMBackendPool.acquire.
+        """
+        self.start_health_checks()
+
+        while True:
+            with self.LOCK:
+                backend, can_wait = self._try_acquire(exclude, prefer=prefer)
+            if backend is not None or not can_wait:
+                return backend
+
+            waiter = asyncio.get_running_loop().create_future()
+            self.WAITERS.append(waiter)
+            try:
+                # Wake up regularly, cooldowns may expire
+                await asyncio.wait_for(waiter, timeout=1)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self.WAITERS:
+                    self.WAITERS.remove(waiter)
+
+    def release(self, backend, error=None, mark_unhealthy=True, latency=None, eval_count=None):
+        """
+        Frees the slot of a request and records its outcome, see LLMBackendPool.release.
+        """
+        super().release(backend, error=error, mark_unhealthy=mark_unhealthy, latency=latency, eval_count=eval_count)
+        self._wake_waiters()
+
+    def set_health(self, backend, healthy, error=None):
+        """
+        Records the result of a health check, see LLMBackendPool.set_health.
+        """
+        super().set_health(backend, healthy, error=error)
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        """
+        Wakes up all coroutines waiting for a free backend.
+        """
+        for waiter in self.WAITERS:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.WAITERS = []
+
+    def start_health_checks(self):
+        """
+        Starts the health check task in the running event loop, if not running yet.
+        """
+        if not self.HEALTH_CHECK_INTERVAL or self.HEALTH_CHECKER is not None or self.CLIENT is None:
+            return
+        self.HEALTH_CHECKER = asyncio.get_running_loop().create_task(self._check_health_forever())
+
+    async def _check_health_forever(self):
+        """
+        Probes the health url of every backend every HEALTH_CHECK_INTERVAL seconds.
+        """
+        async def check(backend):
+            try:
+                response = await self.CLIENT.request("GET", backend.HEALTH_URL, retry=False,
+                                                     timeout=LLM_HEALTH_CHECK_TIMEOUT)
+                self.set_health(backend, response.status_code < 500, f"Health check returned {response.status_code}")
+            except Exception as e:
+                self.set_health(backend, False, str(e))
+
+        while True:
+            await asyncio.sleep(self.HEALTH_CHECK_INTERVAL)
+            await asyncio.gather(*map(check, self.BACKENDS))
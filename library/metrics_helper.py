@@ -0,0 +1,328 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from library.trace_helper import span
+
+
+# CONSTANTS
+METRICS_PREFIX = "update_trigger_"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+STAGE_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+DOWNLOAD_BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2)
+TEXT_CHARS_BUCKETS = (1000, 5000, 10000, 50000, 100000, 200000, 500000)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Pipeline stages, see MetricsHelper.time_stage
+STAGE_WIKI = "wiki"
+STAGE_FETCH = "fetch"
+STAGE_PARSE = "parse"
+STAGE_LLM_PASS_1 = "llm_pass_1"
+STAGE_LLM_PASS_2 = "llm_pass_2"
+STAGE_LLM_SINGLE_PASS = "llm_single_pass"
+STAGE_LLM_CHUNK = "llm_chunk"
+STAGE_LLM_REDUCE = "llm_reduce"
+STAGE_LLM_SIMPLE = "llm_simple"
+STAGE_WRITE = "write"
+
+
+def format_labels(labels):
+    """
+    Formats label names and values in the Prometheus text format, e.g. '{stage="fetch"}'.
+
+    Args:
+        labels (tuple): Pairs of label name and value.
+
+    Returns:
+        str: The formatted labels, or an empty string if there are none.
+    """
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value):
+    """
+    Formats a sample value in the Prometheus text format.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A counter or gauge with samples per label set.
+    """
+
+    def __init__(self, name, kind, documentation):
+        """
+        Initializes the Metric.
+
+        Args:
+            name (str): The metric name without METRICS_PREFIX.
+            kind (str): "counter" or "gauge".
+            documentation (str): The help text.
+        """
+        self.NAME = METRICS_PREFIX + name
+        self.KIND = kind
+        self.DOCUMENTATION = documentation
+        self.VALUES = {}
+
+    def inc(self, labels=(), amount=1):
+        self.VALUES[labels] = self.VALUES.get(labels, 0) + amount
+
+    def set(self, labels, value):
+        self.VALUES[labels] = value
+
+    def render(self):
+        lines = [f"# HELP {self.NAME} {self.DOCUMENTATION}", f"# TYPE {self.NAME} {self.KIND}"]
+        for labels, value in sorted(self.VALUES.items()):
+            lines.append(f"{self.NAME}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """
+    A histogram with cumulative buckets per label set.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        """
+        Initializes the Histogram.
+
+        Args:
+            name (str): The metric name without METRICS_PREFIX.
+            documentation (str): The help text.
+            buckets (tuple): The upper bounds of the buckets, ascending.
+        """
+        super().__init__(name, "histogram", documentation)
+        self.BUCKETS = tuple(buckets) + (float("inf"),)
+
+    def observe(self, labels, value):
+        counts, total = self.VALUES.get(labels) or ([0] * len(self.BUCKETS), 0)
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                counts[i] += 1
+        self.VALUES[labels] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.NAME} {self.DOCUMENTATION}", f"# TYPE {self.NAME} {self.KIND}"]
+        for labels, (counts, total) in sorted(self.VALUES.items()):
+            for bound, count in zip(self.BUCKETS, counts):
+                bucket_labels = labels + (("le", format_value(float(bound))),)
+                lines.append(f"{self.NAME}_bucket{format_labels(bucket_labels)} {count}")
+            lines.append(f"{self.NAME}_sum{format_labels(labels)} {format_value(float(total))}")
+            lines.append(f"{self.NAME}_count{format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+class MetricsHelper:
+    """
+    A helper class collecting the metrics of the summary pipeline in memory and rendering them
+    in the Prometheus text format: latency histograms per pipeline stage, download and text sizes,
+    LLM throughput, cache hits and the number of jobs in flight. Values that other helpers already
+    track (queue sizes, LLM backend counters) are read by collectors when the metrics are rendered.
+
+    Metrics are kept per process; with several worker processes every process must be scraped.
+    """
+
+    def __init__(self):
+        self.LOCK = threading.Lock()
+        self.COLLECTORS = []
+
+        self.STAGE_DURATION = Histogram("stage_duration_seconds",
+                                        "Duration of the pipeline stages.", STAGE_DURATION_BUCKETS)
+        self.STAGE_IN_FLIGHT = Metric("stage_in_flight", "gauge", "Number of pipeline stages running.")
+        self.STAGE_ERRORS = Metric("stage_errors_total", "counter", "Number of pipeline stages that raised.")
+        self.DOWNLOAD_BYTES = Histogram("article_download_bytes",
+                                        "Size of the downloaded article pages.", DOWNLOAD_BYTES_BUCKETS)
+        self.TEXT_CHARS = Histogram("article_text_chars",
+                                    "Length of the text extracted from the article pages.", TEXT_CHARS_BUCKETS)
+        self.LLM_TOKENS_PER_SECOND = Histogram("llm_tokens_per_second",
+                                               "Generation speed of the LLM as reported by the backend.",
+                                               TOKENS_PER_SECOND_BUCKETS)
+        self.LLM_GENERATED_TOKENS = Metric("llm_generated_tokens_total", "counter", "Number of tokens generated by the LLM.")
+        self.LLM_PROMPT_TOKENS = Metric("llm_prompt_tokens_total", "counter", "Number of prompt tokens processed by the LLM.")
+        self.ARTICLE_SOURCE_REQUESTS = Metric("article_source_requests_total", "counter",
+                                              "Number of article downloads by source and result.")
+        self.ARTICLE_HEDGES = Metric("article_hedged_requests_total", "counter",
+                                     "Number of hedged article downloads by the source they were sent to.")
+        self.CACHE_REQUESTS = Metric("cache_requests_total", "counter", "Number of cache lookups by cache and result.")
+        self.CACHE_HIT_RATIO = Metric("cache_hit_ratio", "gauge", "Share of cache lookups that were hits.")
+        self.JOBS = Metric("jobs", "gauge", "Number of summary jobs by status.")
+        self.LLM_BACKEND_HEALTHY = Metric("llm_backend_healthy", "gauge", "Whether the LLM backend is in rotation.")
+        self.LLM_BACKEND_IN_FLIGHT = Metric("llm_backend_in_flight", "gauge", "Number of requests running on the LLM backend.")
+        self.LLM_BACKEND_REQUESTS = Metric("llm_backend_requests_total", "counter", "Number of requests sent to the LLM backend.")
+        self.LLM_BACKEND_FAILURES = Metric("llm_backend_failures_total", "counter", "Number of failed requests of the LLM backend.")
+        self.LLM_BACKEND_TOKENS = Metric("llm_backend_tokens_total", "counter", "Number of tokens generated by the LLM backend.")
+        self.LLM_BACKEND_LATENCY = Metric("llm_backend_latency_seconds_total", "counter",
+                                          "Total duration of the requests of the LLM backend.")
+
+        self.METRICS = [self.STAGE_DURATION, self.STAGE_IN_FLIGHT, self.STAGE_ERRORS, self.DOWNLOAD_BYTES,
+                        self.TEXT_CHARS, self.ARTICLE_SOURCE_REQUESTS, self.ARTICLE_HEDGES, self.LLM_TOKENS_PER_SECOND,
+                        self.LLM_GENERATED_TOKENS, self.LLM_PROMPT_TOKENS, self.CACHE_REQUESTS, self.CACHE_HIT_RATIO,
+                        self.JOBS, self.LLM_BACKEND_HEALTHY, self.LLM_BACKEND_IN_FLIGHT, self.LLM_BACKEND_REQUESTS,
+                        self.LLM_BACKEND_FAILURES, self.LLM_BACKEND_TOKENS, self.LLM_BACKEND_LATENCY]
+
+    @contextmanager
+    def time_stage(self, stage):
+        """
+        Context manager measuring the duration of a pipeline stage and counting it as in flight
+        while it runs. Works in coroutines as well, the wall time is measured. The stage is also
+        recorded as span of the current trace.
+
+        Args:
+            stage (str): The stage, e.g. STAGE_FETCH.
+        """
+        labels = (("stage", stage),)
+        with self.LOCK:
+            self.STAGE_IN_FLIGHT.inc(labels)
+        start = time.perf_counter()
+        try:
+            with span(stage):
+                yield
+        except Exception:
+            with self.LOCK:
+                self.STAGE_ERRORS.inc(labels)
+            raise
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+            with self.LOCK:
+                self.STAGE_IN_FLIGHT.inc(labels, -1)
+
+    def observe_stage(self, stage, seconds):
+        """
+        Records the duration of a pipeline stage measured by the caller.
+
+        Args:
+            stage (str): The stage, e.g. STAGE_PARSE.
+            seconds (float): The duration.
+        """
+        with self.LOCK:
+            self.STAGE_DURATION.observe((("stage", stage),), seconds)
+
+    def observe_article(self, downloaded_bytes=None, text_chars=None):
+        """
+        Records the size of a downloaded article page and the length of its extracted text.
+
+        Args:
+            downloaded_bytes (int): Number of bytes downloaded, or None.
+            text_chars (int): Number of characters extracted, or None.
+        """
+        with self.LOCK:
+            if downloaded_bytes is not None:
+                self.DOWNLOAD_BYTES.observe((), downloaded_bytes)
+            if text_chars is not None:
+                self.TEXT_CHARS.observe((), text_chars)
+
+    def observe_article_source(self, source, result):
+        """
+        Records the outcome of an article download from a source.
+
+        Args:
+            source (str): The source, e.g. "ar5iv".
+            result (str): "ok", "failed" or "cancelled" (another source was faster).
+        """
+        with self.LOCK:
+            self.ARTICLE_SOURCE_REQUESTS.inc((("source", source), ("result", result)))
+
+    def observe_article_hedge(self, source):
+        """
+        Records a hedged article download, sent because the previous source was too slow.
+
+        Args:
+            source (str): The source the hedged request was sent to.
+        """
+        with self.LOCK:
+            self.ARTICLE_HEDGES.inc((("source", source),))
+
+    def observe_llm_response(self, model, final_line):
+        """
+        Records the token counts and the generation speed of an LLM response.
+
+        Args:
+            model (str): The model.
+            final_line (dict): The final line of a streamed Ollama response, with eval_count,
+                eval_duration (in nanoseconds) and prompt_eval_count.
+        """
+        labels = (("model", model),)
+        eval_count = final_line.get('eval_count') or 0
+        eval_duration = final_line.get('eval_duration') or 0
+        with self.LOCK:
+            self.LLM_GENERATED_TOKENS.inc(labels, eval_count)
+            self.LLM_PROMPT_TOKENS.inc(labels, final_line.get('prompt_eval_count') or 0)
+            if eval_count and eval_duration:
+                self.LLM_TOKENS_PER_SECOND.observe(labels, eval_count / (eval_duration / 1e9))
+
+    def observe_cache(self, cache, hit):
+        """
+        Records a cache lookup.
+
+        Args:
+            cache (str): The cache, e.g. "article", "llm_response" or "summary_index".
+            hit (bool): Whether the lookup was a hit.
+        """
+        with self.LOCK:
+            self.CACHE_REQUESTS.inc((("cache", cache), ("result", "hit" if hit else "miss")))
+
+    def add_collector(self, collector):
+        """
+        Adds a function that updates metrics right before they are rendered, e.g. with the queue
+        size of a JobHelper. Use collect_jobs and collect_llm_backends for the usual ones.
+
+        Args:
+            collector (callable): Called without arguments, with LOCK held.
+        """
+        self.COLLECTORS.append(collector)
+
+    def collect_jobs(self, jobs):
+        """
+        Adds a collector for the queued and running jobs of a JobHelper.
+        """
+        def collect():
+            self.JOBS.set((("status", "queued"),), jobs.get_queue_size())
+            self.JOBS.set((("status", "running"),), jobs.get_running_count())
+        self.add_collector(collect)
+
+    def collect_llm_backends(self, pool):
+        """
+        Adds a collector for the state and counters of the backends of an LLMBackendPool.
+        """
+        def collect():
+            for stats in pool.get_stats():
+                labels = (("backend", stats['url']),)
+                self.LLM_BACKEND_HEALTHY.set(labels, int(stats['healthy']))
+                self.LLM_BACKEND_IN_FLIGHT.set(labels, stats['in_flight'])
+                self.LLM_BACKEND_REQUESTS.set(labels, stats['requests'])
+                self.LLM_BACKEND_FAILURES.set(labels, stats['failures'])
+                self.LLM_BACKEND_TOKENS.set(labels, stats['tokens'])
+                self.LLM_BACKEND_LATENCY.set(labels, stats['latency_seconds'])
+        self.add_collector(collect)
+
+    def render(self):
+        """
+        Renders all metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics, see METRICS_CONTENT_TYPE.
+        """
+        with self.LOCK:
+            for collector in self.COLLECTORS:
+                collector()
+
+            caches = {labels[0][1] for labels in self.CACHE_REQUESTS.VALUES}
+            for cache in caches:
+                hits = self.CACHE_REQUESTS.VALUES.get((("cache", cache), ("result", "hit")), 0)
+                misses = self.CACHE_REQUESTS.VALUES.get((("cache", cache), ("result", "miss")), 0)
+                self.CACHE_HIT_RATIO.set((("cache", cache),), hits / (hits + misses) if hits + misses else 0.0)
+
+            lines = []
+            for metric in self.METRICS:
+                if metric.VALUES:
+                    lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
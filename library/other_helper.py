@@ -1,43 +1,566 @@
-import requests
-from bs4 import BeautifulSoup
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from library.http_helper import create_session
+from library.metrics_helper import MetricsHelper, STAGE_FETCH, STAGE_PARSE
+from library.trace_helper import span, should_profile, run_profiled, bind_context
+from library.extract_helper import extract_text, extract_sections_from_chunks, truncate_sections, EXTRACTOR_LXML
+from library.source_helper import (SOURCE_AR5IV, SOURCE_ARXIV_HTML, SOURCE_ABSTRACT, ARXIV_HTML_URL,
+                                   ARXIV_ABSTRACT_URL, LAST_RESORT_SOURCES, RENDERED_PAGE_PEEK_BYTES, LatencyTracker,
+                                   get_source_url, guard_chunks, check_rendered_page, check_rendered_chunks,
+                                   check_rendered_text, parse_arxiv_abstract)
+
+# CONSTANTS
+AR5IV_URL = "https://ar5iv.labs.arxiv.org/html/"
+ARTICLE_FETCH_TIMEOUT = 120
+ARTICLE_FETCH_THREADS = 32
+
 
 class OtherHelper:
 
-    def __init__(self):
-        initialized = True
+    def __init__(self, cache=None, extractor=EXTRACTOR_LXML, http_options=None, metrics=None, ar5iv_url=AR5IV_URL,
+                 sources=None, fetch_timeout=ARTICLE_FETCH_TIMEOUT, hedge_options=None):
+        """
+        Initializes the OtherHelper.
+
+        Args:
+            cache (ArticleCache): Cache for extracted article texts, or None to disable caching.
+            extractor (str): The text extractor backend, see library.extract_helper.
+            http_options (dict): Timeout, retry and pool options for the session, see http_helper.create_session.
+            metrics (MetricsHelper): Collects download and parse metrics, or None to discard them.
+            ar5iv_url (str): Base url of the rendered articles, the arXiv id is appended.
+            sources (list): The sources of the articles in order of preference, as pairs of source and
+                base url, see library.source_helper. Defaults to ar5iv at ar5iv_url, arxiv.org/html and
+                the abstract from the arXiv export API.
+            fetch_timeout (float): Seconds after which all downloads of an article are given up.
+            hedge_options (dict): Percentile and bounds of the hedge delays, see source_helper.LatencyTracker.
+        """
+        self.CACHE = cache
+        self.AR5IV_URL = ar5iv_url
+        self.EXTRACTOR = extractor
+        self.METRICS = metrics or MetricsHelper()
+        self.HTTP_OPTIONS = dict(http_options or {})
+        self.SOURCES = list(sources or [(SOURCE_AR5IV, ar5iv_url), (SOURCE_ARXIV_HTML, ARXIV_HTML_URL),
+                                        (SOURCE_ABSTRACT, ARXIV_ABSTRACT_URL)])
+        self.FETCH_TIMEOUT = fetch_timeout
+        self.LATENCY_TRACKERS = {source: LatencyTracker(**(hedge_options or {})) for source, _ in self.SOURCES}
+        self.reset_session()
+
+
+    def reset_session(self):
+        """
+        Creates the HTTP session and the download threads, and replaces them in a process forked after
+        the helper was created, so that no connections or thread state are shared with the parent process.
+        """
+        self.SESSION = create_session(**self.HTTP_OPTIONS)
+        # Downloads run in threads, so that a slow one can be left behind when a hedged request wins
+        self.EXECUTOR = ThreadPoolExecutor(max_workers=ARTICLE_FETCH_THREADS, thread_name_prefix="article-fetch")
 
 
-    def get_rendered_text_for_arxiv_id(self, arxiv_id=None):
+    def get_rendered_text_for_arxiv_id(self, arxiv_id=None, max_chars=None):
         """
         Fetches and extracts rendered text with better support for HTML5 and MathML.
 
         Args:
             arxiv_id (str): The arxiv id to get the text for.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
 
         Returns:
             str: The extracted text from the html page.
         """
+        return ' '.join(self.get_sections_for_arxiv_id(arxiv_id, max_chars=max_chars))
+
+
+    def get_cached_sections(self, arxiv_id, max_chars=None):
+        """
+        Looks up the cache entry for an arXiv id.
+
+        Args:
+            arxiv_id (str): The arxiv id.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+
+        Returns:
+            dict: The cache entry (see ArticleCache.get), or None if nothing usable is cached.
+        """
+        cached = self.CACHE.get(arxiv_id) if self.CACHE else None
+        if (cached and not cached['complete']
+                and (max_chars is None or len(' '.join(cached['sections'])) < max_chars)):
+            # Cached text was truncated to a smaller budget
+            cached = None
+        if self.CACHE:
+            self.METRICS.observe_cache("article", cached is not None and cached['fresh'])
+        return cached
+
+
+    @staticmethod
+    def measure_download(chunks, download):
+        """
+        Passes the chunks of a download through and measures them. The time spent waiting for
+        the next chunk is download time, the time between two chunks is spent by the consumer.
+
+        Args:
+            chunks (iterable): The downloaded chunks of bytes.
+            download (dict): Updated with the number of "bytes" and the download time in "seconds".
+
+        Yields:
+            bytes: The chunks.
+        """
+        start = time.perf_counter()
+        for chunk in chunks:
+            download['seconds'] += time.perf_counter() - start
+            download['bytes'] += len(chunk)
+            yield chunk
+            start = time.perf_counter()
+        download['seconds'] += time.perf_counter() - start
+
+
+    @staticmethod
+    def get_conditional_headers(cached, source):
+        """
+        Returns the headers for revalidating a cache entry with a conditional request to a source.
+        The validators of a page are only sent to the source the page came from; a 304 from
+        another source would revalidate a text that source never served. Entries cached before
+        the source was recorded are downloaded again.
+
+        Args:
+            cached (dict): The cache entry, or None.
+            source (str): The source the request goes to.
+
+        Returns:
+            dict: The request headers.
+        """
+        headers = {}
+        if cached and cached['source'] == source:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        return headers
+
+
+    def get_sections_for_arxiv_id(self, arxiv_id=None, max_chars=None):
+        """
+        Fetches and extracts the rendered text split into the texts of the article's sections.
+        Texts are served from the cache, if configured. Expired cache entries are
+        revalidated with a conditional request.
+
+        The article is fetched from the first of SOURCES that provides it, see fetch_from_sources.
+        Only full texts are cached; an abstract returned as last resort is fetched again next time.
+
+        Args:
+            arxiv_id (str): The arxiv id to get the text for.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+
+        Returns:
+            list: The extracted section texts from the html page.
+        """
+        cached = self.get_cached_sections(arxiv_id, max_chars=max_chars)
+        if cached and cached['fresh']:
+            return truncate_sections(cached['sections'], max_chars)[0]
+
+        result = self.fetch_from_sources(arxiv_id, max_chars=max_chars, cached=cached)
+        if result['not_modified']:
+            # Page did not change, no need to parse it again
+            self.CACHE.mark_validated(arxiv_id)
+            return truncate_sections(cached['sections'], max_chars)[0]
+
+        if self.CACHE and result['source'] not in LAST_RESORT_SOURCES:
+            self.CACHE.put(arxiv_id, result['sections'],
+                           etag=result['etag'],
+                           last_modified=result['last_modified'],
+                           complete=not result['truncated'],
+                           source=result['source'])
+
+        return result['sections']
+
+
+    def get_hedge_time(self, next_index, last_start):
+        """
+        Returns when the request to the most recently started source is hedged by a request to the next source.
+
+        Args:
+            next_index (int): The index of the next source in SOURCES.
+            last_start (float): The time.monotonic() time the most recent request was started.
+
+        Returns:
+            float: The time.monotonic() time, or None if the next source must not be hedged to
+                   (there is none, or it is a last resort).
+        """
+        if next_index >= len(self.SOURCES) or self.SOURCES[next_index][0] in LAST_RESORT_SOURCES:
+            return None
+        return last_start + self.LATENCY_TRACKERS[self.SOURCES[next_index - 1][0]].get_hedge_delay()
+
+
+    def record_source_result(self, arxiv_id, source, seconds, error=None):
+        """
+        Records the outcome of a request to a source: the latency of successful requests feeds
+        the hedge delay of the source, failures are logged.
+        """
+        if error is None:
+            self.LATENCY_TRACKERS[source].observe(seconds)
+            self.METRICS.observe_article_source(source, "ok")
+        else:
+            logging.warning(f"Fetching {arxiv_id} from {source} failed: {error}")
+            self.METRICS.observe_article_source(source, "failed")
+
+
+    def fetch_from_sources(self, arxiv_id, max_chars=None, cached=None):
+        """
+        Fetches an article from the first source that provides it. The SOURCES are tried in order:
+        a failing source is followed by the next one at once, and a request that is still running
+        after the hedge delay of its source (a high percentile of its recent latencies) is hedged
+        by a request to the next source. The first usable result wins and the other downloads
+        are cancelled. Last resort sources are only tried once all other sources failed.
+
+        Args:
+            arxiv_id (str): The arxiv id.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+            cached (dict): The stale cache entry to revalidate, or None.
+
+        Returns:
+            dict: The result of fetch_from_source and the "source" it came from.
+
+        Raises:
+            Exception: If no source provides the article within FETCH_TIMEOUT.
+        """
+        deadline = time.monotonic() + self.FETCH_TIMEOUT
+        cancel_event = threading.Event()
+
+        # Downloads run in other threads, which need the context of the trace
+        fetch = bind_context(self.fetch_from_source)
+
+        pending = {}
+        errors = []
+        next_index = 0
+        last_start = 0.0
+        try:
+            while (pending or next_index < len(self.SOURCES)) and time.monotonic() < deadline:
+                hedge_time = self.get_hedge_time(next_index, last_start) if pending else None
+                if not pending or (hedge_time is not None and time.monotonic() >= hedge_time):
+                    source, base_url = self.SOURCES[next_index]
+                    if pending:
+                        logging.debug(f"Hedging the download of {arxiv_id} with {source}")
+                        self.METRICS.observe_article_hedge(source)
+                    last_start = time.monotonic()
+                    future = self.EXECUTOR.submit(fetch, source, base_url, arxiv_id, max_chars=max_chars,
+                                                  headers=self.get_conditional_headers(cached, source),
+                                                  cancel_event=cancel_event, deadline=deadline)
+                    pending[future] = (source, last_start)
+                    next_index += 1
+                    continue
+
+                timeout = deadline - time.monotonic()
+                if hedge_time is not None:
+                    timeout = min(timeout, hedge_time - time.monotonic())
+                done, _ = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    source, start = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.record_source_result(arxiv_id, source, None, error=e)
+                        errors.append(f"{source}: {e}")
+                        continue
+                    self.record_source_result(arxiv_id, source, time.monotonic() - start)
+                    return {**result, 'source': source}
+        finally:
+            # Stops the downloads that are still running
+            cancel_event.set()
+            for source, _ in pending.values():
+                self.METRICS.observe_article_source(source, "cancelled")
+
+        if pending:
+            errors.append(f"timed out after {self.FETCH_TIMEOUT} seconds")
+        raise Exception(f"No source provided the article {arxiv_id}: {'; '.join(errors)}")
+
+
+    def fetch_from_source(self, source, base_url, arxiv_id, max_chars=None, headers=None, cancel_event=None,
+                          deadline=None):
+        """
+        Downloads and extracts an article from one source. Rendered pages are downloaded and parsed
+        incrementally; if max_chars is given, both the download and the parsing stop once that many
+        characters are extracted.
+
+        Args:
+            source (str): The source, e.g. SOURCE_AR5IV.
+            base_url (str): The base url of the source.
+            arxiv_id (str): The arxiv id.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+            headers (dict): The headers of a conditional request, see get_conditional_headers.
+            cancel_event (threading.Event): Set once the download is not needed anymore.
+            deadline (float): The time.monotonic() time after which the download is stopped.
+
+        Returns:
+            dict: The "sections" (None if "not_modified"), whether they were "truncated", the "etag"
+                  and "last_modified" headers of the page, and "not_modified" (True if the server
+                  answered the conditional request with 304).
+
+        Raises:
+            SourceFailedError: If the page is not a usable article, e.g. an ar5iv conversion failure page.
+            FetchCancelledError: If the download was cancelled.
+        """
+        url = get_source_url(source, base_url, arxiv_id)
+
+        with span("source", source=source):
+            if source == SOURCE_ABSTRACT:
+                start = time.perf_counter()
+                response = self.SESSION.get(url)
+                response.raise_for_status()
+                self.METRICS.observe_stage(STAGE_FETCH, time.perf_counter() - start)
+                return {'sections': parse_arxiv_abstract(response.content), 'truncated': False, 'etag': None,
+                        'last_modified': None, 'not_modified': False}
+
+            # Download and parsing overlap, the time spent waiting for chunks is counted as fetch
+            download = {'bytes': 0, 'seconds': 0.0}
+            start = time.perf_counter()
+            with self.SESSION.get(url, headers=headers, stream=True) as response:
+                if headers and response.status_code == 304:
+                    self.METRICS.observe_stage(STAGE_FETCH, time.perf_counter() - start)
+                    return {'sections': None, 'truncated': False, 'etag': None, 'last_modified': None,
+                            'not_modified': True}
+
+                response.raise_for_status()  # Ensure the request was successful
+
+                # Leaving the with block closes the connection, which stops the download
+                parse_start = time.perf_counter()
+                chunks = self.measure_download(
+                    guard_chunks(response.iter_content(chunk_size=64 * 1024), cancel_event, deadline), download)
+                chunks = check_rendered_chunks(chunks, response.url)
+                with span(STAGE_PARSE, extractor=self.EXTRACTOR) as parse_span:
+                    if should_profile():
+                        (sections, truncated), parse_span['attributes']['profile'] = run_profiled(
+                            self.extract_sections_from_chunks, chunks, max_chars=max_chars)
+                    else:
+                        sections, truncated = self.extract_sections_from_chunks(chunks, max_chars=max_chars)
+                    parse_span['attributes']['download_seconds'] = download['seconds']
+                parse_seconds = time.perf_counter() - parse_start - download['seconds']
+
+            self.METRICS.observe_stage(STAGE_FETCH, parse_start - start + download['seconds'])
+            self.METRICS.observe_stage(STAGE_PARSE, parse_seconds)
+            self.METRICS.observe_article(downloaded_bytes=download['bytes'], text_chars=sum(map(len, sections)))
+
+            check_rendered_text(sections, max_chars)
+            return {'sections': sections, 'truncated': truncated, 'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'), 'not_modified': False}
+
+
+    def extract_text(self, html):
+        """
+        Extracts the text of an ar5iv html page with the configured extractor backend.
+        Scripts and styles are removed and MathML is replaced by its LaTeX annotation.
+
+        Args:
+            html (bytes): The html page.
+
+        Returns:
+            str: The extracted text.
+        """
+        return extract_text(html, extractor=self.EXTRACTOR)
+
+
+    def extract_sections_from_chunks(self, chunks, max_chars=None):
+        """
+        Extracts the section texts of an ar5iv html page, given in chunks, with the configured extractor backend.
+
+        Args:
+            chunks (iterable): The html page in chunks of bytes.
+            max_chars (int): The maximum number of characters to extract, or None for all.
+
+        Returns:
+            tuple: The extracted section texts and a bool telling whether the text was truncated.
+        """
+        return extract_sections_from_chunks(chunks, max_chars=max_chars, extractor=self.EXTRACTOR)
+
+
+class AsyncOtherHelper(OtherHelper):
+    """
+    Asyncio variant of the OtherHelper. Articles are downloaded with a shared AsyncHTTPClient and
+    the CPU-bound html parsing runs in a process pool, so that it does not block the event loop.
+    """
+
+    def __init__(self, client, process_pool, cache=None, extractor=EXTRACTOR_LXML, metrics=None, ar5iv_url=AR5IV_URL,
+                 sources=None, fetch_timeout=ARTICLE_FETCH_TIMEOUT, hedge_options=None):
+        """
+        Initializes the AsyncOtherHelper.
+
+        Args:
+            client (AsyncHTTPClient): The shared HTTP client.
+            process_pool (concurrent.futures.ProcessPoolExecutor): The pool for parsing html.
+            cache (ArticleCache): Cache for extracted article texts, or None to disable caching.
+            extractor (str): The text extractor backend, see library.extract_helper.
+            metrics (MetricsHelper): Collects download and parse metrics, or None to discard them.
+            ar5iv_url (str): Base url of the rendered articles, the arXiv id is appended.
+            sources (list): The sources of the articles in order of preference, see OtherHelper.
+            fetch_timeout (float): Seconds after which all downloads of an article are given up.
+            hedge_options (dict): Percentile and bounds of the hedge delays, see source_helper.LatencyTracker.
+        """
+        super().__init__(cache=cache, extractor=extractor, metrics=metrics, ar5iv_url=ar5iv_url, sources=sources,
+                         fetch_timeout=fetch_timeout, hedge_options=hedge_options)
+        self.CLIENT = client
+        self.PROCESS_POOL = process_pool
+
+    def reset_session(self):
+        """
+        Creates no session and no download threads: the downloads are tasks of the event loop and use
+        the shared AsyncHTTPClient.
+        """
+
+
+    async def get_rendered_text_for_arxiv_id(self, arxiv_id=None, max_chars=None):
+        """
+        Fetches and extracts rendered text, see OtherHelper.get_rendered_text_for_arxiv_id.
+
+        Args:
+            arxiv_id (str): The arxiv id to get the text for.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+
+        Returns:
+            str: The extracted text from the html page.
+        """
+        return ' '.join(await self.get_sections_for_arxiv_id(arxiv_id, max_chars=max_chars))
+
+
+    async def get_sections_for_arxiv_id(self, arxiv_id=None, max_chars=None):
+        """
+        Fetches and extracts the section texts, see OtherHelper.get_sections_for_arxiv_id.
+
+        Args:
+            arxiv_id (str): The arxiv id to get the text for.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+
+        Returns:
+            list: The extracted section texts from the html page.
+        """
+        # SQLite access blocks, keep it off the event loop
+        cached = await asyncio.to_thread(self.get_cached_sections, arxiv_id, max_chars)
+        if cached and cached['fresh']:
+            return truncate_sections(cached['sections'], max_chars)[0]
+
+        result = await self.fetch_from_sources(arxiv_id, max_chars=max_chars, cached=cached)
+        if result['not_modified']:
+            # Page did not change, no need to parse it again
+            await asyncio.to_thread(self.CACHE.mark_validated, arxiv_id)
+            return truncate_sections(cached['sections'], max_chars)[0]
+
+        if self.CACHE and result['source'] not in LAST_RESORT_SOURCES:
+            await asyncio.to_thread(self.CACHE.put, arxiv_id, result['sections'],
+                                    etag=result['etag'],
+                                    last_modified=result['last_modified'],
+                                    complete=not result['truncated'],
+                                    source=result['source'])
+
+        return result['sections']
+
+
+    async def fetch_from_sources(self, arxiv_id, max_chars=None, cached=None):
+        """
+        Fetches an article from the first source that provides it, with fallback and hedged
+        requests, see OtherHelper.fetch_from_sources. The requests that lose are cancelled.
+
+        Args:
+            arxiv_id (str): The arxiv id.
+            max_chars (int): The maximum number of characters needed, or None for the full text.
+            cached (dict): The stale cache entry to revalidate, or None.
+
+        Returns:
+            dict: The result of fetch_from_source and the "source" it came from.
+
+        Raises:
+            Exception: If no source provides the article within FETCH_TIMEOUT.
+        """
+        deadline = time.monotonic() + self.FETCH_TIMEOUT
+
+        pending = {}
+        errors = []
+        next_index = 0
+        last_start = 0.0
+        try:
+            while (pending or next_index < len(self.SOURCES)) and time.monotonic() < deadline:
+                hedge_time = self.get_hedge_time(next_index, last_start) if pending else None
+                if not pending or (hedge_time is not None and time.monotonic() >= hedge_time):
+                    source, base_url = self.SOURCES[next_index]
+                    if pending:
+                        logging.debug(f"Hedging the download of {arxiv_id} with {source}")
+                        self.METRICS.observe_article_hedge(source)
+                    last_start = time.monotonic()
+                    headers = self.get_conditional_headers(cached, source)
+                    task = asyncio.create_task(self.fetch_from_source(source, base_url, arxiv_id, max_chars=max_chars,
+                                                                      headers=headers))
+                    pending[task] = (source, last_start)
+                    next_index += 1
+                    continue
+
+                timeout = deadline - time.monotonic()
+                if hedge_time is not None:
+                    timeout = min(timeout, hedge_time - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    source, start = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.record_source_result(arxiv_id, source, None, error=e)
+                        errors.append(f"{source}: {e}")
+                        continue
+                    self.record_source_result(arxiv_id, source, time.monotonic() - start)
+                    return {**result, 'source': source}
+        finally:
+            # Cancels the requests that are still running
+            for task, (source, _) in pending.items():
+                task.cancel()
+                self.METRICS.observe_article_source(source, "cancelled")
+
+        if pending:
+            errors.append(f"timed out after {self.FETCH_TIMEOUT} seconds")
+        raise Exception(f"No source provided the article {arxiv_id}: {'; '.join(errors)}")
+
+
+    async def fetch_from_source(self, source, base_url, arxiv_id, max_chars=None, headers=None):
+        """
+        Downloads and extracts an article from one source, see OtherHelper.fetch_from_source.
+        The page is downloaded completely and then parsed in the process pool.
+
+        Returns:
+            dict: The sections and the headers of the page, see OtherHelper.fetch_from_source.
+        """
+        url = get_source_url(source, base_url, arxiv_id)
+
+        with span("source", source=source):
+            start = time.perf_counter()
+            response = await self.CLIENT.request("GET", url, headers=None if source == SOURCE_ABSTRACT else headers)
+            self.METRICS.observe_stage(STAGE_FETCH, time.perf_counter() - start)
+
+            if source != SOURCE_ABSTRACT and headers and response.status_code == 304:
+                return {'sections': None, 'truncated': False, 'etag': None, 'last_modified': None,
+                        'not_modified': True}
 
-        url = "https://ar5iv.labs.arxiv.org/html/" + arxiv_id
+            response.raise_for_status()  # Ensure the request was successful
 
-        response = requests.get(url)
-        response.raise_for_status()  # Ensure the request was successful
+            if source == SOURCE_ABSTRACT:
+                return {'sections': parse_arxiv_abstract(response.content), 'truncated': False, 'etag': None,
+                        'last_modified': None, 'not_modified': False}
 
-        # Use 'lxml' or 'html5lib' for better parsing
-        soup = BeautifulSoup(response.content, 'html5lib')
-        # Remove <script> and <style> tags
-        for script_or_style in soup(['script', 'style']):
-            script_or_style.decompose()
+            check_rendered_page(response.content[:RENDERED_PAGE_PEEK_BYTES], str(response.url))
 
-            # Convert MathML to LaTeX
-        for math in soup.find_all('math'):
-            latex_annotation = math.find('annotation', {'encoding': 'application/x-tex'})
-            if latex_annotation:
-                # Replace MathML content with the LaTeX equivalent
-                math.replace_with(f"${latex_annotation.get_text()}$")
-            else:
-                # If no LaTeX annotation exists, remove the MathML entirely
-                math.decompose()
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            with span(STAGE_PARSE, extractor=self.EXTRACTOR) as parse_span:
+                if should_profile():
+                    # Profiled in the worker process, where the parsing runs
+                    (sections, truncated), parse_span['attributes']['profile'] = await loop.run_in_executor(
+                        self.PROCESS_POOL, run_profiled, extract_sections_from_chunks, [response.content], max_chars,
+                        self.EXTRACTOR)
+                else:
+                    sections, truncated = await loop.run_in_executor(
+                        self.PROCESS_POOL, extract_sections_from_chunks, [response.content], max_chars, self.EXTRACTOR)
+            self.METRICS.observe_stage(STAGE_PARSE, time.perf_counter() - start)
+            self.METRICS.observe_article(downloaded_bytes=len(response.content), text_chars=sum(map(len, sections)))
 
-        # Extract and return the text content
-        return soup.get_text(separator=' ', strip=True)
+            check_rendered_text(sections, max_chars)
+            return {'sections': sections, 'truncated': truncated, 'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'), 'not_modified': False}
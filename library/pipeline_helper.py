@@ -0,0 +1,508 @@
+import asyncio
+import json
+import logging
+from itertools import islice
+
+from library.metrics_helper import STAGE_WIKI, STAGE_WRITE
+from library.wiki_helper import WIKI_MAX_ENTITIES_PER_REQUEST, WIKI_PID_FOR_SUMMARY, WIKI_PID_FOR_SUMMARY_SIMPLE
+from library.llm_helper import (LLMError, LLM_MAX_ARTICLE_CHARS, SUMMARY_MODE_TWO_PASS, SUMMARY_MODE_CHUNKED,
+                                SUMMARY_MODE_SINGLE_PASS)
+
+
+# CONSTANTS
+CHUNKED_ARTICLE_CHAR_BUDGET = 200000
+
+
+class BatchItemError(Exception):
+    """
+    Raised for an entry of a batch request that holds no QID, e.g. a malformed JSON line. It is
+    reported as the result of the entry instead of failing the whole batch.
+    """
+
+
+def get_batch_entry_qid(entry, name):
+    """
+    Returns the QID of an entry of a batch request, a QID string or a {"QID": ...} object.
+
+    Args:
+        entry: The parsed entry.
+        name (str): The entry in error messages, e.g. "Line 3".
+
+    Returns:
+        str or BatchItemError: The QID, or the error if the entry holds none.
+    """
+    qid = entry.get('QID') if isinstance(entry, dict) else entry
+    if not isinstance(qid, str):
+        return BatchItemError(f"{name} holds no QID: {json.dumps(entry)[:100]}")
+    return qid
+
+
+def parse_batch_json(data):
+    """
+    Returns the entries of a batch request sent as a JSON list of QIDs or a JSON object with a "QIDs" list.
+
+    Args:
+        data: The parsed body, or None if it is not valid JSON.
+
+    Returns:
+        list: The entries, or None if the body is not such JSON.
+    """
+    entries = data.get('QIDs') if isinstance(data, dict) else data
+    return entries if isinstance(entries, list) else None
+
+
+def parse_batch_line(line, number):
+    """
+    Returns the QID of a JSON line of a batch request.
+
+    Args:
+        line (bytes): The line.
+        number (int): The line number, for error messages.
+
+    Returns:
+        str or BatchItemError: The QID, or the error if the line holds none.
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError as e:
+        return BatchItemError(f"Line {number} is not valid JSON: {e}")
+    return get_batch_entry_qid(entry, f"Line {number}")
+
+
+def format_batch_result(qid, result, error):
+    """
+    Returns the NDJSON line of a batch entry: its result, or its QID and error.
+
+    Args:
+        qid (str or BatchItemError): The QID of the entry, see parse_batch_line.
+        result (dict): The result of the summary job, or None.
+        error (Exception): The error of the summary job, or None.
+
+    Returns:
+        str: The line.
+    """
+    if isinstance(qid, BatchItemError):
+        result = {"error": str(error)}
+    elif error is not None:
+        result = {"qid": qid, "error": str(error)}
+    return json.dumps(result) + "\n"
+
+
+class SummaryPipeline:
+    """
+    The summary pipeline shared by the servers: wiki lookup, article fetch, LLM summary and wiki edit.
+    Each stage holds a slot of its stage in the JobHelper, so that concurrent jobs and batch items
+    overlap their stages. Summaries generated from the same input (see LLMHelper.get_summary_fingerprint)
+    are reused from the summary index.
+    """
+
+    def __init__(self, llm, wiki, other, jobs, metrics, summary_index=None, article_char_budget=LLM_MAX_ARTICLE_CHARS,
+                 chunked_article_char_budget=CHUNKED_ARTICLE_CHAR_BUDGET):
+        """
+        Initializes the SummaryPipeline.
+
+        Args:
+            llm (LLMHelper): Generates the summaries.
+            wiki (WikiHelper): Reads the items and writes the summaries.
+            other (OtherHelper): Fetches the articles.
+            jobs (JobHelper): Limits the concurrency of the stages.
+            metrics (MetricsHelper): Collects the stage latencies and cache hits.
+            summary_index (SummaryIndex): The generated summaries and their input fingerprints, or None.
+            article_char_budget (int): Characters of an article needed for a summary.
+            chunked_article_char_budget (int): Characters of an article needed for a chunked summary.
+        """
+        self.LLM = llm
+        self.WIKI = wiki
+        self.OTHER = other
+        self.JOBS = jobs
+        self.METRICS = metrics
+        self.SUMMARY_INDEX = summary_index
+        self.ARTICLE_CHAR_BUDGET = article_char_budget
+        self.CHUNKED_ARTICLE_CHAR_BUDGET = chunked_article_char_budget
+
+    @staticmethod
+    def get_index_key(qid, mode, simple=False):
+        """
+        Returns the key of a summary in the summary index.
+        """
+        return f"{qid}:{mode}:simple" if simple else f"{qid}:{mode}"
+
+    def get_summarize_function(self, mode):
+        """
+        Returns the method of the LLMHelper generating the summaries of a mode.
+
+        Args:
+            mode (str): The summary mode.
+
+        Returns:
+            callable: The method, called with the article, use_cache and result.
+        """
+        if mode == SUMMARY_MODE_CHUNKED:
+            return self.LLM.summarize_article_chunked
+        if mode == SUMMARY_MODE_SINGLE_PASS:
+            return self.LLM.summarize_article_single_pass
+        return self.LLM.summarize_article
+
+    def get_changed_summaries(self, summaries):
+        """
+        Returns the summaries that are not in the wiki yet, as written by the current model.
+
+        Args:
+            summaries (dict): The generated text and the current statement (see WikiHelper.get_arxivids_for_qids)
+                by property ID.
+
+        Returns:
+            dict: The text and the ID of the statement to replace (or None) by property ID, see
+                  WikiHelper.write_summaries.
+        """
+        return {property_id: (text, current['statement_id'] if current else None)
+                for property_id, (text, current) in summaries.items()
+                if not (current and current['text'] == text and current['generated_by'] == self.LLM.LLM_TO_USE)}
+
+    def lookup_item(self, qid):
+        """
+        Reads the arXiv id and the summary statements of an item.
+
+        Returns:
+            dict: The item, see WikiHelper.get_arxivids_for_qids.
+        """
+        with self.JOBS.stage("wiki"):
+            with self.METRICS.time_stage(STAGE_WIKI):
+                return self.WIKI.get_arxivids_for_qids([qid])[qid]
+
+    def fetch_article(self, arxiv_id, mode=SUMMARY_MODE_TWO_PASS):
+        """
+        Fetches the article text needed for a summary mode: the sections for chunked summaries,
+        otherwise the text.
+        """
+        with self.JOBS.stage("fetch"):
+            if mode == SUMMARY_MODE_CHUNKED:
+                return self.OTHER.get_sections_for_arxiv_id(arxiv_id, max_chars=self.CHUNKED_ARTICLE_CHAR_BUDGET)
+            return self.OTHER.get_rendered_text_for_arxiv_id(arxiv_id, max_chars=self.ARTICLE_CHAR_BUDGET)
+
+    def get_indexed_summary(self, key, fingerprint):
+        """
+        Returns the summary of the index generated from the same input, or None.
+        """
+        if self.SUMMARY_INDEX is None:
+            return None
+        summary = self.SUMMARY_INDEX.get(key, fingerprint)
+        self.METRICS.observe_cache("summary_index", summary is not None)
+        return summary
+
+    def index_summary(self, key, fingerprint, summary):
+        """
+        Stores a generated summary in the index, if configured.
+        """
+        if self.SUMMARY_INDEX is not None:
+            self.SUMMARY_INDEX.put(key, fingerprint, summary)
+
+    def summarize(self, article, mode, force=False, result=None):
+        """
+        Generates the summary of an article.
+
+        Raises:
+            Exception: If the summary generation failed.
+        """
+        with self.JOBS.stage("llm"):
+            try:
+                return self.get_summarize_function(mode)(article, use_cache=not force, result=result)
+            except LLMError as e:
+                raise Exception(f"Summary generation failed: {e}") from e
+
+    def summarize_simple(self, summary, previous=None, force=False):
+        """
+        Generates the simple-language summary, continuing from the generation of the summary.
+
+        Raises:
+            Exception: If the summary generation failed.
+        """
+        with self.JOBS.stage("llm"):
+            try:
+                return self.LLM.summarize_simple(summary, previous=previous, use_cache=not force)
+            except LLMError as e:
+                raise Exception(f"Simple summary generation failed: {e}") from e
+
+    def write_summaries(self, qid, summaries):
+        """
+        Writes the summaries to the wiki in one edit, unless they are already there.
+
+        Args:
+            qid (str): The QID of the article.
+            summaries (dict): The generated text and the current statement by property ID.
+
+        Returns:
+            bool: Whether the wiki holds the summaries.
+        """
+        changed = self.get_changed_summaries(summaries)
+        if not changed:
+            return True
+        with self.JOBS.stage("write"):
+            with self.METRICS.time_stage(STAGE_WRITE):
+                return self.WIKI.write_summaries(qid, changed, generated_by=self.LLM.LLM_TO_USE)
+
+    def run_summary_job(self, qid, item=None, mode=SUMMARY_MODE_TWO_PASS, write=False, force=False, simple=False):
+        """
+        Runs the summary pipeline for a single QID. Ledger jobs run it by its name.
+
+        Args:
+            qid (str): The QID of the article.
+            item (dict): The item as returned by WikiHelper.get_arxivids_for_qids, if already resolved.
+            mode (str): The summary mode, one of SUMMARY_MODES.
+            write (bool): Whether to write the summary to the wiki.
+            force (bool): Whether to generate the summary even if it was already generated from the same input.
+            simple (bool): Whether to generate the simple-language summary as well.
+
+        Returns:
+            dict: The QID, arXiv id and generated summary (and simple summary), whether the summary was
+                  reused ("unchanged") and, if write is set, whether the wiki holds the summaries ("written").
+
+        Raises:
+            Exception: If the QID has no arXiv id or the summary generation failed.
+        """
+        if item is None:
+            item = self.lookup_item(qid)
+        arxiv_id = item['arxiv_id']
+        logging.debug(f"arXiv ID: {arxiv_id}")
+        if arxiv_id is None:
+            raise Exception("Invalid QID")
+
+        article = self.fetch_article(arxiv_id, mode)
+
+        index_key = self.get_index_key(qid, mode)
+        fingerprint = self.LLM.get_summary_fingerprint(arxiv_id, article, mode=mode)
+        summary = None if force else self.get_indexed_summary(index_key, fingerprint)
+        unchanged = summary is not None
+
+        # The simple summary continues from the last generation of the summary
+        generation = {}
+        if not unchanged:
+            summary = self.summarize(article, mode, force=force, result=generation)
+            logging.debug(summary)
+            self.index_summary(index_key, fingerprint, summary)
+
+        result = {"qid": qid, "arxiv_id": arxiv_id, "summary": summary, "unchanged": unchanged}
+        summaries = {WIKI_PID_FOR_SUMMARY: (summary, item['summary'])}
+
+        if simple:
+            simple_key = self.get_index_key(qid, mode, simple=True)
+            simple_fingerprint = self.LLM.get_summary_fingerprint(arxiv_id, article, mode=mode, simple=True)
+            summary_simple = self.get_indexed_summary(simple_key, simple_fingerprint) if unchanged else None
+            if summary_simple is None:
+                summary_simple = self.summarize_simple(summary, previous=generation, force=force)
+                self.index_summary(simple_key, simple_fingerprint, summary_simple)
+
+            result['summary_simple'] = summary_simple
+            summaries[WIKI_PID_FOR_SUMMARY_SIMPLE] = (summary_simple, item['summary_simple'])
+
+        if write:
+            result['written'] = self.write_summaries(qid, summaries)
+
+        return result
+
+    def resolve_chunk(self, chunk):
+        """
+        Resolves the arXiv ids of a chunk of QIDs with one wiki request.
+
+        Args:
+            chunk (list): The QIDs, or the errors of entries without QID, see parse_batch_line.
+
+        Returns:
+            dict: The items by QID, empty if the request failed. The jobs resolve their QIDs themselves
+                  then and report the failure per item.
+        """
+        qids = [qid for qid in chunk if not isinstance(qid, BatchItemError)]
+        if not qids:
+            return {}
+        try:
+            with self.JOBS.stage("wiki"):
+                with self.METRICS.time_stage(STAGE_WIKI):
+                    return self.WIKI.get_arxivids_for_qids(qids)
+        except Exception as e:
+            logging.warning(f"Resolving {len(qids)} QIDs failed: {e}")
+            return {}
+
+    def resolve_batch_qids(self, qids):
+        """
+        Resolves the arXiv ids of QIDs in chunks, with one wiki request per chunk.
+        Chunks are resolved lazily, while the items of the previous chunk are processed.
+
+        Args:
+            qids (iterable): The QIDs, or the errors of entries without QID.
+
+        Yields:
+            tuple: The QID and the item as returned by WikiHelper.get_arxivids_for_qids, or None if
+                   the wiki request failed or the entry holds no QID.
+        """
+        qids = iter(qids)
+        while chunk := list(islice(qids, WIKI_MAX_ENTITIES_PER_REQUEST)):
+            items = self.resolve_chunk(chunk)
+            for qid in chunk:
+                yield qid, items.get(qid)
+
+    def run_batch_item(self, qid, item, **options):
+        """
+        Runs the summary pipeline for an entry of a batch request, see run_summary_job.
+
+        Raises:
+            BatchItemError: If the entry holds no QID.
+        """
+        if isinstance(qid, BatchItemError):
+            raise qid
+        return self.run_summary_job(qid, item, **options)
+
+
+class AsyncSummaryPipeline(SummaryPipeline):
+    """
+    Asyncio variant of the SummaryPipeline for the async helpers (AsyncLLMHelper, AsyncWikiHelper,
+    AsyncOtherHelper and AsyncJobHelper). The summary index is accessed in threads.
+    """
+
+    async def lookup_item(self, qid):
+        """
+        Reads the arXiv id and the summary statements of an item, see SummaryPipeline.lookup_item.
+        """
+        async with self.JOBS.stage("wiki"):
+            with self.METRICS.time_stage(STAGE_WIKI):
+                return (await self.WIKI.get_arxivids_for_qids([qid]))[qid]
+
+    async def fetch_article(self, arxiv_id, mode=SUMMARY_MODE_TWO_PASS):
+        """
+        Fetches the article text needed for a summary mode, see SummaryPipeline.fetch_article.
+        """
+        async with self.JOBS.stage("fetch"):
+            if mode == SUMMARY_MODE_CHUNKED:
+                return await self.OTHER.get_sections_for_arxiv_id(arxiv_id, max_chars=self.CHUNKED_ARTICLE_CHAR_BUDGET)
+            return await self.OTHER.get_rendered_text_for_arxiv_id(arxiv_id, max_chars=self.ARTICLE_CHAR_BUDGET)
+
+    async def get_indexed_summary(self, key, fingerprint):
+        """
+        Returns the summary of the index generated from the same input, see SummaryPipeline.get_indexed_summary.
+        """
+        return await asyncio.to_thread(super().get_indexed_summary, key, fingerprint)
+
+    async def index_summary(self, key, fingerprint, summary):
+        """
+        Stores a generated summary in the index, see SummaryPipeline.index_summary.
+        """
+        await asyncio.to_thread(super().index_summary, key, fingerprint, summary)
+
+    async def summarize(self, article, mode, force=False, result=None):
+        """
+        Generates the summary of an article, see SummaryPipeline.summarize.
+        """
+        async with self.JOBS.stage("llm"):
+            try:
+                return await self.get_summarize_function(mode)(article, use_cache=not force, result=result)
+            except LLMError as e:
+                raise Exception(f"Summary generation failed: {e}") from e
+
+    async def summarize_simple(self, summary, previous=None, force=False):
+        """
+        Generates the simple-language summary, see SummaryPipeline.summarize_simple.
+        """
+        async with self.JOBS.stage("llm"):
+            try:
+                return await self.LLM.summarize_simple(summary, previous=previous, use_cache=not force)
+            except LLMError as e:
+                raise Exception(f"Simple summary generation failed: {e}") from e
+
+    async def write_summaries(self, qid, summaries):
+        """
+        Writes the summaries to the wiki in one edit, see SummaryPipeline.write_summaries.
+        """
+        changed = self.get_changed_summaries(summaries)
+        if not changed:
+            return True
+        async with self.JOBS.stage("write"):
+            with self.METRICS.time_stage(STAGE_WRITE):
+                return await self.WIKI.write_summaries(qid, changed, generated_by=self.LLM.LLM_TO_USE)
+
+    async def run_summary_job(self, qid, item=None, mode=SUMMARY_MODE_TWO_PASS, write=False, force=False,
+                              simple=False):
+        """
+        Runs the summary pipeline for a single QID, see SummaryPipeline.run_summary_job.
+        """
+        if item is None:
+            item = await self.lookup_item(qid)
+        arxiv_id = item['arxiv_id']
+        if arxiv_id is None:
+            raise Exception("Invalid QID")
+
+        article = await self.fetch_article(arxiv_id, mode)
+
+        index_key = self.get_index_key(qid, mode)
+        fingerprint = self.LLM.get_summary_fingerprint(arxiv_id, article, mode=mode)
+        summary = None if force else await self.get_indexed_summary(index_key, fingerprint)
+        unchanged = summary is not None
+
+        # The simple summary continues from the last generation of the summary
+        generation = {}
+        if not unchanged:
+            summary = await self.summarize(article, mode, force=force, result=generation)
+            await self.index_summary(index_key, fingerprint, summary)
+
+        result = {"qid": qid, "arxiv_id": arxiv_id, "summary": summary, "unchanged": unchanged}
+        summaries = {WIKI_PID_FOR_SUMMARY: (summary, item['summary'])}
+
+        if simple:
+            simple_key = self.get_index_key(qid, mode, simple=True)
+            simple_fingerprint = self.LLM.get_summary_fingerprint(arxiv_id, article, mode=mode, simple=True)
+            summary_simple = await self.get_indexed_summary(simple_key, simple_fingerprint) if unchanged else None
+            if summary_simple is None:
+                summary_simple = await self.summarize_simple(summary, previous=generation, force=force)
+                await self.index_summary(simple_key, simple_fingerprint, summary_simple)
+
+            result['summary_simple'] = summary_simple
+            summaries[WIKI_PID_FOR_SUMMARY_SIMPLE] = (summary_simple, item['summary_simple'])
+
+        if write:
+            result['written'] = await self.write_summaries(qid, summaries)
+
+        return result
+
+    async def resolve_chunk(self, chunk):
+        """
+        Resolves the arXiv ids of a chunk of QIDs with one wiki request, see SummaryPipeline.resolve_chunk.
+        """
+        qids = [qid for qid in chunk if not isinstance(qid, BatchItemError)]
+        if not qids:
+            return {}
+        try:
+            async with self.JOBS.stage("wiki"):
+                with self.METRICS.time_stage(STAGE_WIKI):
+                    return await self.WIKI.get_arxivids_for_qids(qids)
+        except Exception as e:
+            logging.warning(f"Resolving {len(qids)} QIDs failed: {e}")
+            return {}
+
+    async def resolve_batch_qids(self, qids):
+        """
+        Resolves the arXiv ids of QIDs in chunks, see SummaryPipeline.resolve_batch_qids.
+
+        Args:
+            qids (async iterable): The QIDs, or the errors of entries without QID.
+        """
+        chunk = []
+        async for qid in qids:
+            chunk.append(qid)
+            if len(chunk) < WIKI_MAX_ENTITIES_PER_REQUEST:
+                continue
+
+            items = await self.resolve_chunk(chunk)
+            for chunk_qid in chunk:
+                yield chunk_qid, items.get(chunk_qid)
+            chunk = []
+
+        if chunk:
+            items = await self.resolve_chunk(chunk)
+            for chunk_qid in chunk:
+                yield chunk_qid, items.get(chunk_qid)
+
+    async def run_batch_item(self, qid, item, **options):
+        """
+        Runs the summary pipeline for an entry of a batch request, see SummaryPipeline.run_batch_item.
+        """
+        if isinstance(qid, BatchItemError):
+            raise qid
+        return await self.run_summary_job(qid, item, **options)
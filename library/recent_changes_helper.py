@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from library.http_helper import create_session
+from library.llm_helper import SUMMARY_MODE_TWO_PASS
+
+
+# CONSTANTS
+RC_REMEMBERED_QIDS = 10000
+
+
+class RecentChangesConsumer:
+    """
+    Polls the recent changes of the wiki for items with an arXiv id but without a summary and
+    sends them in batches to the /generate_article_summaries endpoint of the service, at most
+    RATE QIDs per second. The position in the recent changes is stored in a checkpoint file after
+    each page, so that a restarted consumer resumes where it stopped instead of rescanning.
+    """
+
+    def __init__(self, wiki, service_url, checkpoint_path="cache/recent_changes.json", start=None, rate=0.5,
+                 batch_size=50, poll_interval=60, mode=SUMMARY_MODE_TWO_PASS, write=True, exclude_user=None,
+                 http_options=None):
+        """
+        Initializes the RecentChangesConsumer.
+
+        Args:
+            wiki (WikiHelper): Reads the recent changes and the items.
+            service_url (str): Base url of the service, e.g. "http://localhost:5000".
+            checkpoint_path (str): Path to the JSON file with the position in the recent changes.
+            start (str): ISO 8601 timestamp to start at without checkpoint file, or None to start
+                with the oldest change the wiki still lists.
+            rate (float): Maximum number of QIDs sent to the service per second.
+            batch_size (int): Maximum number of QIDs per batch request.
+            poll_interval (float): Seconds between two polls once all changes are consumed.
+            mode (str): The summary mode.
+            write (bool): Whether the service writes the summaries to the wiki.
+            exclude_user (str): Name of a user whose changes are skipped, e.g. the bot writing the summaries.
+            http_options (dict): Timeout, retry and pool options for the session, see http_helper.create_session.
+        """
+        self.WIKI = wiki
+        self.SERVICE_URL = service_url.rstrip('/')
+        self.CHECKPOINT_PATH = checkpoint_path
+        self.START = start
+        self.RATE = rate
+        self.BATCH_SIZE = batch_size
+        self.POLL_INTERVAL = poll_interval
+        self.MODE = mode
+        self.WRITE = write
+        self.EXCLUDE_USER = exclude_user
+        self.SESSION = create_session(**(http_options or {}))
+
+        # QIDs sent recently, so that items edited several times in a row are only summarized once
+        self.SUBMITTED_QIDS = OrderedDict()
+        self.STOP_EVENT = threading.Event()
+        self.next_submit_time = 0.0
+
+    def load_checkpoint(self):
+        """
+        Reads the checkpoint file.
+
+        Returns:
+            dict: The timestamp and the id of the last consumed change ("start", "last_rcid") and the
+                  continue token of the next page ("continue"). Without checkpoint file only START is set.
+        """
+        try:
+            with open(self.CHECKPOINT_PATH, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'start': self.START}
+
+    def save_checkpoint(self, checkpoint):
+        """
+        Writes the checkpoint file atomically, so that a crash leaves either the old or the new one.
+        """
+        checkpoint_dir = os.path.dirname(self.CHECKPOINT_PATH)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+        temp_path = self.CHECKPOINT_PATH + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, self.CHECKPOINT_PATH)
+
+    def select_qids(self, qids):
+        """
+        Selects the items to summarize: items with an arXiv id, without summary statement, and not
+        sent recently. The items are read with bulk wbgetentities requests.
+
+        Args:
+            qids (list): The QIDs of changed items, without duplicates.
+
+        Returns:
+            list: The QIDs to summarize.
+        """
+        qids = [qid for qid in qids if qid not in self.SUBMITTED_QIDS]
+        if not qids:
+            return []
+
+        items = self.WIKI.get_arxivids_for_qids(qids)
+        return [qid for qid in qids if items[qid]['arxiv_id'] and not items[qid]['summary']]
+
+    def wait_for_rate(self, count):
+        """
+        Blocks until count QIDs may be sent without exceeding RATE QIDs per second.
+        """
+        delay = self.next_submit_time - time.monotonic()
+        if delay > 0:
+            self.STOP_EVENT.wait(delay)
+        self.next_submit_time = max(self.next_submit_time, time.monotonic()) + count / self.RATE
+
+    def submit(self, qids):
+        """
+        Sends QIDs to the batch endpoint of the service and waits for their results.
+        Failures of single QIDs are logged and not retried.
+
+        Args:
+            qids (list): The QIDs.
+
+        Returns:
+            int: The number of summaries generated.
+
+        Raises:
+            requests.exceptions.RequestException: If the service cannot be reached or fails.
+        """
+        self.wait_for_rate(len(qids))
+
+        params = {'mode': self.MODE}
+        if self.WRITE:
+            params['write'] = 'true'
+        done = 0
+        with self.SESSION.post(f"{self.SERVICE_URL}/generate_article_summaries", params=params, json=qids,
+                               stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if 'error' in result:
+                    logging.error(f"Summary of {result.get('qid')} failed: {result['error']}")
+                else:
+                    done += 1
+
+        for qid in qids:
+            self.SUBMITTED_QIDS[qid] = True
+            self.SUBMITTED_QIDS.move_to_end(qid)
+        while len(self.SUBMITTED_QIDS) > RC_REMEMBERED_QIDS:
+            self.SUBMITTED_QIDS.popitem(last=False)
+
+        return done
+
+    def consume_page(self, checkpoint):
+        """
+        Reads the next page of recent changes after a checkpoint and summarizes its new items.
+
+        Args:
+            checkpoint (dict): The checkpoint, see load_checkpoint.
+
+        Returns:
+            tuple: The checkpoint after the page, and whether more changes are pending.
+        """
+        changes, continue_token = self.WIKI.get_recent_changes(start=checkpoint.get('start'),
+                                                               continue_token=checkpoint.get('continue'),
+                                                               exclude_user=self.EXCLUDE_USER)
+
+        # Without continue token the page starts at the timestamp of the last consumed change,
+        # which returns that change (and others of the same second) again
+        last_rcid = checkpoint.get('last_rcid', 0)
+        changes = [change for change in changes if change['rcid'] > last_rcid]
+        if not changes:
+            return checkpoint, False
+
+        qids = self.select_qids(list(dict.fromkeys(change['qid'] for change in changes)))
+        for i in range(0, len(qids), self.BATCH_SIZE):
+            batch = qids[i:i + self.BATCH_SIZE]
+            done = self.submit(batch)
+            logging.info(f"Summarized {done} of {len(batch)} items")
+
+        checkpoint = {
+            'start': changes[-1]['timestamp'],
+            'last_rcid': max(change['rcid'] for change in changes),
+            'continue': continue_token,
+        }
+        self.save_checkpoint(checkpoint)
+        return checkpoint, continue_token is not None
+
+    def run_once(self):
+        """
+        Consumes all pending recent changes.
+        """
+        checkpoint = self.load_checkpoint()
+        pending = True
+        while pending and not self.STOP_EVENT.is_set():
+            checkpoint, pending = self.consume_page(checkpoint)
+
+    def run(self):
+        """
+        Consumes the recent changes until stop is called. Errors (e.g. an unreachable service) are
+        logged and the failed page is retried after POLL_INTERVAL.
+        """
+        while not self.STOP_EVENT.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Consuming the recent changes failed: {e}")
+            self.STOP_EVENT.wait(self.POLL_INTERVAL)
+
+    def stop(self):
+        """
+        Stops run after the current batch.
+        """
+        self.STOP_EVENT.set()
@@ -0,0 +1,366 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+
+
+# CONSTANTS
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+PRIORITY_WEIGHTS = {PRIORITY_INTERACTIVE: 4, PRIORITY_BULK: 1}
+RATE_LIMIT_MAX_CLIENTS = 10000
+
+
+CURRENT_PRIORITY = contextvars.ContextVar("current_priority", default=PRIORITY_INTERACTIVE)
+
+
+def get_priority():
+    """
+    Returns the priority class of the running request or job, PRIORITY_INTERACTIVE by default.
+    """
+    return CURRENT_PRIORITY.get()
+
+
+@contextmanager
+def priority(priority_class):
+    """
+    Context manager setting the priority class of the running request or job, which is used by the
+    stages of a JobHelper. Jobs and batch items inherit it from the submitter.
+
+    Args:
+        priority_class (str): One of PRIORITIES.
+    """
+    token = CURRENT_PRIORITY.set(priority_class)
+    try:
+        yield
+    finally:
+        CURRENT_PRIORITY.reset(token)
+
+
+class StrideScheduler:
+    """
+    Weighted fair choice between priority classes (stride scheduling): a class that is served
+    advances its pass by 1/weight, and the waiting class with the lowest pass is served next. With
+    weights 4 and 1, four interactive requests are served for every bulk request while both wait,
+    and an idle class takes all slots. Classes do not save up credit while they are idle.
+    Not thread-safe, the caller holds its lock.
+    """
+
+    def __init__(self, weights=None):
+        """
+        Initializes the StrideScheduler.
+
+        Args:
+            weights (dict): The weight by priority class, PRIORITY_WEIGHTS by default.
+        """
+        self.WEIGHTS = dict(weights or PRIORITY_WEIGHTS)
+        self.PASSES = {priority_class: 0.0 for priority_class in self.WEIGHTS}
+        self.VIRTUAL_TIME = 0.0
+
+    def order(self, ready=None):
+        """
+        Returns the priority classes in the order they are to be served.
+
+        Args:
+            ready (iterable): The classes with waiting work, all classes by default.
+
+        Returns:
+            list: The classes.
+        """
+        ready = list(self.WEIGHTS if ready is None else ready)
+        return sorted(ready, key=lambda priority_class: (max(self.PASSES[priority_class], self.VIRTUAL_TIME),
+                                                          -self.WEIGHTS[priority_class]))
+
+    def charge(self, priority_class):
+        """
+        Records that a class was served.
+
+        Args:
+            priority_class (str): The class.
+        """
+        start = max(self.PASSES[priority_class], self.VIRTUAL_TIME)
+        self.VIRTUAL_TIME = start
+        self.PASSES[priority_class] = start + 1 / self.WEIGHTS[priority_class]
+
+    def choose(self, ready):
+        """
+        Returns the next class to serve among the ready ones and charges it.
+
+        Args:
+            ready (iterable): The classes with waiting work.
+
+        Returns:
+            str: The class, or None if no class is ready.
+        """
+        ready = list(ready)
+        if not ready:
+            return None
+        priority_class = self.order(ready)[0]
+        self.charge(priority_class)
+        return priority_class
+
+
+class FairQueue:
+    """
+    A queue with a bounded FIFO per priority class. get takes the items of the classes in weighted fair
+    order, see StrideScheduler.
+    """
+
+    def __init__(self, weights=None, max_sizes=None):
+        """
+        Initializes the FairQueue.
+
+        Args:
+            weights (dict): The weight by priority class, PRIORITY_WEIGHTS by default.
+            max_sizes (dict): Maximum number of queued items by priority class, unbounded by default.
+        """
+        self.SCHEDULER = StrideScheduler(weights)
+        self.MAX_SIZES = dict(max_sizes or {})
+        self.CONDITION = threading.Condition()
+        self.ITEMS = {priority_class: deque() for priority_class in self.SCHEDULER.WEIGHTS}
+
+    def put_nowait(self, item, priority_class=PRIORITY_INTERACTIVE):
+        """
+        Adds an item to the queue of its class.
+
+        Args:
+            item: The item.
+            priority_class (str): The class.
+
+        Raises:
+            queue.Full: If the queue of the class is full.
+        """
+        with self.CONDITION:
+            max_size = self.MAX_SIZES.get(priority_class)
+            if max_size is not None and len(self.ITEMS[priority_class]) >= max_size:
+                raise queue.Full()
+            self.ITEMS[priority_class].append(item)
+            self.CONDITION.notify()
+
+    def get(self):
+        """
+        Removes and returns the next item, waiting until there is one.
+
+        Returns:
+            tuple: The item and its priority class.
+        """
+        with self.CONDITION:
+            while True:
+                priority_class = self.SCHEDULER.choose(
+                    priority_class for priority_class, items in self.ITEMS.items() if items)
+                if priority_class is not None:
+                    return self.ITEMS[priority_class].popleft(), priority_class
+                self.CONDITION.wait()
+
+    def qsize(self, priority_class=None):
+        """
+        Returns the number of queued items of a class, or of all classes.
+        """
+        with self.CONDITION:
+            if priority_class is not None:
+                return len(self.ITEMS[priority_class])
+            return sum(len(items) for items in self.ITEMS.values())
+
+
+class FairSemaphore:
+    """
+    A semaphore whose free slots are handed to the waiting priority classes in weighted fair order,
+    see StrideScheduler. Within a class, waiters are served in no particular order.
+    """
+
+    def __init__(self, limit, weights=None):
+        """
+        Initializes the FairSemaphore.
+
+        Args:
+            limit (int): Number of slots.
+            weights (dict): The weight by priority class, PRIORITY_WEIGHTS by default.
+        """
+        self.LIMIT = limit
+        self.SCHEDULER = StrideScheduler(weights)
+        self.CONDITION = threading.Condition()
+        self.IN_USE = 0
+        self.WAITING = {priority_class: 0 for priority_class in self.SCHEDULER.WEIGHTS}
+        self.GRANTED = {priority_class: 0 for priority_class in self.SCHEDULER.WEIGHTS}
+
+    @contextmanager
+    def slot(self, priority_class=None):
+        """
+        Context manager holding a slot.
+
+        Args:
+            priority_class (str): The class of the holder, the current priority (see get_priority) by default.
+        """
+        self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, priority_class=None):
+        """
+        Takes a slot, waiting until it is granted to the class.
+
+        Args:
+            priority_class (str): The class of the holder, the current priority (see get_priority) by default.
+        """
+        priority_class = priority_class or get_priority()
+        with self.CONDITION:
+            # Granted waiters that did not wake up yet already count as in use
+            if self.IN_USE < self.LIMIT and not any(waiting > self.GRANTED[waiting_class]
+                                                    for waiting_class, waiting in self.WAITING.items()):
+                self.IN_USE += 1
+                self.SCHEDULER.charge(priority_class)
+                return
+
+            self.WAITING[priority_class] += 1
+            try:
+                while not self.GRANTED[priority_class]:
+                    self.CONDITION.wait()
+                self.GRANTED[priority_class] -= 1
+            finally:
+                self.WAITING[priority_class] -= 1
+
+    def release(self):
+        """
+        Returns a slot, and grants it to the next waiting class.
+        """
+        with self.CONDITION:
+            self.IN_USE -= 1
+            priority_class = self.SCHEDULER.choose(
+                priority_class for priority_class, waiting in self.WAITING.items()
+                if waiting > self.GRANTED[priority_class])
+            if priority_class is not None:
+                self.IN_USE += 1
+                self.GRANTED[priority_class] += 1
+                self.CONDITION.notify_all()
+
+
+class AsyncFairSemaphore:
+    """
+    Asyncio variant of the FairSemaphore. Within a class, waiters are served in FIFO order.
+    Must be used from within the event loop.
+    """
+
+    def __init__(self, limit, weights=None):
+        """
+        Initializes the AsyncFairSemaphore.
+
+        Args:
+            limit (int): Number of slots.
+            weights (dict): The weight by priority class, PRIORITY_WEIGHTS by default.
+        """
+        self.LIMIT = limit
+        self.SCHEDULER = StrideScheduler(weights)
+        self.IN_USE = 0
+        self.WAITERS = {priority_class: deque() for priority_class in self.SCHEDULER.WEIGHTS}
+
+    @asynccontextmanager
+    async def slot(self, priority_class=None):
+        """
+        Async context manager holding a slot.
+
+        Args:
+            priority_class (str): The class of the holder, the current priority (see get_priority) by default.
+        """
+        await self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority_class=None):
+        """
+        Takes a slot, waiting until it is granted to the class.
+
+        Args:
+            priority_class (str): The class of the holder, the current priority (see get_priority) by default.
+        """
+        priority_class = priority_class or get_priority()
+        if self.IN_USE < self.LIMIT and not any(self.WAITERS.values()):
+            self.IN_USE += 1
+            self.SCHEDULER.charge(priority_class)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.WAITERS[priority_class].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted before the cancellation, hand it on
+                self.release()
+            elif waiter in self.WAITERS[priority_class]:
+                self.WAITERS[priority_class].remove(waiter)
+            raise
+
+    def release(self):
+        """
+        Returns a slot, and grants it to the next waiting class.
+        """
+        self.IN_USE -= 1
+        # Waiters cancelled since are removed when their task resumes, skip them
+        for waiters in self.WAITERS.values():
+            while waiters and waiters[0].done():
+                waiters.popleft()
+        priority_class = self.SCHEDULER.choose(
+            priority_class for priority_class, waiters in self.WAITERS.items() if waiters)
+        if priority_class is not None:
+            self.IN_USE += 1
+            self.WAITERS[priority_class].popleft().set_result(None)
+
+
+class RateLimiter:
+    """
+    Per-client rate limits with token buckets: every client may send burst requests at once and
+    rate requests per second on average. The buckets of the least recently seen clients are dropped
+    beyond max_clients.
+    """
+
+    def __init__(self, rate, burst=10, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            rate (float): Requests per second per client.
+            burst (int): Requests a client may send at once.
+            max_clients (int): Number of clients whose buckets are kept.
+        """
+        self.RATE = rate
+        self.BURST = burst
+        self.MAX_CLIENTS = max_clients
+        self.LOCK = threading.Lock()
+
+        # (tokens, time of the last update) by client, least recently seen first
+        self.BUCKETS = OrderedDict()
+
+    def acquire(self, client, cost=1):
+        """
+        Takes tokens from the bucket of a client, if there are enough.
+
+        Args:
+            client (str): The id of the client, e.g. its address.
+            cost (int): The number of tokens.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise the seconds until enough tokens are there.
+        """
+        now = time.monotonic()
+        with self.LOCK:
+            tokens, updated = self.BUCKETS.pop(client, (self.BURST, now))
+            tokens = min(self.BURST, tokens + (now - updated) * self.RATE)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / self.RATE
+
+            self.BUCKETS[client] = (tokens, now)
+            while len(self.BUCKETS) > self.MAX_CLIENTS:
+                self.BUCKETS.popitem(last=False)
+
+        return retry_after
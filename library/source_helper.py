@@ -0,0 +1,225 @@
+import time
+import threading
+from collections import deque
+
+
+# CONSTANTS
+SOURCE_AR5IV = "ar5iv"
+SOURCE_ARXIV_HTML = "arxiv_html"
+SOURCE_ABSTRACT = "abstract"
+ARXIV_HTML_URL = "https://arxiv.org/html/"
+ARXIV_ABSTRACT_URL = "https://export.arxiv.org/api/query"
+# Sources that are only tried once all other sources failed, never as hedged request
+LAST_RESORT_SOURCES = frozenset({SOURCE_ABSTRACT})
+# Rendered articles are generated by LaTeXML; failure pages carry an error banner or no document at all
+RENDERED_PAGE_MARKER = b"ltx_document"
+RENDERED_PAGE_FAILURE_MARKERS = (b"Conversion to HTML had a Fatal error", b"This document may be truncated or damaged")
+RENDERED_PAGE_PEEK_BYTES = 128 * 1024
+RENDERED_PAGE_MIN_CHARS = 500
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_DELAY = 1.0
+HEDGE_MAX_DELAY = 10.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+ATOM_NAMESPACE = "{http://www.w3.org/2005/Atom}"
+
+
+class SourceFailedError(Exception):
+    """
+    Raised if a source does not provide a usable article, e.g. an ar5iv conversion failure page.
+    """
+
+
+class FetchCancelledError(Exception):
+    """
+    Raised in a download that is not needed anymore, e.g. because a hedged request to another source won.
+    """
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the recent requests to a source and derives the delay after which a
+    hedged request to the next source is sent: a high percentile of the latencies, so that only
+    the slowest requests are hedged.
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, min_delay=HEDGE_MIN_DELAY, max_delay=HEDGE_MAX_DELAY,
+                 window=HEDGE_WINDOW, min_samples=HEDGE_MIN_SAMPLES):
+        """
+        Initializes the LatencyTracker.
+
+        Args:
+            percentile (float): The percentile of the latencies used as hedge delay.
+            min_delay (float): Lower bound of the hedge delay in seconds.
+            max_delay (float): Upper bound of the hedge delay in seconds, used until min_samples are known.
+            window (int): Number of recent latencies kept.
+            min_samples (int): Number of latencies needed before the percentile is used.
+        """
+        self.PERCENTILE = percentile
+        self.MIN_DELAY = min_delay
+        self.MAX_DELAY = max_delay
+        self.MIN_SAMPLES = min_samples
+        self.LATENCIES = deque(maxlen=window)
+        self.LOCK = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        Records the latency of a successful request.
+        """
+        with self.LOCK:
+            self.LATENCIES.append(seconds)
+
+    def get_hedge_delay(self):
+        """
+        Returns the time to wait for a request before a hedged request is sent.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        with self.LOCK:
+            latencies = sorted(self.LATENCIES)
+        if len(latencies) < self.MIN_SAMPLES:
+            return self.MAX_DELAY
+
+        # Nearest rank
+        rank = max(1, -(-len(latencies) * self.PERCENTILE // 100))
+        return min(self.MAX_DELAY, max(self.MIN_DELAY, latencies[int(rank) - 1]))
+
+
+def get_source_url(source, base_url, arxiv_id):
+    """
+    Returns the url of an article at a source.
+
+    Args:
+        source (str): The source, e.g. SOURCE_AR5IV.
+        base_url (str): The base url of the source.
+        arxiv_id (str): The arXiv id.
+
+    Returns:
+        str: The url.
+    """
+    if source == SOURCE_ABSTRACT:
+        return f"{base_url}?id_list={arxiv_id}"
+    return base_url + arxiv_id
+
+
+def guard_chunks(chunks, cancel_event=None, deadline=None):
+    """
+    Passes the chunks of a download through until it is cancelled or its deadline passed.
+    A download waiting for the next chunk notices both only when that chunk arrives (or the
+    read timeout of the session expires).
+
+    Args:
+        chunks (iterable): The downloaded chunks of bytes.
+        cancel_event (threading.Event): Set once the download is not needed anymore.
+        deadline (float): The time.monotonic() time after which the download is stopped.
+
+    Yields:
+        bytes: The chunks.
+
+    Raises:
+        FetchCancelledError: If cancel_event is set.
+        TimeoutError: If the deadline passed.
+    """
+    for chunk in chunks:
+        if cancel_event is not None and cancel_event.is_set():
+            raise FetchCancelledError("The download is not needed anymore")
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("The download took too long")
+        yield chunk
+
+
+def check_rendered_page(head, url):
+    """
+    Checks that the beginning of a page is a rendered article and not a failure page. ar5iv
+    redirects articles it cannot render to their abstract page on arxiv.org and shows an error
+    banner for failed conversions.
+
+    Args:
+        head (bytes): The first RENDERED_PAGE_PEEK_BYTES of the page, or the whole page if shorter.
+        url (str): The url of the page after redirects.
+
+    Raises:
+        SourceFailedError: If the page is not a rendered article.
+    """
+    if '/abs/' in url:
+        raise SourceFailedError(f"Redirected to the abstract page {url}")
+    for marker in RENDERED_PAGE_FAILURE_MARKERS:
+        if marker in head:
+            raise SourceFailedError(f"Conversion failure page at {url}")
+    if RENDERED_PAGE_MARKER not in head:
+        raise SourceFailedError(f"No rendered article at {url}")
+
+
+def check_rendered_chunks(chunks, url):
+    """
+    Passes the chunks of a page through, after checking its beginning with check_rendered_page.
+
+    Args:
+        chunks (iterable): The downloaded chunks of bytes.
+        url (str): The url of the page after redirects.
+
+    Yields:
+        bytes: The chunks.
+
+    Raises:
+        SourceFailedError: If the page is not a rendered article.
+    """
+    chunks = iter(chunks)
+    head = []
+    head_size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        head_size += len(chunk)
+        if head_size >= RENDERED_PAGE_PEEK_BYTES:
+            break
+
+    check_rendered_page(b''.join(head)[:RENDERED_PAGE_PEEK_BYTES], url)
+    yield from head
+    yield from chunks
+
+
+def check_rendered_text(sections, max_chars=None):
+    """
+    Checks that enough text was extracted from a rendered article, since pages of failed
+    conversions may consist of the title and the error messages only.
+
+    Args:
+        sections (list): The extracted section texts.
+        max_chars (int): The character budget of the extraction, or None.
+
+    Raises:
+        SourceFailedError: If the text is too short.
+    """
+    min_chars = min(RENDERED_PAGE_MIN_CHARS, max_chars) if max_chars else RENDERED_PAGE_MIN_CHARS
+    if sum(map(len, sections)) < min_chars:
+        raise SourceFailedError("The rendered article contains almost no text")
+
+
+def parse_arxiv_abstract(xml):
+    """
+    Extracts the title and the abstract of an article from a response of the arXiv export API.
+
+    Args:
+        xml (bytes): The Atom feed.
+
+    Returns:
+        list: The title and the abstract, as section texts.
+
+    Raises:
+        SourceFailedError: If the feed does not contain the article.
+    """
+    from lxml import etree
+
+    feed = etree.fromstring(xml, parser=etree.XMLParser(resolve_entities=False, no_network=True))
+    entry = feed.find(f"{ATOM_NAMESPACE}entry")
+
+    # Unknown ids return an entry titled "Error" with an id below /api/errors
+    if entry is None or '/api/errors' in (entry.findtext(f"{ATOM_NAMESPACE}id") or ''):
+        raise SourceFailedError("The arXiv export API does not know the article")
+
+    title = ' '.join((entry.findtext(f"{ATOM_NAMESPACE}title") or '').split())
+    abstract = ' '.join((entry.findtext(f"{ATOM_NAMESPACE}summary") or '').split())
+    if not abstract:
+        raise SourceFailedError("The article has no abstract")
+    return [title, "Abstract " + abstract] if title else ["Abstract " + abstract]
@@ -0,0 +1,297 @@
+import io
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# CONSTANTS
+TRACE_MAX_TRACES = 1000
+TRACE_MAX_SPANS = 500
+TRACE_PROFILE_LINES = 40
+TRACE_ID_HEADER = "X-Trace-Id"
+
+# The trace and the id of the innermost open span of the running request, job or task
+CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    The spans recorded for one request. Spans are dicts with an id, the id of their parent span
+    (None for top-level spans), a name, the start relative to the trace start and the duration
+    in milliseconds, and attributes such as url, status and bytes of HTTP calls.
+    """
+
+    def __init__(self, name, profile=False, **attributes):
+        """
+        Initializes the Trace.
+
+        Args:
+            name (str): The name, e.g. the endpoint.
+            profile (bool): Whether the parse step is profiled with cProfile.
+            **attributes: Attributes of the trace, e.g. the QID.
+        """
+        self.ID = uuid.uuid4().hex
+        self.NAME = name
+        self.PROFILE = profile
+        self.ATTRIBUTES = attributes
+        self.STARTED = time.time()
+        self.START = time.perf_counter()
+        self.LOCK = threading.Lock()
+        self.SPANS = []
+        self.dropped_spans = 0
+
+    def add_span(self, name, parent_id, attributes):
+        """
+        Adds an open span. Spans beyond TRACE_MAX_SPANS are counted but not kept.
+
+        Returns:
+            dict: The span. Its duration is set by finish_span.
+        """
+        span = {
+            'id': uuid.uuid4().hex[:16],
+            'parent_id': parent_id,
+            'name': name,
+            'start_ms': (time.perf_counter() - self.START) * 1000,
+            'duration_ms': None,
+            'attributes': dict(attributes),
+        }
+        with self.LOCK:
+            if len(self.SPANS) < TRACE_MAX_SPANS:
+                self.SPANS.append(span)
+            else:
+                self.dropped_spans += 1
+        return span
+
+    def finish_span(self, span):
+        """
+        Sets the duration of a span to the time since its start.
+        """
+        span['duration_ms'] = (time.perf_counter() - self.START) * 1000 - span['start_ms']
+
+    def to_dict(self):
+        """
+        Returns the trace with its spans as a tree.
+
+        Returns:
+            dict: The id, name, start time and attributes of the trace and the top-level spans,
+                  each with its child spans in "children", ordered by start.
+        """
+        with self.LOCK:
+            spans = {span['id']: {**span, 'children': []} for span in self.SPANS}
+
+        roots = []
+        for span in sorted(spans.values(), key=lambda s: s['start_ms']):
+            parent = spans.get(span['parent_id'])
+            (parent['children'] if parent else roots).append(span)
+
+        return {
+            'trace_id': self.ID,
+            'name': self.NAME,
+            'started': self.STARTED,
+            'profiled': self.PROFILE,
+            'attributes': self.ATTRIBUTES,
+            'dropped_spans': self.dropped_spans,
+            'spans': roots,
+        }
+
+
+def get_current_trace():
+    """
+    Returns the trace of the running request, or None outside of a trace.
+    """
+    current = CURRENT_SPAN.get()
+    return current[0] if current else None
+
+
+def get_trace_id():
+    """
+    Returns the id of the trace of the running request, or None outside of a trace.
+    """
+    trace = get_current_trace()
+    return trace.ID if trace else None
+
+
+@contextmanager
+def activate(trace):
+    """
+    Context manager making a trace the current trace, so that spans are recorded in it.
+
+    Args:
+        trace (Trace): The trace, or None to record nothing.
+    """
+    token = CURRENT_SPAN.set((trace, None) if trace else None)
+    try:
+        yield trace
+    finally:
+        CURRENT_SPAN.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Context manager recording a span in the current trace. Spans opened inside become its children.
+    Outside of a trace nothing is recorded.
+
+    Args:
+        name (str): The name, e.g. "http" or "parse".
+        **attributes: Attributes of the span.
+
+    Yields:
+        dict: The span, whose attributes may be extended.
+    """
+    current = CURRENT_SPAN.get()
+    if current is None:
+        yield {'attributes': {}}
+        return
+
+    trace, parent_id = current
+    new_span = trace.add_span(name, parent_id, attributes)
+    token = CURRENT_SPAN.set((trace, new_span['id']))
+    try:
+        yield new_span
+    except Exception as e:
+        new_span['attributes']['error'] = str(e)
+        raise
+    finally:
+        trace.finish_span(new_span)
+        try:
+            CURRENT_SPAN.reset(token)
+        except ValueError:
+            # Generators may be closed in another context, e.g. by the garbage collector
+            pass
+
+
+def bind_context(func):
+    """
+    Wraps a function so that it runs in a copy of the current context, e.g. with the current trace,
+    when it is called in another thread. Threads of executors do not inherit the context otherwise.
+
+    Args:
+        func (callable): The function.
+
+    Returns:
+        callable: The wrapped function.
+    """
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+
+    return run_in_context
+
+
+def trace_response(http_span, response):
+    """
+    Extends the span of an HTTP call (requests) with the size and the time of its body, once the
+    body is read. Works for streamed responses as well.
+
+    Args:
+        http_span (dict): The span of the call.
+        response (requests.Response): The response.
+    """
+    trace = get_current_trace()
+    if trace is None:
+        return
+
+    http_span['attributes']['status'] = response.status_code
+    http_span['attributes']['bytes'] = 0
+    iter_content = response.iter_content
+
+    def traced_iter_content(*args, **kwargs):
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                http_span['attributes']['bytes'] += len(chunk)
+                yield chunk
+        finally:
+            # Also if the consumer stops reading early
+            trace.finish_span(http_span)
+
+    response.iter_content = traced_iter_content
+
+
+def should_profile():
+    """
+    Returns whether the current trace is sampled for profiling.
+    """
+    trace = get_current_trace()
+    return trace is not None and trace.PROFILE
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    Calls a function under cProfile. Module-level, so that it can run in a process pool.
+
+    Args:
+        func (callable): The function.
+        *args: Positional arguments for func.
+        **kwargs: Keyword arguments for func.
+
+    Returns:
+        tuple: The result of func and the TRACE_PROFILE_LINES most expensive functions
+               by cumulative time as text.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TRACE_PROFILE_LINES)
+    return result, output.getvalue()
+
+
+class TraceHelper:
+    """
+    A helper class keeping the traces of the latest requests in memory, so that individual slow
+    requests can be explained. A sampled fraction of the traces also gets a cProfile of the parse step.
+    """
+
+    def __init__(self, max_traces=TRACE_MAX_TRACES, profile_rate=0.0):
+        """
+        Initializes the TraceHelper.
+
+        Args:
+            max_traces (int): Number of traces to keep; the oldest are dropped.
+            profile_rate (float): Fraction of the traces whose parse step is profiled, 0 to 1.
+        """
+        self.MAX_TRACES = max_traces
+        self.PROFILE_RATE = profile_rate
+        self.LOCK = threading.Lock()
+        self.TRACES = OrderedDict()
+
+    def create_trace(self, name, **attributes):
+        """
+        Creates and stores a new trace. Use activate to record spans in it.
+
+        Args:
+            name (str): The name, e.g. the endpoint.
+            **attributes: Attributes of the trace, e.g. the QID.
+
+        Returns:
+            Trace: The trace.
+        """
+        trace = Trace(name, profile=random.random() < self.PROFILE_RATE, **attributes)
+        with self.LOCK:
+            self.TRACES[trace.ID] = trace
+            while len(self.TRACES) > self.MAX_TRACES:
+                self.TRACES.popitem(last=False)
+        return trace
+
+    def get_trace(self, trace_id):
+        """
+        Returns a trace with its span tree.
+
+        Args:
+            trace_id (str): The id of the trace.
+
+        Returns:
+            dict: The trace, see Trace.to_dict, or None if the trace is unknown or was dropped.
+        """
+        with self.LOCK:
+            trace = self.TRACES.get(trace_id)
+        return trace.to_dict() if trace else None
@@ -1,6 +1,10 @@
-import requests
 import json
 import logging
+import re
+import asyncio
+import threading
+
+from library.http_helper import create_session
 
 
 # CONSTANTS
@@ -8,6 +12,10 @@ WIKI_PID_FOR_ARXIV_ID = "P21"
 WIKI_PID_FOR_SUMMARY = "P1638"
 WIKI_PID_FOR_SUMMARY_SIMPLE = "P1639"
 WIKI_PID_FOR_GENERATED_BY = "P1642"
+WIKI_MAX_ENTITIES_PER_REQUEST = 50
+WIKI_MAX_RECENT_CHANGES = 500
+WIKI_ITEM_NAMESPACE = 120
+WIKI_SUMMARY_LANGUAGE = "en"
 
 class WikiHelper:
     """
@@ -15,7 +23,8 @@ class WikiHelper:
     CSRF token retrieval, fetching properties, and updating existing statements.
     """
 
-    def __init__(self, wiki_api_url=None, username=None, password=None, proxy_ip=None):
+    def __init__(self, wiki_api_url=None, username=None, password=None, proxy_ip=None, http_options=None,
+                 entity_cache=None):
         """
         Initializes the WikiHelper.
 
@@ -24,25 +33,34 @@ class WikiHelper:
             username (str): Username
             password (str): Password
             proxy_ip (str): IP and port of proxy, e.g. "47.254.131.67:3128"
+            http_options (dict): Timeout, retry and pool options for the session, see http_helper.create_session.
+            entity_cache (EntityCache): Cache for the claims of the items, or None to read them on every access.
         """
         self.WIKI_API_URL = wiki_api_url
         self.USERNAME = username
         self.PASSWORD = password
+        self.HTTP_OPTIONS = dict(http_options or {})
+        self.ENTITY_CACHE = entity_cache
 
         # https://spys.one/free-proxy-list/DE/
         self.PROXY_IP = proxy_ip
-        self.SESSION = self.start_session()
+
+        # CSRF token of the logged in session, fetched on the first edit
+        self.CSRF_TOKEN = None
+        self.CSRF_TOKEN_LOCK = threading.Lock()
+        self.reset_session()
 
     def start_session(self):
         """
         Starts a session for making API calls and configures proxy settings, if given.
+        The session keeps connections alive and applies the timeouts and retries of HTTP_OPTIONS.
 
         Returns:
             requests.Session: A configured session object.
         """
 
         # Start a session
-        self.SESSION = requests.Session()
+        self.SESSION = create_session(**self.HTTP_OPTIONS)
 
         if self.PROXY_IP:
             # Define your proxy settings
@@ -56,6 +74,15 @@ class WikiHelper:
 
         return self.SESSION
 
+    def reset_session(self):
+        """
+        Creates the session, and replaces it in a process forked after the helper was created, so that
+        no connections are shared with the parent process. The new session logs in again on the next edit.
+        """
+        self.start_session()
+        with self.CSRF_TOKEN_LOCK:
+            self.CSRF_TOKEN = None
+
     def get_csrf_token(self):
         """
         Retrieves a CSRF token for authenticating API requests.
@@ -117,6 +144,214 @@ class WikiHelper:
 
         return csrf_token
 
+    def get_cached_csrf_token(self, stale_token=None):
+        """
+        Returns the CSRF token of the session, logging in only if no token was fetched yet.
+        The token stays valid for the lifetime of the login session.
+
+        Args:
+            stale_token (str): A token the API rejected as bad. If it is still the cached token,
+                a new one is fetched; if another thread already replaced it, the new one is returned.
+
+        Returns:
+            str: The CSRF token.
+
+        Raises:
+            Exception: If login fails or the response is invalid.
+        """
+        with self.CSRF_TOKEN_LOCK:
+            if self.CSRF_TOKEN is None or self.CSRF_TOKEN == stale_token:
+                self.CSRF_TOKEN = self.get_csrf_token()
+            return self.CSRF_TOKEN
+
+    @staticmethod
+    def is_bad_token_response(response_data):
+        """
+        Checks whether the API rejected an edit because of an invalid or expired CSRF token.
+
+        Args:
+            response_data (dict): The parsed API response.
+
+        Returns:
+            bool: True if the token has to be refreshed.
+        """
+        return response_data.get('error', {}).get('code') in ('badtoken', 'notoken')
+
+    def post_with_csrf_token(self, data):
+        """
+        Posts an edit request with the cached CSRF token. If the token was rejected (e.g. because
+        the login session expired), a new token is fetched and the request is sent once more.
+
+        Args:
+            data (dict): The request data without the token.
+
+        Returns:
+            dict: The parsed API response.
+        """
+        csrf_token = self.get_cached_csrf_token()
+        response_data = self.SESSION.post(self.WIKI_API_URL, data={**data, 'token': csrf_token}).json()
+
+        if self.is_bad_token_response(response_data):
+            logging.debug("CSRF token was rejected, logging in again.")
+            csrf_token = self.get_cached_csrf_token(stale_token=csrf_token)
+            response_data = self.SESSION.post(self.WIKI_API_URL, data={**data, 'token': csrf_token}).json()
+
+        return response_data
+
+    @staticmethod
+    def is_item_id(value):
+        """
+        Checks whether a value is the ID of an item, e.g. "Q42", and not a text that starts with "Q".
+
+        Args:
+            value: The value.
+
+        Returns:
+            bool: True if the value is an item ID.
+        """
+        return isinstance(value, str) and re.fullmatch(r"Q[1-9]\d*", value) is not None
+
+    @staticmethod
+    def build_snak(property_id, value, language=None):
+        """
+        Builds a value snak, with the same datatype rules as add_or_replace_qualifier:
+        values with a language are monolingual texts, item IDs (see is_item_id) are items
+        and all others are strings.
+
+        Args:
+            property_id (str): The ID of the property.
+            value (str): The value.
+            language (str, optional): The language code if the value is monolingual text.
+
+        Returns:
+            dict: The snak.
+        """
+        if language:
+            datavalue = {'type': 'monolingualtext', 'value': {'text': value, 'language': language}}
+        elif WikiHelper.is_item_id(value):
+            datavalue = {'type': 'wikibase-entityid', 'value': {'entity-type': 'item', 'id': value}}
+        else:
+            datavalue = {'type': 'string', 'value': value}
+
+        return {'snaktype': 'value', 'property': property_id, 'datavalue': datavalue}
+
+    def build_summary_claim(self, summary_text, generated_by, statement_id=None,
+                            property_id=WIKI_PID_FOR_SUMMARY, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Builds a summary statement with its "generated by" qualifier for wbeditentity.
+
+        Args:
+            summary_text (str): The summary.
+            generated_by (str): The value of the "generated by" qualifier, e.g. the LLM model.
+            statement_id (str, optional): The ID of the statement to replace. If None, a new statement is added.
+            property_id (str): The ID of the summary property.
+            language (str): The language code of the summary.
+
+        Returns:
+            dict: The claim.
+        """
+        claim = {
+            'type': 'statement',
+            'rank': 'normal',
+            'mainsnak': self.build_snak(property_id, summary_text, language=language),
+            'qualifiers': {
+                WIKI_PID_FOR_GENERATED_BY: [self.build_snak(WIKI_PID_FOR_GENERATED_BY, generated_by)],
+            },
+            'qualifiers-order': [WIKI_PID_FOR_GENERATED_BY],
+        }
+        if statement_id:
+            claim['id'] = statement_id
+
+        return claim
+
+    def build_summary_edit_data(self, item_id, summary_text, generated_by, statement_id=None,
+                                property_id=WIKI_PID_FOR_SUMMARY, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Builds the wbeditentity request that sets a summary statement and its qualifier in one edit.
+
+        Args:
+            See write_summary.
+
+        Returns:
+            dict: The request data without the token.
+        """
+        return self.build_summaries_edit_data(item_id, {property_id: (summary_text, statement_id)}, generated_by,
+                                              language=language)
+
+    def build_summaries_edit_data(self, item_id, summaries, generated_by, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Builds the wbeditentity request that sets several summary statements (e.g. the summary and
+        the simple summary) and their qualifiers in one edit.
+
+        Args:
+            See write_summaries.
+
+        Returns:
+            dict: The request data without the token.
+        """
+        claims = [self.build_summary_claim(summary_text, generated_by, statement_id=statement_id,
+                                           property_id=property_id, language=language)
+                  for property_id, (summary_text, statement_id) in summaries.items()]
+        return {
+            'action': 'wbeditentity',
+            'id': item_id,
+            'data': json.dumps({'claims': claims}),
+            'summary': f"Set {', '.join(summaries)} (generated by {generated_by})",
+            'format': 'json'
+        }
+
+    def write_summary(self, item_id, summary_text, generated_by, statement_id=None,
+                      property_id=WIKI_PID_FOR_SUMMARY, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Writes a summary statement including its "generated by" qualifier with a single wbeditentity
+        request, using the cached CSRF token. An existing statement is replaced as a whole, so its
+        other qualifiers and references are dropped.
+
+        Args:
+            item_id (str): The ID of the item.
+            summary_text (str): The summary.
+            generated_by (str): The value of the "generated by" qualifier, e.g. the LLM model.
+            statement_id (str, optional): The ID of the existing summary statement, e.g. from
+                get_arxivids_for_qids. If None, a new statement is added.
+            property_id (str): The ID of the summary property.
+            language (str): The language code of the summary.
+
+        Returns:
+            bool: True if the edit was successful.
+        """
+        return self.write_summaries(item_id, {property_id: (summary_text, statement_id)}, generated_by,
+                                    language=language)
+
+    def write_summaries(self, item_id, summaries, generated_by, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Writes several summary statements, e.g. the summary and the simple summary, with a single
+        wbeditentity request, see write_summary.
+
+        Args:
+            item_id (str): The ID of the item.
+            summaries (dict): The summary text and the ID of the existing statement (or None) by
+                property ID, e.g. {WIKI_PID_FOR_SUMMARY: ("This article ...", None)}.
+            generated_by (str): The value of the "generated by" qualifiers, e.g. the LLM model.
+            language (str): The language code of the summaries.
+
+        Returns:
+            bool: True if the edit was successful.
+        """
+        try:
+            response_data = self.post_with_csrf_token(self.build_summaries_edit_data(
+                item_id, summaries, generated_by, language=language))
+        except Exception as e:
+            logging.error(f"Writing the summary of {item_id} failed: {str(e)}")
+            self.update_entity_cache(item_id, {})
+            return False
+
+        self.update_entity_cache(item_id, response_data)
+        if response_data.get('success') == 1:
+            return True
+
+        logging.error(f"Writing the summary of {item_id} failed: {json.dumps(response_data.get('error'))}")
+        return False
+
     def get_property(self, item_id, property_id):
         """
         Retrieves the property values of a specific item.
@@ -128,6 +363,24 @@ class WikiHelper:
         Returns:
             list: A list of claims for the given property, or None if the property is not found.
         """
+        return self.get_property_claims(item_id, property_id) or None
+
+    def get_property_claims(self, item_id, property_id):
+        """
+        Retrieves the claims of a property of an item, from the entity cache if enabled
+        (so that all properties of an item are served by one wbgetentities request),
+        otherwise with a wbgetclaims request.
+
+        Args:
+            item_id (str): The ID of the item
+            property_id (str): The ID of the property
+
+        Returns:
+            list: The claims of the property, empty if the property is not found.
+        """
+        if self.ENTITY_CACHE is not None:
+            return self.get_entities([item_id]).get(item_id, {}).get('claims', {}).get(property_id, [])
+
         response = self.SESSION.get(
             self.WIKI_API_URL,
             params={
@@ -137,48 +390,91 @@ class WikiHelper:
                 'format': 'json'
             }
         )
-        claims = response.json().get('claims', {})
-        if property_id in claims:
-            return claims[property_id]
-        else:
-            return None
+        return response.json().get('claims', {}).get(property_id, [])
 
-    def get_property_value(self, item_id, property_id):
+    def get_statement(self, statement_id):
         """
-        Retrieves the value of a specific property from an item.
+        Retrieves a statement by its ID, from the cached item if enabled, otherwise with a wbgetclaims request.
 
         Args:
-            item_id (str): The ID of the item.
-            property_id (str): The ID of the property.
+            statement_id (str): The ID of the statement, e.g. "Q42$5627445f-43cb-ed6d-3adb-760e85bd17ee".
 
         Returns:
-            str: The value of the property, or None if not found.
+            dict: The claim, or None if not found.
         """
+        if self.ENTITY_CACHE is not None:
+            item_id = self.get_item_id_of_statement(statement_id)
+            for property_claims in self.get_entities([item_id]).get(item_id, {}).get('claims', {}).values():
+                for claim in property_claims:
+                    if claim.get('id', '').lower() == statement_id.lower():
+                        return claim
+
         response = self.SESSION.get(
             self.WIKI_API_URL,
             params={
                 'action': 'wbgetclaims',
-                'entity': item_id,
-                'property': property_id,
+                'claim': statement_id,
                 'format': 'json'
             }
         )
-        claims = response.json().get('claims', {}).get(property_id, [])
+        for property_claims in response.json().get('claims', {}).values():
+            if property_claims:
+                return property_claims[0]
+        return None
+
+    @staticmethod
+    def get_item_id_of_statement(statement_id):
+        """
+        Returns the ID of the item a statement belongs to, e.g. "Q42" for "Q42$5627445f-...".
+        """
+        return statement_id.split('$', 1)[0].upper()
+
+    def get_property_value(self, item_id, property_id):
+        """
+        Retrieves the value of a specific property from an item.
+
+        Args:
+            item_id (str): The ID of the item.
+            property_id (str): The ID of the property.
+
+        Returns:
+            str: The value of the property, or None if not found.
+        """
+        claims = self.get_property_claims(item_id, property_id)
 
         # Check if claims exist for the property
         if claims:
-            # Extract the first claim's mainsnak
-            mainsnak = claims[0].get('mainsnak', {})
-            datavalue = mainsnak.get('datavalue', {})
-            value = datavalue.get('value')
-
-            # Handle different datatypes
-            if isinstance(value, dict) and 'text' in value:
-                # For monolingualtext
-                return value['text']
-            elif isinstance(value, str):
-                # For plain string values
-                return value
+            # Extract the first claim's value
+            return self.get_claim_value(claims[0])
+
+        return None
+
+    @staticmethod
+    def get_claim_value(claim):
+        """
+        Extracts the value of a claim's mainsnak (or of a qualifier snak).
+
+        Args:
+            claim (dict): The claim or snak as returned by the API.
+
+        Returns:
+            str: The text or string value, or None for other datatypes.
+        """
+        # Qualifiers are snaks themselves, claims wrap them in a mainsnak
+        mainsnak = claim.get('mainsnak', claim)
+        datavalue = mainsnak.get('datavalue', {})
+        value = datavalue.get('value')
+
+        # Handle different datatypes
+        if isinstance(value, dict) and 'text' in value:
+            # For monolingualtext
+            return value['text']
+        elif isinstance(value, dict) and 'id' in value:
+            # For Wikibase items
+            return value['id']
+        elif isinstance(value, str):
+            # For plain string values
+            return value
 
         return None
 
@@ -193,16 +489,7 @@ class WikiHelper:
         Returns:
           list: A list of statement IDs for the specified property.
         """
-        response = self.SESSION.get(
-            self.WIKI_API_URL,
-            params={
-                'action': 'wbgetclaims',
-                'entity': item_id,
-                'property': property_id,
-                'format': 'json'
-            }
-        )
-        claims = response.json().get('claims', {}).get(property_id, [])
+        claims = self.get_property_claims(item_id, property_id)
         statement_ids = [claim['id'] for claim in claims]
 
         # Return "None" if list is empty
@@ -258,6 +545,7 @@ class WikiHelper:
 
         # Parse response and determine success
         response_data = response.json()
+        self.update_entity_cache(item_id or self.get_item_id_of_statement(statement_id), response_data)
         if 'success' in response_data and response_data['success'] == 1:
             return True
         else:
@@ -290,7 +578,9 @@ class WikiHelper:
             'format': 'json'
         }
         response = self.SESSION.post(self.WIKI_API_URL, data=data)
-        return response.json()
+        response_data = response.json()
+        self.update_entity_cache(item_id or self.get_item_id_of_statement(statement_id), response_data)
+        return response_data
 
     def add_or_replace_qualifier(self, csrf_token=None, statement_id=None, qualifier_property_id=None,
                                  qualifier_value=None, qualifier_language=None):
@@ -315,24 +605,9 @@ class WikiHelper:
             # logging.debug(f"Getting statement details for statement: {statement_id}")
 
             # Fetch the current statement details
-            response = self.SESSION.get(
-                self.WIKI_API_URL,
-                params={
-                    'action': 'wbgetclaims',
-                    'claim': statement_id,
-                    'format': 'json'
-                }
-            )
-
-            # Parse API response
-            response_data = response.json()
-            # logging.debug(f"API response: {json.dumps(response_data, indent=2)}")
-
-            # Extract all claims into a single list
-            all_claims = []
-            claims_dict = response_data.get('claims', {})
-            for property_id, property_claims in claims_dict.items():
-                all_claims.extend(property_claims)
+            item_id = self.get_item_id_of_statement(statement_id)
+            claim = self.get_statement(statement_id)
+            all_claims = [claim] if claim else []
 
             # logging.debug(f"All claims: {json.dumps(all_claims, indent=2)}")
 
@@ -348,17 +623,17 @@ class WikiHelper:
                         logging.debug(f"Qualifier datavalue: {datavalue}, hash: {qualifier_hash}")
 
                         # Check if the value matches
-                        if isinstance(qualifier_value, str) and qualifier_value.startswith("Q"):
-                            # For Wikibase items
-                            if isinstance(datavalue, dict) and datavalue.get('id') == qualifier_value:
-                                logging.debug("Qualifier already exists with the same value (Wikibase item).")
-                                return True
-                        elif qualifier_language:
+                        if qualifier_language:
                             # For monolingual text
                             if isinstance(datavalue, dict) and datavalue.get(
                                     'text') == qualifier_value and datavalue.get('language') == qualifier_language:
                                 logging.debug("Qualifier already exists with the same value (monolingual text).")
                                 return True
+                        elif self.is_item_id(qualifier_value):
+                            # For Wikibase items
+                            if isinstance(datavalue, dict) and datavalue.get('id') == qualifier_value:
+                                logging.debug("Qualifier already exists with the same value (Wikibase item).")
+                                return True
                         elif datavalue == qualifier_value:
                             # For plain string or other types
                             logging.debug("Qualifier already exists with the same value (plain string or other).")
@@ -373,8 +648,8 @@ class WikiHelper:
                             'snakhash': qualifier_hash,
                             'snaktype': 'value',
                             'value': json.dumps(
-                                {"entity-type": "item", "id": qualifier_value} if qualifier_value.startswith("Q") else
                                 {"text": qualifier_value, "language": qualifier_language} if qualifier_language else
+                                {"entity-type": "item", "id": qualifier_value} if self.is_item_id(qualifier_value) else
                                 qualifier_value
                             ),
                             'token': csrf_token,
@@ -382,6 +657,7 @@ class WikiHelper:
                         }
                         # logging.debug(f"Update request data: {json.dumps(data, indent=2)}")
                         update_response = self.SESSION.post(self.WIKI_API_URL, data=data).json()
+                        self.update_entity_cache(item_id, update_response)
                         # logging.debug(f"Update response: {json.dumps(update_response, indent=2)}")
 
                         if 'success' in update_response and update_response['success'] == 1:
@@ -392,10 +668,8 @@ class WikiHelper:
 
             # Add a new qualifier if it doesn't exist
             value = (
-                {"entity-type": "item", "id": qualifier_value} if isinstance(qualifier_value,
-                                                                             str) and qualifier_value.startswith(
-                    "Q") else
                 {"text": qualifier_value, "language": qualifier_language} if qualifier_language else
+                {"entity-type": "item", "id": qualifier_value} if self.is_item_id(qualifier_value) else
                 qualifier_value
             )
 
@@ -413,6 +687,7 @@ class WikiHelper:
 
             # Make the API request to add a new qualifier
             add_response = self.SESSION.post(self.WIKI_API_URL, data=data).json()
+            self.update_entity_cache(item_id, add_response)
             logging.debug(f"Add response: {json.dumps(add_response, indent=2)}")
 
             # Check for success
@@ -439,3 +714,503 @@ class WikiHelper:
 
         arXiv_id = self.get_property_value( qid, WIKI_PID_FOR_ARXIV_ID )
         return arXiv_id
+
+    def get_entities(self, item_ids, props='claims'):
+        """
+        Retrieves several entities with as few wbgetentities requests as possible
+        (up to WIKI_MAX_ENTITIES_PER_REQUEST entities per request). With entity cache, the claims
+        of fresh cached items are returned without request, stale ones are only fetched again if
+        their lastrevid has changed.
+
+        Args:
+            item_ids (list): The IDs of the items.
+            props (str): The entity parts to retrieve, e.g. "claims" or "claims|info". Only "claims"
+                is served by the entity cache.
+
+        Returns:
+            dict: The entities by item ID. Missing items are not included.
+        """
+        if not self.uses_entity_cache(props):
+            return self.fetch_entities(item_ids, props)
+
+        entities, stale_entries, missing_item_ids = self.get_cached_entities(item_ids)
+        if stale_entries:
+            missing_item_ids += self.revalidate_cached_entities(
+                entities, stale_entries, self.fetch_entities(list(stale_entries), props='info'))
+        if missing_item_ids:
+            entities.update(self.cache_entities(self.fetch_entities(missing_item_ids, props='info|claims')))
+        return entities
+
+    def fetch_entities(self, item_ids, props='claims'):
+        """
+        Retrieves several entities with wbgetentities requests, without entity cache, see get_entities.
+
+        Args:
+            item_ids (list): The IDs of the items.
+            props (str): The entity parts to retrieve.
+
+        Returns:
+            dict: The entities by item ID. Missing items are not included.
+
+        Raises:
+            Exception: If a request fails, see parse_entities_response.
+        """
+        entities = {}
+        for chunk in self.chunk_item_ids(item_ids):
+            response = self.SESSION.get(
+                self.WIKI_API_URL,
+                params={
+                    'action': 'wbgetentities',
+                    'ids': '|'.join(chunk),
+                    'props': props,
+                    'format': 'json'
+                }
+            )
+            response.raise_for_status()
+            entities.update(self.parse_entities_response(response.json()))
+
+        return entities
+
+    def uses_entity_cache(self, props):
+        """
+        Returns whether entities with these parts are served by the entity cache, which only holds claims.
+        """
+        return self.ENTITY_CACHE is not None and props == 'claims'
+
+    def get_cached_entities(self, item_ids):
+        """
+        Looks up items in the entity cache.
+
+        Args:
+            item_ids (list): The IDs of the items.
+
+        Returns:
+            tuple: The fresh entities by item ID, the stale entries to revalidate by item ID and the IDs
+                   of uncached items (or items whose lastrevid is unknown) to fetch.
+        """
+        entities, stale_entries, missing_item_ids = {}, {}, []
+        for chunk in self.chunk_item_ids(item_ids):
+            for item_id in chunk:
+                entry = self.ENTITY_CACHE.get(item_id)
+                if entry is not None and entry['fresh']:
+                    entities[item_id] = {'id': item_id, 'claims': entry['claims'], 'lastrevid': entry['lastrevid']}
+                elif entry is not None and entry['lastrevid'] is not None:
+                    stale_entries[item_id] = entry
+                else:
+                    missing_item_ids.append(item_id)
+
+        return entities, stale_entries, missing_item_ids
+
+    def revalidate_cached_entities(self, entities, stale_entries, revisions):
+        """
+        Compares stale cache entries with the current lastrevid of the items. Unchanged items are
+        marked as fresh and added to entities.
+
+        Args:
+            entities (dict): The entities by item ID, updated in place.
+            stale_entries (dict): The stale cache entries by item ID.
+            revisions (dict): The entities with their lastrevid (props "info") by item ID.
+
+        Returns:
+            list: The IDs of the changed items, whose claims have to be fetched again.
+        """
+        changed_item_ids = []
+        for item_id, entry in stale_entries.items():
+            lastrevid = revisions.get(item_id, {}).get('lastrevid')
+            if lastrevid is not None and entry['lastrevid'] == lastrevid:
+                self.ENTITY_CACHE.mark_validated(item_id)
+                entities[item_id] = {'id': item_id, 'claims': entry['claims'], 'lastrevid': lastrevid}
+            else:
+                self.ENTITY_CACHE.invalidate(item_id)
+                if item_id in revisions:
+                    changed_item_ids.append(item_id)
+
+        return changed_item_ids
+
+    def cache_entities(self, entities):
+        """
+        Stores fetched entities (props "info|claims") in the entity cache.
+
+        Returns:
+            dict: The entities by item ID.
+        """
+        for item_id, entity in entities.items():
+            self.ENTITY_CACHE.put(item_id, entity.get('claims', {}), entity.get('lastrevid'))
+        return entities
+
+    def update_entity_cache(self, item_id, response_data):
+        """
+        Updates the cached item from the response of an edit: the entity returned by wbeditentity
+        replaces the claims of its properties, a single claim (wbcreateclaim, wbsetclaimvalue,
+        wbsetqualifier) replaces that claim. Without either, e.g. after a failed edit, the item is removed.
+
+        Args:
+            item_id (str): The ID of the edited item.
+            response_data (dict): The parsed API response.
+        """
+        if self.ENTITY_CACHE is None:
+            return
+
+        if response_data.get('success') == 1 and 'claims' in response_data.get('entity', {}):
+            self.ENTITY_CACHE.update_claims(item_id, response_data['entity']['claims'],
+                                            response_data['entity'].get('lastrevid'))
+        elif response_data.get('success') == 1 and 'mainsnak' in response_data.get('claim', {}):
+            self.ENTITY_CACHE.update_claim(item_id, response_data['claim'])
+        else:
+            self.ENTITY_CACHE.invalidate(item_id)
+
+    @staticmethod
+    def normalize_item_id(item_id):
+        """
+        Returns the item ID as the wiki spells it, e.g. "Q123" for " q123".
+        """
+        return (item_id or '').strip().upper()
+
+    @staticmethod
+    def chunk_item_ids(item_ids):
+        """
+        Splits item IDs into chunks for wbgetentities requests. IDs are normalized, see
+        normalize_item_id. Duplicates and invalid IDs are dropped, since an invalid ID fails the
+        whole request.
+
+        Args:
+            item_ids (list): The IDs of the items.
+
+        Returns:
+            list: Lists of at most WIKI_MAX_ENTITIES_PER_REQUEST item IDs.
+        """
+        valid_item_ids = [item_id for item_id in dict.fromkeys(map(WikiHelper.normalize_item_id, item_ids))
+                          if re.fullmatch(r'Q[1-9][0-9]*', item_id)]
+        return [valid_item_ids[i:i + WIKI_MAX_ENTITIES_PER_REQUEST]
+                for i in range(0, len(valid_item_ids), WIKI_MAX_ENTITIES_PER_REQUEST)]
+
+    @staticmethod
+    def parse_entities_response(response_data):
+        """
+        Extracts the existing entities from a wbgetentities response.
+
+        Args:
+            response_data (dict): The parsed API response.
+
+        Returns:
+            dict: The entities by item ID.
+
+        Raises:
+            Exception: If the API returned an error, so that the items are not taken for missing ones.
+        """
+        if 'error' in response_data:
+            raise Exception(f"wbgetentities failed: {json.dumps(response_data['error'])}")
+
+        return {item_id: entity for item_id, entity in response_data.get('entities', {}).items()
+                if 'missing' not in entity}
+
+    def get_arxivids_for_qids(self, qids):
+        """
+        Returns the arXiv ids and the existing summary statements for several QIDs,
+        using bulk wbgetentities requests instead of one wbgetclaims request per QID.
+
+        Args:
+            qids (list): The QIDs.
+
+        Returns:
+            dict: For every QID a dict with the keys "arxiv_id" (str or None), "summary" and
+                  "summary_simple". The summaries are dicts with the keys "statement_id", "text"
+                  and "generated_by", or None if the item has no such statement.
+
+        Raises:
+            Exception: If the wiki cannot be read. Items it does not hold have no arXiv id instead.
+        """
+        return self.build_summary_items(qids, self.get_entities(qids, props='claims'))
+
+    def get_recent_changes(self, start=None, continue_token=None, limit=WIKI_MAX_RECENT_CHANGES, exclude_user=None):
+        """
+        Retrieves a page of recent changes (new items and edits) of items, oldest first.
+
+        Args:
+            start (str): ISO 8601 timestamp of the oldest change to return, or None for the oldest one
+                the wiki still lists.
+            continue_token (str): The continue token of the previous page, continues exactly after it.
+            limit (int): Maximum number of changes, at most WIKI_MAX_RECENT_CHANGES.
+            exclude_user (str): Name of a user whose changes are skipped, e.g. the bot writing the summaries.
+
+        Returns:
+            tuple: The changes as dicts with the keys "qid", "rcid" and "timestamp", and the continue
+                   token of the next page, or None if this is the last page.
+        """
+        params = {
+            'action': 'query',
+            'list': 'recentchanges',
+            'rcnamespace': WIKI_ITEM_NAMESPACE,
+            'rctype': 'new|edit',
+            'rcprop': 'title|ids|timestamp',
+            'rcdir': 'newer',
+            'rclimit': min(limit, WIKI_MAX_RECENT_CHANGES),
+            'format': 'json'
+        }
+        if start:
+            params['rcstart'] = start
+        if continue_token:
+            params['rccontinue'] = continue_token
+        if exclude_user:
+            params['rcexcludeuser'] = exclude_user
+
+        response = self.SESSION.get(self.WIKI_API_URL, params=params)
+        response.raise_for_status()
+        response_data = response.json()
+        if 'error' in response_data:
+            raise Exception(f"recentchanges failed: {json.dumps(response_data['error'])}")
+
+        changes = []
+        for change in response_data.get('query', {}).get('recentchanges', []):
+            # Item titles carry the namespace, e.g. "Item:Q42"
+            qid = change['title'].rsplit(':', 1)[-1]
+            if re.fullmatch(r'Q[1-9][0-9]*', qid):
+                changes.append({'qid': qid, 'rcid': change['rcid'], 'timestamp': change['timestamp']})
+
+        return changes, response_data.get('continue', {}).get('rccontinue')
+
+    def build_summary_items(self, qids, entities):
+        """
+        Extracts the arXiv ids and the existing summary statements from entities.
+
+        Args:
+            qids (list): The QIDs.
+            entities (dict): The entities by item ID, see get_entities.
+
+        Returns:
+            dict: The items by QID, see get_arxivids_for_qids.
+        """
+        items = {}
+        for qid in qids:
+            claims = entities.get(self.normalize_item_id(qid), {}).get('claims', {})
+            arxiv_claims = claims.get(WIKI_PID_FOR_ARXIV_ID, [])
+            items[qid] = {
+                'arxiv_id': self.get_claim_value(arxiv_claims[0]) if arxiv_claims else None,
+                'summary': self._get_summary_statement(claims, WIKI_PID_FOR_SUMMARY),
+                'summary_simple': self._get_summary_statement(claims, WIKI_PID_FOR_SUMMARY_SIMPLE),
+            }
+
+        return items
+
+    def _get_summary_statement(self, claims, property_id):
+        """
+        Extracts the first summary statement of a property from the claims of an entity.
+
+        Args:
+            claims (dict): The claims of the entity by property ID.
+            property_id (str): The ID of the summary property.
+
+        Returns:
+            dict: The statement ID, summary text and "generated by" qualifier value, or None.
+        """
+        summary_claims = claims.get(property_id, [])
+        if not summary_claims:
+            return None
+
+        claim = summary_claims[0]
+        generated_by = claim.get('qualifiers', {}).get(WIKI_PID_FOR_GENERATED_BY, [])
+        return {
+            'statement_id': claim.get('id'),
+            'text': self.get_claim_value(claim),
+            'generated_by': self.get_claim_value(generated_by[0]) if generated_by else None,
+        }
+
+
+class AsyncWikiHelper(WikiHelper):
+    """
+    Asyncio variant of the WikiHelper for the methods used by the summary pipeline.
+    get_entities, fetch_entities, get_arxivids_for_qids and write_summary are coroutines and use a shared AsyncHTTPClient.
+    """
+
+    def __init__(self, client, wiki_api_url=None, username=None, password=None, entity_cache=None):
+        """
+        Initializes the AsyncWikiHelper.
+
+        Args:
+            client (AsyncHTTPClient): The shared HTTP client. It keeps the cookies of the login session.
+            wiki_api_url (str): Url to the wiki api
+            username (str): Username
+            password (str): Password
+            entity_cache (EntityCache): Cache for the claims of the items, or None to read them on every access.
+        """
+        super().__init__(wiki_api_url=wiki_api_url, username=username, password=password,
+                         entity_cache=entity_cache)
+        self.CLIENT = client
+        self.CSRF_TOKEN_LOCK = asyncio.Lock()
+
+    def reset_session(self):
+        """
+        Creates no session: the requests go through the shared AsyncHTTPClient, which keeps the cookies.
+        """
+
+    async def get_csrf_token(self):
+        """
+        Logs in and retrieves a CSRF token, see WikiHelper.get_csrf_token.
+
+        Returns:
+            str: The retrieved CSRF token.
+
+        Raises:
+            Exception: If login fails or the response is invalid.
+        """
+        login_token_response = await self.CLIENT.request(
+            "GET",
+            self.WIKI_API_URL,
+            params={'action': 'query', 'meta': 'tokens', 'type': 'login', 'format': 'json'}
+        )
+        login_token = login_token_response.json()['query']['tokens']['logintoken']
+
+        login_response = await self.CLIENT.request(
+            "POST",
+            self.WIKI_API_URL,
+            retry=False,
+            data={
+                'action': 'login',
+                'lgname': self.USERNAME,
+                'lgpassword': self.PASSWORD,
+                'lgtoken': login_token,
+                'format': 'json'
+            }
+        )
+        if login_response.json()['login']['result'] != "Success":
+            raise Exception("Login failed!")
+
+        csrf_token_response = await self.CLIENT.request(
+            "GET",
+            self.WIKI_API_URL,
+            params={'action': 'query', 'meta': 'tokens', 'type': 'csrf', 'format': 'json'}
+        )
+        return csrf_token_response.json()['query']['tokens']['csrftoken']
+
+    async def get_cached_csrf_token(self, stale_token=None):
+        """
+        Returns the CSRF token of the session, see WikiHelper.get_cached_csrf_token.
+        """
+        async with self.CSRF_TOKEN_LOCK:
+            if self.CSRF_TOKEN is None or self.CSRF_TOKEN == stale_token:
+                self.CSRF_TOKEN = await self.get_csrf_token()
+            return self.CSRF_TOKEN
+
+    async def post_with_csrf_token(self, data):
+        """
+        Posts an edit request with the cached CSRF token, see WikiHelper.post_with_csrf_token.
+        """
+        csrf_token = await self.get_cached_csrf_token()
+        response = await self.CLIENT.request("POST", self.WIKI_API_URL, retry=False,
+                                             data={**data, 'token': csrf_token})
+        response_data = response.json()
+
+        if self.is_bad_token_response(response_data):
+            logging.debug("CSRF token was rejected, logging in again.")
+            csrf_token = await self.get_cached_csrf_token(stale_token=csrf_token)
+            response = await self.CLIENT.request("POST", self.WIKI_API_URL, retry=False,
+                                                 data={**data, 'token': csrf_token})
+            response_data = response.json()
+
+        return response_data
+
+    async def write_summary(self, item_id, summary_text, generated_by, statement_id=None,
+                            property_id=WIKI_PID_FOR_SUMMARY, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Writes a summary statement including its "generated by" qualifier with a single
+        wbeditentity request, see WikiHelper.write_summary.
+
+        Returns:
+            bool: True if the edit was successful.
+        """
+        return await self.write_summaries(item_id, {property_id: (summary_text, statement_id)}, generated_by,
+                                          language=language)
+
+    async def write_summaries(self, item_id, summaries, generated_by, language=WIKI_SUMMARY_LANGUAGE):
+        """
+        Writes several summary statements with a single wbeditentity request, see WikiHelper.write_summaries.
+
+        Returns:
+            bool: True if the edit was successful.
+        """
+        try:
+            response_data = await self.post_with_csrf_token(self.build_summaries_edit_data(
+                item_id, summaries, generated_by, language=language))
+        except Exception as e:
+            logging.error(f"Writing the summary of {item_id} failed: {str(e)}")
+            await asyncio.to_thread(self.update_entity_cache, item_id, {})
+            return False
+
+        await asyncio.to_thread(self.update_entity_cache, item_id, response_data)
+        if response_data.get('success') == 1:
+            return True
+
+        logging.error(f"Writing the summary of {item_id} failed: {json.dumps(response_data.get('error'))}")
+        return False
+
+    async def get_entities(self, item_ids, props='claims'):
+        """
+        Retrieves several entities with as few wbgetentities requests as possible, using the entity
+        cache if enabled, see WikiHelper.get_entities. The cache is accessed in a thread, since it
+        may be stored on disk.
+
+        Args:
+            item_ids (list): The IDs of the items.
+            props (str): The entity parts to retrieve, e.g. "claims" or "claims|info".
+
+        Returns:
+            dict: The entities by item ID. Missing items are not included.
+        """
+        if not self.uses_entity_cache(props):
+            return await self.fetch_entities(item_ids, props)
+
+        entities, stale_entries, missing_item_ids = await asyncio.to_thread(self.get_cached_entities, item_ids)
+        if stale_entries:
+            revisions = await self.fetch_entities(list(stale_entries), props='info')
+            missing_item_ids += await asyncio.to_thread(self.revalidate_cached_entities,
+                                                        entities, stale_entries, revisions)
+        if missing_item_ids:
+            fetched = await self.fetch_entities(missing_item_ids, props='info|claims')
+            entities.update(await asyncio.to_thread(self.cache_entities, fetched))
+        return entities
+
+    async def fetch_entities(self, item_ids, props='claims'):
+        """
+        Retrieves several entities with concurrent wbgetentities requests, without entity cache.
+
+        Args:
+            item_ids (list): The IDs of the items.
+            props (str): The entity parts to retrieve.
+
+        Returns:
+            dict: The entities by item ID. Missing items are not included.
+
+        Raises:
+            Exception: If a request fails, see WikiHelper.parse_entities_response.
+        """
+        async def get_chunk(chunk):
+            response = await self.CLIENT.request(
+                "GET",
+                self.WIKI_API_URL,
+                params={
+                    'action': 'wbgetentities',
+                    'ids': '|'.join(chunk),
+                    'props': props,
+                    'format': 'json'
+                }
+            )
+            response.raise_for_status()
+            return self.parse_entities_response(response.json())
+
+        entities = {}
+        for chunk_entities in await asyncio.gather(*map(get_chunk, self.chunk_item_ids(item_ids))):
+            entities.update(chunk_entities)
+        return entities
+
+    async def get_arxivids_for_qids(self, qids):
+        """
+        Returns the arXiv ids and the existing summary statements for several QIDs, see
+        WikiHelper.get_arxivids_for_qids.
+
+        Args:
+            qids (list): The QIDs.
+
+        Returns:
+            dict: The items by QID.
+        """
+        return self.build_summary_items(qids, await self.get_entities(qids, props='claims'))
@@ -0,0 +1,42 @@
+from library.cache_helper import EntityCache
+
+
+CLAIMS = {'P818': [{'id': "Q1$1", 'mainsnak': {'property': "P818", 'datavalue': {'value': "2101.00001"}}}]}
+NEW_CLAIMS = {'P818': [{'id': "Q1$1", 'mainsnak': {'property': "P818", 'datavalue': {'value': "2101.00002"}}}]}
+
+
+def test_entity_cache_sees_writes_of_other_processes(tmp_path):
+    db_path = str(tmp_path / "entities.sqlite3")
+    first = EntityCache(ttl_seconds=60, db_path=db_path)
+    second = EntityCache(ttl_seconds=60, db_path=db_path)
+    first.put("Q1", CLAIMS, 10)
+    assert second.get("Q1")['lastrevid'] == 10
+
+    # The entry in memory of the second cache is replaced although it is still fresh
+    first.put("Q1", NEW_CLAIMS, 11)
+    entry = second.get("Q1")
+
+    assert entry['fresh']
+    assert (entry['claims'], entry['lastrevid']) == (NEW_CLAIMS, 11)
+
+
+def test_entity_cache_sees_invalidations_of_other_processes(tmp_path):
+    db_path = str(tmp_path / "entities.sqlite3")
+    first = EntityCache(ttl_seconds=60, db_path=db_path)
+    second = EntityCache(ttl_seconds=60, db_path=db_path)
+    first.put("Q1", CLAIMS, 10)
+    second.get("Q1")
+
+    first.invalidate("Q1")
+
+    assert second.get("Q1") is None
+    assert "Q1" not in second.ENTRIES
+
+
+def test_entity_cache_in_memory_only():
+    cache = EntityCache(ttl_seconds=60)
+    cache.put("Q1", CLAIMS, 10)
+
+    assert cache.get("Q1") == {'claims': CLAIMS, 'lastrevid': 10, 'fresh': True}
+    assert cache.get("Q2") is None
+    assert cache.get_stats()['hits'] == 1
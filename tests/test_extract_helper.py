@@ -0,0 +1,104 @@
+import pytest
+
+from benchmark.fixtures import generate_article_html
+from library.extract_helper import (EXTRACTOR_HTML5LIB, EXTRACTOR_LXML, extract_sections, extract_sections_from_chunks,
+                                    extract_text, truncate_sections)
+
+
+# Pages with the markup the extractors have to agree on, besides the generated ar5iv-like pages
+EDGE_CASE_PAGES = [
+    b'<html><body><p>Before<!-- comment -->after</p><script>var x = "<p>no</p>";</script>'
+    b'<style>p {color: red}</style><p>  spaced\r\n text  </p></body></html>',
+    b'<html><body><h1>Title</h1><section><p>Outer</p><section><p>Inner</p></section><p>Outer again</p>'
+    b'</section><p>After</p></body></html>',
+    b'<html><body><p>A formula <math><mi>x</mi></math> without annotation and one '
+    b'<math><semantics><mi>y</mi><annotation encoding="application/x-tex">y^2</annotation>'
+    b'<annotation encoding="application/x-tex">ignored</annotation></semantics></math>.</p></body></html>',
+    # Without a declared charset, lxml and html5lib guess different encodings; ar5iv declares it
+    '<html><head><meta charset="utf-8"></head><body><p>Unicode: Schrödinger, ‖u‖, λ</p></body></html>'.encode("utf-8"),
+]
+
+
+def generated_pages():
+    return [generate_article_html(f"2101.{i:05d}", sections=4, paragraphs=3) for i in range(3)]
+
+
+def split_into_chunks(html, chunk_size):
+    return [html[i:i + chunk_size] for i in range(0, len(html), chunk_size)]
+
+
+@pytest.mark.parametrize("html", generated_pages() + EDGE_CASE_PAGES)
+def test_lxml_matches_html5lib(html):
+    assert extract_sections(html, extractor=EXTRACTOR_LXML) == extract_sections(html, extractor=EXTRACTOR_HTML5LIB)
+    assert extract_text(html, extractor=EXTRACTOR_LXML) == extract_text(html, extractor=EXTRACTOR_HTML5LIB)
+
+
+def test_sections_are_split_at_section_elements():
+    sections = extract_sections(EDGE_CASE_PAGES[1])
+
+    assert sections == ["Title", "Outer", "Inner", "Outer again", "After"]
+
+
+def test_math_is_replaced_by_latex():
+    text = extract_text(EDGE_CASE_PAGES[2])
+
+    assert text == "A formula without annotation and one $y^2$ ."
+
+
+# Chunk sizes of 7 and 1001 bytes split tags, entities and multi-byte characters
+@pytest.mark.parametrize("chunk_size", [7, 1001, 65536])
+def test_chunked_feeding_matches_whole_page(chunk_size):
+    for html in generated_pages() + EDGE_CASE_PAGES:
+        sections, truncated = extract_sections_from_chunks(split_into_chunks(html, chunk_size))
+
+        assert sections == extract_sections(html, extractor=EXTRACTOR_HTML5LIB)
+        assert not truncated
+
+
+@pytest.mark.parametrize("max_chars", [1, 100, 2500])
+@pytest.mark.parametrize("extractor", [EXTRACTOR_LXML, EXTRACTOR_HTML5LIB])
+def test_char_budget_cuts_off_text(extractor, max_chars):
+    html = generated_pages()[0]
+    full_text = extract_text(html, extractor=EXTRACTOR_HTML5LIB)
+
+    sections, truncated = extract_sections_from_chunks(split_into_chunks(html, 1024), max_chars=max_chars,
+                                                       extractor=extractor)
+
+    assert truncated
+    assert ' '.join(sections) == full_text[:max_chars]
+
+
+def test_char_budget_stops_reading_chunks():
+    html = generated_pages()[0]
+    chunks = split_into_chunks(html, 1024)
+    read = []
+
+    def iterate_chunks():
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    extract_sections_from_chunks(iterate_chunks(), max_chars=100)
+
+    assert len(read) < len(chunks)
+
+
+def test_char_budget_larger_than_text():
+    html = EDGE_CASE_PAGES[1]
+
+    sections, truncated = extract_sections_from_chunks([html], max_chars=10000)
+
+    assert sections == extract_sections(html)
+    assert not truncated
+
+
+def test_truncate_sections_counts_separators():
+    assert truncate_sections(["abc", "def"], max_chars=5) == (["abc", "d"], True)
+    assert truncate_sections(["abc", "def"], max_chars=4) == (["abc"], True)
+    assert truncate_sections(["abc", "def"], max_chars=8) == (["abc", "def"], False)
+    assert truncate_sections(["abc", "def"]) == (["abc", "def"], False)
+
+
+def test_unknown_extractor():
+    with pytest.raises(ValueError):
+        extract_sections(b"<p>text</p>", extractor="regex")
@@ -0,0 +1,18 @@
+import json
+
+from library.http_helper import format_sse_event
+
+
+def test_sse_event_with_type():
+    event = format_sse_event({'summary': "A\nB"}, event="done")
+
+    assert event == 'event: done\ndata: {"summary": "A\\nB"}\n\n'
+
+
+def test_sse_event_data_stays_on_one_line():
+    event = format_sse_event({'text': "line 1\nline 2\r\n", 'n': 1})
+
+    lines = event.split("\n")
+    assert lines[0].startswith("data: ")
+    assert lines[1:] == ["", ""]
+    assert json.loads(lines[0][len("data: "):]) == {'text': "line 1\nline 2\r\n", 'n': 1}
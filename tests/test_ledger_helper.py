@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from library.job_helper import JOB_STATUS_DONE, JOB_STATUS_FAILED, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING
+from library.ledger_helper import SQLiteWorkLedger
+from library.scheduler_helper import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return SQLiteWorkLedger(db_path=str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+
+
+def expire_leases():
+    # Leases are compared with the wall clock
+    time.sleep(0.01)
+
+
+def test_concurrent_claimers_never_share_a_job(ledger):
+    job_ids = {ledger.enqueue(f"Q{i}", "run_summary_job", [f"Q{i}"], {})[0]['id'] for i in range(60)}
+    claimed = []
+    lock = threading.Lock()
+
+    def claim_all(worker_id):
+        while (job := ledger.claim(worker_id)) is not None:
+            with lock:
+                claimed.append(job['id'])
+
+    threads = [threading.Thread(target=claim_all, args=(f"worker-{i}",)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+    assert ledger.get_counts() == {JOB_STATUS_RUNNING: 60}
+
+
+def test_expired_lease_is_reclaimed(ledger):
+    job, _ = ledger.enqueue("Q1", "run_summary_job", ["Q1"], {'write': True})
+    assert ledger.claim("worker-a", lease_seconds=0)['id'] == job['id']
+    expire_leases()
+
+    reclaimed = ledger.claim("worker-b")
+
+    assert reclaimed['id'] == job['id']
+    assert reclaimed['worker'] == "worker-b"
+    assert reclaimed['attempts'] == 2
+    assert (reclaimed['args'], reclaimed['kwargs']) == (["Q1"], {'write': True})
+    # The first worker lost the job and cannot finish it anymore
+    assert not ledger.finish(job['id'], "worker-a", JOB_STATUS_DONE, result={'summary': "stale"})
+    assert ledger.finish(job['id'], "worker-b", JOB_STATUS_DONE, result={'summary': "fresh"})
+    assert ledger.get_job(job['id'])['result'] == {'summary': "fresh"}
+
+
+def test_heartbeat_keeps_the_lease(ledger):
+    job, _ = ledger.enqueue("Q1", "run_summary_job", ["Q1"], {})
+    ledger.claim("worker-a", lease_seconds=0)
+
+    assert ledger.heartbeat("worker-a", lease_seconds=60) == 1
+    expire_leases()
+    assert ledger.claim("worker-b") is None
+
+
+def test_job_fails_after_max_attempts(ledger):
+    job, _ = ledger.enqueue("Q1", "run_summary_job", ["Q1"], {})
+    for worker_id in ("worker-a", "worker-b"):
+        assert ledger.claim(worker_id, lease_seconds=0)['id'] == job['id']
+        expire_leases()
+
+    assert ledger.claim("worker-c") is None
+    failed = ledger.get_job(job['id'])
+    assert failed['status'] == JOB_STATUS_FAILED
+    assert failed['error'] == "Lease expired 2 times"
+
+
+def test_duplicate_active_key_returns_existing_job(ledger):
+    job, created = ledger.enqueue("Q1", "run_summary_job", ["Q1"], {})
+    duplicate, duplicate_created = ledger.enqueue("Q1", "run_summary_job", ["Q1"], {'force': True})
+
+    assert created and not duplicate_created
+    assert duplicate['id'] == job['id']
+
+    # Running jobs are coalesced as well, finished ones are not
+    ledger.claim("worker-a")
+    assert ledger.enqueue("Q1", "run_summary_job", ["Q1"], {})[0]['id'] == job['id']
+    ledger.finish(job['id'], "worker-a", JOB_STATUS_DONE, result={})
+    new_job, new_created = ledger.enqueue("Q1", "run_summary_job", ["Q1"], {})
+    assert new_created
+    assert new_job['id'] != job['id']
+    assert new_job['status'] == JOB_STATUS_QUEUED
+
+
+def test_priorities_and_queue_limit(ledger):
+    ledger.enqueue("Q1", "run_summary_job", ["Q1"], {}, priority=PRIORITY_BULK)
+    ledger.enqueue("Q2", "run_summary_job", ["Q2"], {}, priority=PRIORITY_INTERACTIVE)
+
+    with pytest.raises(queue.Full):
+        ledger.enqueue("Q3", "run_summary_job", ["Q3"], {}, priority=PRIORITY_BULK, max_queued=1)
+    assert ledger.claim("worker-a", priorities=[PRIORITY_INTERACTIVE, PRIORITY_BULK])['key'] == "Q2"
+    assert ledger.claim("worker-a", priorities=[PRIORITY_INTERACTIVE, PRIORITY_BULK])['key'] == "Q1"
+    assert ledger.get_counts(PRIORITY_BULK) == {JOB_STATUS_RUNNING: 1}
@@ -0,0 +1,119 @@
+import pytest
+import requests
+
+from benchmark.stub_llm_server import start_stub_llm_server
+from library.cache_helper import LLMResponseCache
+from library.llm_helper import LLMHelper, LLMError, PROMPT_CHUNK_SUMMARY, PROMPT_REDUCE
+
+
+class ScriptedLLMHelper(LLMHelper):
+    """
+    LLMHelper whose LLM answers with a function of the prompt, which may raise to simulate a failed request.
+    """
+
+    def __init__(self, answer, **kwargs):
+        super().__init__(**kwargs)
+        self.ANSWER = answer
+        self.PROMPTS = []
+
+    def stream_from_backends(self, question, model="llama3.2:latest", options=None, previous=None, result=None):
+        self.PROMPTS.append(question)
+        yield self.ANSWER(question)
+
+
+def fail(message):
+    raise requests.exceptions.ConnectionError(message)
+
+
+def test_summary_starting_with_error_is_kept():
+    llm = ScriptedLLMHelper(lambda question: "Error bounds for the heat equation are derived.")
+
+    assert llm.summarize_article("An article.") == "Error bounds for the heat equation are derived."
+    assert llm.summarize_article_single_pass("An article.") == "Error bounds for the heat equation are derived."
+
+
+def test_empty_single_pass_summary_raises_and_is_not_cached(tmp_path):
+    # The response of the stop sequence ["\n\n"] is empty if the summary starts with a blank line
+    cache = LLMResponseCache(db_path=str(tmp_path / "responses.sqlite3"))
+    llm = ScriptedLLMHelper(lambda question: " \n", response_cache=cache)
+
+    with pytest.raises(LLMError, match="Empty"):
+        llm.summarize_article_single_pass("An article.")
+    with pytest.raises(LLMError):
+        list(llm.summarize_article_stream("An article.", single_pass=True))
+
+    llm.ANSWER = lambda question: "The operator is bounded.\n"
+    assert llm.summarize_article_single_pass("An article.") == "The operator is bounded."
+    assert len(llm.PROMPTS) == 3
+
+
+def test_failed_request_raises():
+    llm = ScriptedLLMHelper(lambda question: fail("connection refused"))
+
+    with pytest.raises(LLMError):
+        llm.ask_llm("A question.")
+
+
+def test_failed_first_pass_stops_summary():
+    llm = ScriptedLLMHelper(lambda question: fail("connection refused"))
+
+    with pytest.raises(LLMError):
+        llm.summarize_article("An article.")
+    assert len(llm.PROMPTS) == 1
+
+
+def test_failed_chunks_are_left_out_of_reduce():
+    def answer(question):
+        if question.startswith(PROMPT_REDUCE):
+            return "Final summary."
+        if "broken" in question:
+            fail("timeout")
+        return "Error-correcting codes are studied."
+
+    # Every section is a chunk of its own
+    llm = ScriptedLLMHelper(answer, chunk_tokens=6)
+
+    assert llm.summarize_article_chunked(["A good section here.", "A broken section here."]) == "Final summary."
+    reduce_prompt = [prompt for prompt in llm.PROMPTS if prompt.startswith(PROMPT_REDUCE)][0]
+    assert reduce_prompt.endswith("Error-correcting codes are studied.")
+    assert reduce_prompt.count("Error-correcting codes") == 1
+
+
+def test_all_chunks_failed_raises():
+    llm = ScriptedLLMHelper(lambda question: fail("timeout"), chunk_tokens=5)
+
+    with pytest.raises(LLMError):
+        llm.summarize_article_chunked(["A broken section.", "Another broken section."])
+    assert not any(prompt.startswith(PROMPT_REDUCE) for prompt in llm.PROMPTS)
+
+
+def test_follow_up_falls_back_to_standalone_question():
+    def answer(question):
+        if question == "Continue.":
+            fail("context lost")
+        return "Standalone answer."
+
+    llm = ScriptedLLMHelper(answer)
+
+    assert llm.ask_llm_follow_up("Continue.", {"context": [1]}, "Standalone question.") == "Standalone answer."
+
+
+def test_summary_with_stub_server():
+    server, url = start_stub_llm_server(token_delay=0, prefill_delay_per_1k_chars=0)
+    try:
+        llm = LLMHelper(llm_api_url=url)
+        result = {}
+
+        summary = llm.summarize_article("Error bounds are proven. The method converges.", result=result)
+
+        assert summary.startswith("This article")
+        assert result['backend'] == url
+    finally:
+        server.shutdown()
+
+
+def test_unreachable_llm_raises():
+    llm = LLMHelper(llm_api_url="http://127.0.0.1:9/api/generate", http_options={"retries": 0})
+
+    with pytest.raises(LLMError):
+        llm.ask_llm("A question.", model=llm.LLM_TO_USE)
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from benchmark.stub_llm_server import start_stub_llm_server
+from library.llm_helper import LLMError, LLMHelper
+from library.llm_pool_helper import LLMBackend, LLMBackendPool
+
+
+def create_pool(*backends, cooldown_seconds=30):
+    # Without health checks, only the requests change the state of the backends
+    return LLMBackendPool(list(backends), cooldown_seconds=cooldown_seconds, health_check_interval=0)
+
+
+def test_weighted_least_loaded_selection():
+    heavy = LLMBackend("http://gpu1/api/generate", weight=2, max_concurrency=10)
+    light = LLMBackend("http://gpu2/api/generate", weight=1, max_concurrency=10)
+    pool = create_pool(heavy, light)
+
+    acquired = [pool.acquire() for _ in range(6)]
+
+    assert acquired.count(heavy) == 4
+    assert acquired.count(light) == 2
+
+    # A backend with free slots relative to its weight is chosen next
+    pool.release(heavy)
+    pool.release(heavy)
+    assert pool.acquire() is heavy
+
+
+def test_concurrency_cap_waits_for_a_free_slot():
+    backend = LLMBackend("http://gpu1/api/generate", max_concurrency=1)
+    pool = create_pool(backend)
+    assert pool.acquire() is backend
+    acquired = []
+
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert not acquired
+    assert backend.in_flight == 1
+
+    pool.release(backend, latency=0.1, eval_count=5)
+    waiter.join(timeout=5)
+
+    assert acquired == [backend]
+    assert backend.in_flight == 1
+    assert backend.get_stats()['tokens'] == 5
+
+
+def test_cooldown_after_failure():
+    first = LLMBackend("http://gpu1/api/generate")
+    second = LLMBackend("http://gpu2/api/generate")
+    pool = create_pool(first, second, cooldown_seconds=0.1)
+
+    pool.release(pool.acquire(), error=Exception("Connection refused"))
+
+    assert not first.healthy
+    assert [pool.acquire() for _ in range(3)] == [second] * 3
+    # Without another backend, no request waits for the cooldown
+    assert pool.acquire(exclude=[second]) is None
+
+    time.sleep(0.1)
+    assert pool.acquire(exclude=[second]) is first
+    pool.release(first)
+    assert first.healthy
+
+
+def test_client_error_keeps_backend_in_rotation():
+    backend = LLMBackend("http://gpu1/api/generate")
+    pool = create_pool(backend)
+
+    pool.release(pool.acquire(), error=Exception("model not found"), mark_unhealthy=False)
+
+    assert backend.healthy
+    assert backend.failures == 1
+    assert pool.acquire() is backend
+
+
+def test_prefer_backend_with_free_slot():
+    first = LLMBackend("http://gpu1/api/generate", max_concurrency=2)
+    second = LLMBackend("http://gpu2/api/generate", max_concurrency=2)
+    pool = create_pool(first, second)
+    pool.acquire(prefer=second.URL)
+
+    # The preferred backend wins over the less loaded one until it is full
+    assert pool.acquire(prefer=second.URL) is second
+    assert pool.acquire(prefer=second.URL) is first
+    assert pool.acquire(prefer="http://unknown/api/generate") is first
+
+
+@pytest.fixture
+def stub_urls():
+    servers = [start_stub_llm_server(token_delay=0, prefill_delay_per_1k_chars=0) for _ in range(2)]
+    yield [url for _, url in servers]
+    for server, _ in servers:
+        server.shutdown()
+
+
+def test_requests_only_go_to_backends_of_the_model(stub_urls):
+    llama_url, mistral_url = stub_urls
+    pool = create_pool(LLMBackend(llama_url, model="llama3.2:latest", weight=10),
+                       LLMBackend(mistral_url, model="mistral:latest"))
+    llm = LLMHelper(backend_pool=pool, http_options={'retries': 0})
+
+    for _ in range(3):
+        result = {}
+        llm.ask_llm("Summarize: The operator is bounded.", model="mistral:latest", result=result)
+        assert result['backend'] == mistral_url
+
+    with pytest.raises(LLMError):
+        llm.ask_llm("Summarize: The operator is bounded.", model="gemma:latest")
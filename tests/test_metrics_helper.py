@@ -0,0 +1,53 @@
+import pytest
+
+from library.metrics_helper import METRICS_PREFIX, STAGE_FETCH, MetricsHelper, format_labels, format_value
+
+
+def get_samples(metrics):
+    return dict(line.rsplit(" ", 1) for line in metrics.render().splitlines() if not line.startswith("#"))
+
+
+def test_labels_and_values_are_escaped():
+    assert format_labels(()) == ""
+    assert format_labels((("stage", "fetch"), ("path", 'C:\\a "b"\nc'))) == \
+        '{stage="fetch",path="C:\\\\a \\"b\\"\\nc"}'
+    assert format_value(float("inf")) == "+Inf"
+    assert format_value(0.25) == "0.25"
+    assert format_value(3) == "3"
+
+
+def test_stage_histogram_exposition():
+    metrics = MetricsHelper()
+    metrics.observe_stage(STAGE_FETCH, 0.2)
+    metrics.observe_stage(STAGE_FETCH, 7)
+
+    text = metrics.render()
+    samples = get_samples(metrics)
+    name = METRICS_PREFIX + "stage_duration_seconds"
+
+    assert f"# TYPE {name} histogram" in text
+    assert samples[f'{name}_bucket{{stage="fetch",le="0.1"}}'] == "0"
+    assert samples[f'{name}_bucket{{stage="fetch",le="0.25"}}'] == "1"
+    assert samples[f'{name}_bucket{{stage="fetch",le="10.0"}}'] == "2"
+    assert samples[f'{name}_bucket{{stage="fetch",le="+Inf"}}'] == "2"
+    assert float(samples[f'{name}_sum{{stage="fetch"}}']) == pytest.approx(7.2)
+    assert samples[f'{name}_count{{stage="fetch"}}'] == "2"
+    assert text.endswith("\n")
+
+
+def test_failed_stage_and_cache_hit_ratio():
+    metrics = MetricsHelper()
+    with pytest.raises(ValueError):
+        with metrics.time_stage(STAGE_FETCH):
+            raise ValueError("Not found")
+    for hit in (True, True, False, True):
+        metrics.observe_cache("article", hit)
+
+    samples = get_samples(metrics)
+
+    assert samples[f'{METRICS_PREFIX}stage_errors_total{{stage="fetch"}}'] == "1"
+    assert samples[f'{METRICS_PREFIX}stage_in_flight{{stage="fetch"}}'] == "0"
+    assert samples[f'{METRICS_PREFIX}cache_requests_total{{cache="article",result="miss"}}'] == "1"
+    assert samples[f'{METRICS_PREFIX}cache_hit_ratio{{cache="article"}}'] == "0.75"
+    # Metrics without samples are left out
+    assert not any(name.startswith(f"{METRICS_PREFIX}jobs") for name in samples)
@@ -0,0 +1,63 @@
+import pytest
+
+from benchmark.mock_servers import MockAr5ivServer, start_server
+from library.cache_helper import ArticleCache
+from library.other_helper import OtherHelper
+from library.source_helper import SOURCE_AR5IV, SOURCE_ARXIV_HTML
+
+
+ARXIV_ID = "2101.00001"
+
+
+@pytest.fixture
+def servers():
+    # Both servers generate the same page, and the same ETag, for an arXiv id
+    ar5iv = MockAr5ivServer(("127.0.0.1", 0), latency=0, sections=2, paragraphs=1)
+    arxiv = MockAr5ivServer(("127.0.0.1", 0), latency=0, sections=2, paragraphs=1)
+    urls = {SOURCE_AR5IV: start_server(ar5iv) + "/html/", SOURCE_ARXIV_HTML: start_server(arxiv) + "/html/"}
+    yield ar5iv, arxiv, urls
+    ar5iv.shutdown()
+    arxiv.shutdown()
+
+
+def create_helper(tmp_path, urls):
+    # Every entry is expired right away and revalidated by the next request
+    cache = ArticleCache(db_path=str(tmp_path / "articles.sqlite3"), ttl_seconds=0)
+    return OtherHelper(cache=cache, sources=[(SOURCE_AR5IV, urls[SOURCE_AR5IV]),
+                                             (SOURCE_ARXIV_HTML, urls[SOURCE_ARXIV_HTML])])
+
+
+def test_cache_records_source(tmp_path, servers):
+    ar5iv, _, urls = servers
+    ar5iv.FAILING_IDS.add(ARXIV_ID)
+    helper = create_helper(tmp_path, urls)
+
+    sections = helper.get_sections_for_arxiv_id(ARXIV_ID)
+
+    cached = helper.CACHE.get(ARXIV_ID)
+    assert cached['source'] == SOURCE_ARXIV_HTML
+    assert cached['sections'] == sections
+    assert cached['etag']
+
+
+def test_conditional_request_only_to_cached_source(tmp_path, servers):
+    ar5iv, _, urls = servers
+    helper = create_helper(tmp_path, urls)
+    helper.get_sections_for_arxiv_id(ARXIV_ID)
+    assert helper.CACHE.get(ARXIV_ID)['source'] == SOURCE_AR5IV
+
+    # A 304 from arxiv.org/html must not revalidate the text that came from ar5iv
+    ar5iv.FAILING_IDS.add(ARXIV_ID)
+    helper.get_sections_for_arxiv_id(ARXIV_ID)
+
+    assert helper.CACHE.get(ARXIV_ID)['source'] == SOURCE_ARXIV_HTML
+
+
+def test_conditional_headers_per_source():
+    cached = {'etag': '"abc"', 'last_modified': 'Mon, 04 Jan 2021 00:00:00 GMT', 'source': SOURCE_AR5IV}
+
+    assert OtherHelper.get_conditional_headers(cached, SOURCE_AR5IV) == {
+        'If-None-Match': '"abc"', 'If-Modified-Since': 'Mon, 04 Jan 2021 00:00:00 GMT'}
+    assert OtherHelper.get_conditional_headers(cached, SOURCE_ARXIV_HTML) == {}
+    assert OtherHelper.get_conditional_headers({**cached, 'source': None}, SOURCE_AR5IV) == {}
+    assert OtherHelper.get_conditional_headers(None, SOURCE_AR5IV) == {}
@@ -0,0 +1,36 @@
+import json
+
+from library.llm_helper import AsyncLLMHelper
+from library.other_helper import AsyncOtherHelper
+from library.pipeline_helper import (BatchItemError, format_batch_result, parse_batch_json, parse_batch_line)
+from library.wiki_helper import AsyncWikiHelper
+
+
+def test_batch_json_forms():
+    assert parse_batch_json(["Q1", {"QID": "Q2"}]) == ["Q1", {"QID": "Q2"}]
+    assert parse_batch_json({"QIDs": ["Q1"]}) == ["Q1"]
+    assert parse_batch_json({"QID": "Q1"}) is None
+    assert parse_batch_json(None) is None
+
+
+def test_malformed_batch_lines_become_error_results():
+    assert parse_batch_line(b'"Q1"', 1) == "Q1"
+    assert parse_batch_line(b'{"QID": "Q2"}', 2) == "Q2"
+
+    not_json = parse_batch_line(b'{Q3', 3)
+    no_qid = parse_batch_line(b'[1]', 4)
+
+    assert isinstance(not_json, BatchItemError)
+    assert str(no_qid) == "Line 4 holds no QID: [1]"
+    assert json.loads(format_batch_result(no_qid, None, no_qid)) == {"error": "Line 4 holds no QID: [1]"}
+    assert json.loads(format_batch_result("Q5", None, Exception("Timed out"))) == {"qid": "Q5", "error": "Timed out"}
+    assert json.loads(format_batch_result("Q6", {"qid": "Q6"}, None)) == {"qid": "Q6"}
+
+
+def test_async_helpers_create_no_sync_sessions():
+    helpers = [AsyncLLMHelper(client=None), AsyncOtherHelper(client=None, process_pool=None),
+               AsyncWikiHelper(client=None)]
+
+    for helper in helpers:
+        assert not hasattr(helper, "SESSION")
+    assert not hasattr(helpers[1], "EXECUTOR")
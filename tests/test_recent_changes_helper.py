@@ -0,0 +1,75 @@
+import pytest
+
+from benchmark.mock_servers import MockWikiServer, start_server
+from library.recent_changes_helper import RecentChangesConsumer
+from library.wiki_helper import WIKI_PID_FOR_SUMMARY, WikiHelper
+
+
+SUMMARY_CLAIM = {'mainsnak': {'snaktype': 'value', 'property': WIKI_PID_FOR_SUMMARY,
+                              'datavalue': {'type': 'monolingualtext', 'value': {'text': "A summary", 'language': "en"}}}}
+
+
+@pytest.fixture
+def wiki_server():
+    server = MockWikiServer(("127.0.0.1", 0), latency=0)
+    start_server(server)
+    yield server
+    server.shutdown()
+
+
+def create_consumer(wiki_server, checkpoint_path):
+    wiki = WikiHelper(wiki_api_url=f"http://127.0.0.1:{wiki_server.server_address[1]}/api.php")
+    consumer = RecentChangesConsumer(wiki, "http://service", checkpoint_path=checkpoint_path, rate=1000, batch_size=2)
+    consumer.submitted_batches = []
+
+    def submit(qids):
+        consumer.submitted_batches.append(qids)
+        for qid in qids:
+            consumer.SUBMITTED_QIDS[qid] = True
+        return len(qids)
+
+    consumer.submit = submit
+    return consumer
+
+
+@pytest.fixture
+def consumer(wiki_server, tmp_path):
+    return create_consumer(wiki_server, str(tmp_path / "rc.json"))
+
+
+def test_only_new_arxiv_items_are_submitted(wiki_server, consumer):
+    # Q1 and Q4 have an arXiv id only, Q2 has a summary already and Q3 no arXiv id
+    wiki_server.edit_entity("Q2", {'claims': [SUMMARY_CLAIM]})
+    wiki_server.ENTITIES["Q3"] = {'type': 'item', 'id': "Q3", 'lastrevid': 1, 'claims': {}}
+    for qid in ("Q1", "Q3", "Q1", "Q4"):
+        wiki_server.add_recent_change(qid)
+
+    consumer.run_once()
+
+    assert consumer.submitted_batches == [["Q1", "Q4"]]
+
+
+def test_items_are_submitted_once(wiki_server, consumer):
+    for qid in ("Q1", "Q5", "Q6"):
+        wiki_server.add_recent_change(qid)
+    consumer.run_once()
+
+    # Consumed changes are not read again, and items sent recently are skipped
+    wiki_server.add_recent_change("Q1")
+    wiki_server.add_recent_change("Q7")
+    consumer.run_once()
+
+    assert consumer.submitted_batches == [["Q1", "Q5"], ["Q6"], ["Q7"]]
+    assert consumer.load_checkpoint()['last_rcid'] == 5
+
+
+def test_checkpoint_survives_a_restart(wiki_server, consumer):
+    wiki_server.add_recent_change("Q1")
+    consumer.run_once()
+
+    restarted = create_consumer(wiki_server, consumer.CHECKPOINT_PATH)
+    wiki_server.add_recent_change("Q8")
+    restarted.run_once()
+
+    # The restarted consumer does not remember the sent items, only the position
+    assert restarted.submitted_batches == [["Q8"]]
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from library import scheduler_helper
+from library.scheduler_helper import (PRIORITY_BULK, PRIORITY_INTERACTIVE, FairQueue, FairSemaphore, RateLimiter,
+                                      StrideScheduler)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.001)
+
+
+def test_stride_scheduler_serves_four_interactive_per_bulk():
+    scheduler = StrideScheduler()
+
+    served = [scheduler.choose(["interactive", "bulk"]) for _ in range(50)]
+
+    assert served.count(PRIORITY_INTERACTIVE) == 40
+    assert served.count(PRIORITY_BULK) == 10
+    # The ratio holds in every window, not only on average
+    assert all(served[i:i + 5].count(PRIORITY_BULK) == 1 for i in range(0, 50, 5))
+
+
+def test_stride_scheduler_idle_class_saves_no_credit():
+    scheduler = StrideScheduler()
+    for _ in range(20):
+        scheduler.choose([PRIORITY_INTERACTIVE])
+
+    served = [scheduler.choose([PRIORITY_INTERACTIVE, PRIORITY_BULK]) for _ in range(10)]
+
+    assert served.count(PRIORITY_BULK) == 2
+    assert scheduler.choose([]) is None
+
+
+def test_fair_queue_order_and_limits():
+    fair_queue = FairQueue(max_sizes={PRIORITY_BULK: 10})
+    for i in range(10):
+        fair_queue.put_nowait(("bulk", i), PRIORITY_BULK)
+        fair_queue.put_nowait(("interactive", i), PRIORITY_INTERACTIVE)
+
+    with pytest.raises(queue.Full):
+        fair_queue.put_nowait(("bulk", 10), PRIORITY_BULK)
+    assert fair_queue.qsize() == 20
+
+    items = [fair_queue.get() for _ in range(10)]
+
+    assert [priority_class for _, priority_class in items].count(PRIORITY_BULK) == 2
+    # FIFO within a class
+    assert [item for item, priority_class in items if priority_class == PRIORITY_BULK] == [("bulk", 0), ("bulk", 1)]
+    assert fair_queue.qsize(PRIORITY_INTERACTIVE) == 2
+    # The bulk items take all turns once no interactive item waits
+    rest = [fair_queue.get()[0] for _ in range(10)]
+    assert rest[3:] == [("bulk", i) for i in range(3, 10)]
+    assert fair_queue.qsize() == 0
+
+
+def test_fair_semaphore_grants_four_interactive_per_bulk():
+    semaphore = FairSemaphore(1)
+    semaphore.acquire(PRIORITY_INTERACTIVE)
+    served = []
+    lock = threading.Lock()
+
+    def hold(priority_class):
+        with semaphore.slot(priority_class):
+            with lock:
+                served.append(priority_class)
+
+    threads = [threading.Thread(target=hold, args=(priority_class,))
+               for priority_class in [PRIORITY_INTERACTIVE] * 8 + [PRIORITY_BULK] * 2]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: sum(semaphore.WAITING.values()) == 10)
+
+    semaphore.release()
+    for thread in threads:
+        thread.join()
+
+    assert served[:5].count(PRIORITY_BULK) == 1
+    assert served[5:].count(PRIORITY_BULK) == 1
+    assert semaphore.IN_USE == 0
+
+
+def test_fair_semaphore_free_slot_with_granted_waiter():
+    semaphore = FairSemaphore(2)
+    semaphore.acquire()
+    semaphore.acquire()
+    waiter_done = threading.Event()
+    release_waiter = threading.Event()
+
+    def wait_for_slot():
+        with semaphore.slot(PRIORITY_BULK):
+            release_waiter.wait(5)
+        waiter_done.set()
+
+    thread = threading.Thread(target=wait_for_slot)
+    thread.start()
+    wait_until(lambda: semaphore.WAITING[PRIORITY_BULK] == 1)
+
+    # The waiter cannot wake up while the lock is held: its slot is granted, the other one is free
+    with semaphore.CONDITION:
+        semaphore.release()
+        semaphore.release()
+        assert semaphore.GRANTED[PRIORITY_BULK] == 1
+        semaphore.acquire(PRIORITY_INTERACTIVE)
+        assert semaphore.IN_USE == 2
+
+    release_waiter.set()
+    thread.join()
+    assert waiter_done.is_set()
+    semaphore.release()
+    assert semaphore.IN_USE == 0
+
+
+def test_rate_limiter_burst_and_refill(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler_helper.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=3)
+
+    assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    assert limiter.acquire("b") == 0
+
+    now[0] += 0.5
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == pytest.approx(0.5)
+
+    # Idle clients refill up to the burst only
+    now[0] += 60
+    assert [limiter.acquire("a") for _ in range(4)][-1] > 0
+
+
+def test_rate_limiter_drops_least_recently_seen_clients():
+    limiter = RateLimiter(rate=0.001, burst=1, max_clients=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("a")
+    limiter.acquire("c")
+
+    assert list(limiter.BUCKETS) == ["a", "c"]
+    # A dropped client starts with a full bucket again
+    assert limiter.acquire("b") == 0
@@ -0,0 +1,80 @@
+import pytest
+
+from library.source_helper import (RENDERED_PAGE_PEEK_BYTES, LatencyTracker, SourceFailedError,
+                                   check_rendered_chunks)
+
+
+ARTICLE_URL = "https://ar5iv.labs.arxiv.org/html/2101.00001"
+ARTICLE_HEAD = b'<html><body><article class="ltx_document"><h1>On the spectrum</h1>'
+
+
+def test_hedge_delay_waits_for_enough_samples():
+    tracker = LatencyTracker(min_delay=0.1, max_delay=10, min_samples=5)
+    for _ in range(4):
+        tracker.observe(0.5)
+
+    assert tracker.get_hedge_delay() == 10
+    tracker.observe(0.5)
+    assert tracker.get_hedge_delay() == 0.5
+
+
+def test_hedge_delay_is_the_percentile_within_bounds():
+    tracker = LatencyTracker(percentile=95, min_delay=0.1, max_delay=10, window=100, min_samples=20)
+    for i in range(1, 101):
+        tracker.observe(i / 100)
+
+    assert tracker.get_hedge_delay() == pytest.approx(0.95)
+
+    # The slowest request is beyond max_delay, the fastest below min_delay
+    slow = LatencyTracker(percentile=100, max_delay=10, min_samples=1)
+    slow.observe(60)
+    fast = LatencyTracker(min_delay=1, min_samples=1)
+    fast.observe(0.01)
+    assert (slow.get_hedge_delay(), fast.get_hedge_delay()) == (10, 1)
+
+
+def test_hedge_delay_forgets_old_latencies():
+    tracker = LatencyTracker(percentile=50, min_delay=0, window=3, min_samples=3)
+    for seconds in (5, 5, 5, 1, 1, 1):
+        tracker.observe(seconds)
+
+    assert tracker.get_hedge_delay() == 1
+
+
+def test_rendered_article_chunks_pass_through():
+    chunks = [ARTICLE_HEAD[:10], ARTICLE_HEAD[10:], b"<p>Text</p>" * 10]
+
+    assert list(check_rendered_chunks(chunks, ARTICLE_URL)) == chunks
+
+
+@pytest.mark.parametrize("head, url", [
+    (b'<html><div class="ltx_document">Conversion to HTML had a Fatal error', ARTICLE_URL),
+    (ARTICLE_HEAD + b"This document may be truncated or damaged", ARTICLE_URL),
+    (b"<html><body>Not found</body></html>", ARTICLE_URL),
+    (b"<html><body>Abstract</body></html>", "https://arxiv.org/abs/2101.00001"),
+])
+def test_failure_pages_are_detected(head, url):
+    with pytest.raises(SourceFailedError):
+        list(check_rendered_chunks([head[:5], head[5:]], url))
+
+
+def test_failure_page_detected_before_the_body_is_read():
+    read = []
+
+    def chunks():
+        for i in range(1000):
+            read.append(i)
+            yield b"x" * 1024
+
+    with pytest.raises(SourceFailedError):
+        next(check_rendered_chunks(chunks(), ARTICLE_URL))
+
+    # Only the first RENDERED_PAGE_PEEK_BYTES are read
+    assert len(read) == RENDERED_PAGE_PEEK_BYTES // 1024
+
+
+def test_marker_after_the_peeked_bytes_is_not_found():
+    chunks = [b"x" * RENDERED_PAGE_PEEK_BYTES, ARTICLE_HEAD]
+
+    with pytest.raises(SourceFailedError, match="No rendered article"):
+        list(check_rendered_chunks(chunks, ARTICLE_URL))
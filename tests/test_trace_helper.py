@@ -0,0 +1,80 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from library.trace_helper import TraceHelper, activate, bind_context, get_trace_id, span
+
+
+def get_names(spans):
+    return [(s['name'], get_names(s['children'])) for s in spans]
+
+
+def test_spans_nest_in_the_current_trace():
+    traces = TraceHelper()
+    trace = traces.create_trace("/summary", qid="Q1")
+
+    with activate(trace):
+        with span("wiki"):
+            with span("http", url="http://wiki/api.php") as http_span:
+                http_span['attributes']['status'] = 200
+        with pytest.raises(ValueError):
+            with span("fetch"):
+                raise ValueError("Not found")
+
+    tree = traces.get_trace(trace.ID)
+    assert get_names(tree['spans']) == [("wiki", [("http", [])]), ("fetch", [])]
+    assert tree['spans'][0]['children'][0]['attributes'] == {'url': "http://wiki/api.php", 'status': 200}
+    assert tree['spans'][1]['attributes'] == {'error': "Not found"}
+    assert all(s['duration_ms'] is not None for s in tree['spans'])
+    assert tree['attributes'] == {'qid': "Q1"}
+
+
+def test_no_spans_outside_of_a_trace():
+    with span("wiki") as outside_span:
+        assert get_trace_id() is None
+    assert outside_span == {'attributes': {}}
+
+
+def test_bind_context_carries_the_trace_into_threads():
+    traces = TraceHelper()
+    trace = traces.create_trace("/batch")
+
+    def fetch(i):
+        with span("fetch", item=i):
+            return get_trace_id()
+
+    with activate(trace), span("batch"), ThreadPoolExecutor(max_workers=2) as executor:
+        trace_ids = list(executor.map(bind_context(fetch), range(3)))
+        unbound_trace_ids = list(executor.map(fetch, range(1)))
+
+    assert trace_ids == [trace.ID] * 3
+    assert unbound_trace_ids == [None]
+    tree = traces.get_trace(trace.ID)
+    assert get_names(tree['spans']) == [("batch", [("fetch", [])] * 3)]
+
+
+def test_tasks_record_spans_under_their_parent():
+    traces = TraceHelper()
+    trace = traces.create_trace("/summary")
+
+    async def run():
+        async def fetch(source):
+            with span("fetch", source=source):
+                await asyncio.sleep(0)
+
+        with activate(trace), span("article"):
+            await asyncio.gather(fetch("ar5iv"), fetch("arxiv"))
+
+    asyncio.run(run())
+
+    tree = traces.get_trace(trace.ID)
+    assert get_names(tree['spans']) == [("article", [("fetch", []), ("fetch", [])])]
+
+
+def test_oldest_traces_are_dropped():
+    traces = TraceHelper(max_traces=2)
+    first, second, third = (traces.create_trace(f"/summary/{i}") for i in range(3))
+
+    assert traces.get_trace(first.ID) is None
+    assert traces.get_trace(third.ID)['name'] == "/summary/2"
@@ -0,0 +1,44 @@
+import pytest
+import requests
+
+from benchmark.mock_servers import MockAr5ivServer, MockWikiServer, start_server
+from library.cache_helper import EntityCache
+from library.wiki_helper import WikiHelper
+
+
+@pytest.fixture
+def wiki_url():
+    server = MockWikiServer(("127.0.0.1", 0), latency=0)
+    yield start_server(server) + "/api.php"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("entity_cache", [None, EntityCache()])
+def test_lowercase_qids_are_resolved(wiki_url, entity_cache):
+    wiki = WikiHelper(wiki_api_url=wiki_url, entity_cache=entity_cache)
+
+    items = wiki.get_arxivids_for_qids(["q12", " Q13 ", "Q12"])
+
+    assert items["q12"]['arxiv_id'] == "2101.00012"
+    assert items[" Q13 "]['arxiv_id'] == "2101.00013"
+    assert items["Q12"]['arxiv_id'] == "2101.00012"
+
+
+def test_chunk_item_ids_normalizes_and_drops_invalid_ids():
+    assert WikiHelper.chunk_item_ids(["q1", "Q1", "Q2", "P31", "Q0", "", None]) == [["Q1", "Q2"]]
+
+
+def test_api_error_raises():
+    with pytest.raises(Exception, match="wbgetentities failed"):
+        WikiHelper.parse_entities_response({'error': {'code': 'maxlag', 'info': "Waiting for a database server"}})
+
+
+def test_http_error_raises():
+    # The article server answers every request outside /html/ with a 404
+    server = MockAr5ivServer(("127.0.0.1", 0), latency=0)
+    wiki = WikiHelper(wiki_api_url=start_server(server) + "/api.php")
+    try:
+        with pytest.raises(requests.exceptions.HTTPError):
+            wiki.get_arxivids_for_qids(["Q12"])
+    finally:
+        server.shutdown()